@@ -33,6 +33,12 @@ from loguru import logger
 import matplotlib.pyplot as plt
 import scipy.integrate
 import numpy as np
+import click
+import sys
+
+# The runner of the jobs is shared with the analysis of MOS v2
+sys.path.append(str(Path(__file__).resolve().parents[1] / "MOS v2"))
+from parallel_jobs import run_jobs
 
 _COMPOUNDS = ["BUT", "CH4", "CO2"]
 _CONCENTRATIONS = ["75", "131", "130", "303"]
@@ -868,8 +874,43 @@ def extract_square_tr_features(data, plot=False):
     return features_df
 
 
-def extract_features():
-    complete_features_df = pd.DataFrame(columns=["Compound", "Concentration"])
+def extract_file_features(csv_file: Path, compound, conc):
+    """
+    Return the features of each temperature modulation pattern of a recording.
+    """
+    tmp_data = pd.read_csv(csv_file, header=6)
+    tmp_data["Seconds"] = [x * _SAMPLE_RATE for x in range(len(tmp_data))]
+    # Get temperature modulation patterns
+    temperature_modulation_patterns = tmp_data["Temperature Modulation"].unique()
+    features_list = []
+    """
+    if "Ramp" in temperature_modulation_patterns:
+        features_list.append(extract_ramp_feature(tmp_data, plot=False))
+    """
+    if "Square" in temperature_modulation_patterns:
+        features_list.append(extract_square_feature(tmp_data, plot=False))
+    if "Sine" in temperature_modulation_patterns:
+        features_list.append(extract_sine_features(tmp_data, plot=False))
+    if "Sq+Tr" in temperature_modulation_patterns:
+        features_list.append(extract_square_tr_features(tmp_data, plot=False))
+    if "Triangle" in temperature_modulation_patterns:
+        features_list.append(extract_triangle_features(tmp_data, plot=False))
+    for features_df in features_list:
+        features_df.insert(0, "Compound", compound)
+        features_df.insert(1, "Concentration", conc)
+    return features_list
+
+
+@click.command()
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of recordings processed in parallel.",
+)
+def extract_features(jobs):
+    extraction_jobs = []
     for compound in _COMPOUNDS:
         # For each compound
         for conc in _CONCENTRATIONS:
@@ -884,57 +925,26 @@ def extract_features():
                         and "notprecise" not in csv_file.name
                     ):
                         # If we have a CSV file
-                        tmp_data = pd.read_csv(csv_file, header=6)
-                        tmp_data["Seconds"] = [
-                            x * _SAMPLE_RATE for x in range(len(tmp_data))
-                        ]
-                        # Get temperature modulation patterns
-                        temperature_modulation_patterns = tmp_data[
-                            "Temperature Modulation"
-                        ].unique()
-                        """
-                        if "Ramp" in temperature_modulation_patterns:
-                            ramp_features = extract_ramp_feature(tmp_data, plot=False)
-                            ramp_features["Compound"] = compound
-                            ramp_features["Concentration"] = conc
-                            complete_features_df = pd.concat(
-                                [complete_features_df, ramp_features]
-                            ).reset_index(drop=True)
-                        """
-                        if "Square" in temperature_modulation_patterns:
-                            square_features = extract_square_feature(
-                                tmp_data, plot=False
-                            )
-                            square_features["Compound"] = compound
-                            square_features["Concentration"] = conc
-                            complete_features_df = pd.concat(
-                                [complete_features_df, square_features]
-                            ).reset_index(drop=True)
-                        if "Sine" in temperature_modulation_patterns:
-                            sine_features = extract_sine_features(tmp_data, plot=False)
-                            sine_features["Compound"] = compound
-                            sine_features["Concentration"] = conc
-                            complete_features_df = pd.concat(
-                                [complete_features_df, sine_features]
-                            ).reset_index(drop=True)
-                        if "Sq+Tr" in temperature_modulation_patterns:
-                            sq_tr_features = extract_square_tr_features(
-                                tmp_data, plot=False
-                            )
-                            sq_tr_features["Compound"] = compound
-                            sq_tr_features["Concentration"] = conc
-                            complete_features_df = pd.concat(
-                                [complete_features_df, sq_tr_features]
-                            ).reset_index(drop=True)
-                        if "Triangle" in temperature_modulation_patterns:
-                            triangle_features = extract_triangle_features(
-                                tmp_data, plot=False
-                            )
-                            triangle_features["Compound"] = compound
-                            triangle_features["Concentration"] = conc
-                            complete_features_df = pd.concat(
-                                [complete_features_df, triangle_features]
-                            ).reset_index(drop=True)
+                        extraction_jobs.append((csv_file, compound, conc))
+
+    # Extract the features, in worker processes if requested, and join them once
+    features_list = []
+    n_failed = 0
+    for job, file_features, error in run_jobs(
+        extract_file_features, extraction_jobs, jobs
+    ):
+        if error is not None:
+            n_failed += 1
+            logger.error(f"Could not extract features from {job[0]}: {error}")
+            continue
+        logger.debug(f"Extracted features from {job[0]}")
+        features_list.extend(file_features)
+    if n_failed:
+        logger.warning(f"{n_failed} recordings failed, their features are missing")
+    if features_list:
+        complete_features_df = pd.concat(features_list, ignore_index=True)
+    else:
+        complete_features_df = pd.DataFrame(columns=["Compound", "Concentration"])
     complete_features_df.to_csv("complete_features.csv")
 
 
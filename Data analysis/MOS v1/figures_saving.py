@@ -4,16 +4,23 @@ them in the preferred location.
 Just run the script with a path as a parameter, that is the folder where
 you want to save the figures. If this directory does not exist, 
 the script will try to create it.
+Figures are rendered with the raster renderer of MOS v2, that is much faster
+than matplotlib for batch exports; matplotlib can still be used with
+--renderer matplotlib.
 """
 
+import sys
 from pathlib import Path
 from sys import argv
 
-import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 import click
 
+# The raster renderer and the loader are shared with the analysis of MOS v2
+sys.path.append(str(Path(__file__).resolve().parents[1] / "MOS v2"))
+from raster_figures import Panel, save_atlas, save_figure, save_matplotlib_figure
+from recordings import read_recording
+
 _DEFAULT_DATA_DIR = Path(
     "C:/Users/resca/OneDrive - Politecnico di Milano/_Dottorato/6 - Tesisti/2021_2022_Tasso/_Data"
 )
@@ -23,6 +30,28 @@ concentrations = ["75", "131", "130", "303"]
 sensor_labels = ["S-1", "S-2", "S-3", "S-4", "S-5", "S-6", "S-7", "S-8"]
 
 
+def build_panels(tmp_data, title):
+    """Return the panels of the figure of a recording."""
+    sensors = Panel(title=title, xlabel="Seconds", legend=True)
+    for sensor_label in sensor_labels:
+        sensors.plot(tmp_data["Seconds"], tmp_data[sensor_label], label=sensor_label)
+    environment = Panel(
+        xlabel="Seconds",
+        ylabel="Temperature [°C]",
+        twin_ylabel="Humidity [%]",
+        legend=True,
+    )
+    environment.plot(tmp_data["Seconds"], tmp_data["Temperature"], label="Temperature")
+    environment.plot(
+        tmp_data["Seconds"],
+        tmp_data["Humidity"],
+        color="orange",
+        label="Humidity",
+        twin=True,
+    )
+    return [sensors, environment]
+
+
 @click.command()
 @click.option(
     "--data_dir", default=_DEFAULT_DATA_DIR, help="Folder containing raw data."
@@ -30,7 +59,18 @@ sensor_labels = ["S-1", "S-2", "S-3", "S-4", "S-5", "S-6", "S-7", "S-8"]
 @click.option(
     "--output_dir", default="_figures", help="Folder where figures will be stored."
 )
-def create_figures(data_dir, output_dir):
+@click.option(
+    "--renderer",
+    type=click.Choice(["raster", "matplotlib"]),
+    default="raster",
+    help="Library used to render the figures.",
+)
+@click.option(
+    "--atlas",
+    is_flag=True,
+    help="Also tile the figures of each folder in a single atlas image.",
+)
+def create_figures(data_dir, output_dir, renderer, atlas):
     """Create figures of data collected with temperature modulation electronic nose."""
     try:
         output_dir = Path(output_dir)
@@ -47,56 +87,47 @@ def create_figures(data_dir, output_dir):
             folder = data_dir / f"{compound}_{conc}ppm"
             if folder.exists():
                 print(f"{compound}-{conc}")
+                figures = []
                 for csv_file in folder.iterdir():
                     if csv_file.is_file() and "csv" in csv_file.name:
                         # Get temperature modulation from file name
                         temperature_m = csv_file.name.split("_")[-1][:-4]
-                        tmp_data = pd.read_csv(csv_file, header=6)
-                        tmp_data["Seconds"] = [x * 0.1 for x in range(len(tmp_data))]
+                        tmp_data = read_recording(
+                            csv_file,
+                            columns=sensor_labels
+                            + ["Temperature", "Humidity", "Temperature Modulation"],
+                            sample_rate=0.1,
+                        )
 
-                        temp_options = tmp_data["Temperature Modulation"].unique()
+                        # The labels are categorical, titles show them as an
+                        # array of strings
+                        temp_options = np.asarray(
+                            tmp_data["Temperature Modulation"].unique()
+                        )
                         if len(temp_options) == 1:
                             temperature_m_value = temp_options[0]
                         else:
                             temperature_m_value = temp_options[1]
 
-                        fig, ax = plt.subplots(1, 2, figsize=(12, 6))
-                        for sensor_label in sensor_labels:
-                            ax[0].plot(
-                                tmp_data["Seconds"],
-                                tmp_data[sensor_label],
-                                label=sensor_label,
-                            )
-                        ax[0].set_title(
-                            f'{compound}-{conc}-{tmp_data["Temperature Modulation"].unique()}'
-                        )
-                        ax[0].set_xlabel("Seconds")
-                        ax[0].legend()
-
-                        ax2 = ax[1].twinx()
-                        lns1 = ax[1].plot(
-                            tmp_data["Seconds"],
-                            tmp_data["Temperature"],
-                            label="Temperature",
+                        panels = build_panels(
+                            tmp_data,
+                            f"{compound}-{conc}-{temp_options}",
                         )
-                        ax[1].set_ylabel("Temperature [$^\circ$C]")
-                        # secax_y = plt.secondary_yaxis('left')
-                        lns2 = ax2.plot(
-                            tmp_data["Seconds"],
-                            tmp_data["Humidity"],
-                            c="orange",
-                            label="Humidity",
-                        )
-                        ax2.set_ylabel("Humidity [%]")
-                        ax[1].set_xlabel("Seconds")
-                        lns = lns1 + lns2
-                        labs = [l.get_label() for l in lns]
-                        ax[1].legend(lns, labs, loc=0)
-
-                        fig.savefig(
+                        file = (
                             output_dir / f"{compound}-{conc}-{temperature_m_value}.png"
                         )
-                        plt.close()
+                        if renderer == "raster":
+                            save_figure(file, panels)
+                        else:
+                            save_matplotlib_figure(file, panels)
+                        if atlas:
+                            figures.append(panels)
+                if atlas and figures:
+                    save_atlas(
+                        output_dir / f"{compound}-{conc}-atlas.png",
+                        figures,
+                        n_columns=2,
+                    )
 
 
 if __name__ == "__main__":
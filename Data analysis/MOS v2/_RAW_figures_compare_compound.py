@@ -1,10 +1,12 @@
 import pandas as pd
 import os
 from pathlib import Path
-import matplotlib.pyplot as plt
 import numpy as np
 from loguru import logger
 
+from raster_figures import Panel, save_matplotlib_figure
+from recordings import read_recording
+
 # Constants
 _BASE_FOLDER = Path(r"C:\Users\resca\OneDrive - Politecnico di Milano\_Dottorato\6 - Tesisti\2024_2025_Vegetali\2_Misure sacche\_Trial-101")
 _OUTPUT_DIR = Path("Outputs") / "S-4_Subplots"
@@ -39,7 +41,7 @@ def plot_ace_subplots(data_folder: Path):
     if not folder.exists():
         raise FileNotFoundError(f"Could not find folder for compounds at {folder}")
     
-    fig, ax = plt.subplots(figsize=(6, 5))  # Only one axis for S-4
+    panel = Panel()  # Only one axis for S-4
     
     export_data = pd.DataFrame(columns=["Time [s]", "Voltage", "Concentration", "Compound"])
     
@@ -61,8 +63,11 @@ def plot_ace_subplots(data_folder: Path):
             for csv_file in compound_folder.iterdir():
                 if csv_file.is_file() and "csv" in csv_file.name:
                     
-                    tmp_data = pd.read_csv(csv_file, header=6)
-                    tmp_data["Seconds"] = [x * _SAMPLE_RATE for x in range(len(tmp_data))]
+                    tmp_data = read_recording(
+                        csv_file,
+                        columns=["S-4", TEMPERATURE_MODULATION_COL],
+                        sample_rate=_SAMPLE_RATE,
+                    )
                     
                     if SQ_TR_COL in tmp_data[TEMPERATURE_MODULATION_COL].unique():
                         # Extract data for the second Sq+Tr period
@@ -76,7 +81,7 @@ def plot_ace_subplots(data_folder: Path):
                         )
                         
                         # Plot the data for each compound with corresponding concentration label
-                        ax.plot(time_values, meas_volt_data_period, label=f"{compound} {conc_label}", color=color)
+                        panel.plot(time_values, meas_volt_data_period, label=f"{compound} {conc_label}", color=color)
                         
                         # Prepare data for export
                         sensor_export_data = pd.DataFrame({
@@ -96,16 +101,21 @@ def plot_ace_subplots(data_folder: Path):
             logger.info(f"Data for {compound} exported to {export_file_path}")
     
     # Finalize subplot
-    ax.set_title("Sensor: S-4")
-    ax.set_xlabel("Time [s]")
-    ax.set_ylabel("Voltage [V]")
-    ax.legend(loc="upper right")
+    panel.title = "Sensor: S-4"
+    panel.xlabel = "Time [s]"
+    panel.ylabel = "Voltage [V]"
+    panel.legend = True
     
     # Finalize figure
-    plt.tight_layout()
     output_file_path = _OUTPUT_DIR / "S-4_Subplot_L_Only.png"
-    plt.savefig(output_file_path, dpi=300, bbox_inches="tight")
-    plt.show()
+    save_matplotlib_figure(
+        output_file_path,
+        [panel],
+        figsize=(6, 5),
+        dpi=300,
+        legend_loc="upper right",
+        show=True,
+    )
     logger.info(f"Plot saved at {output_file_path}")
 
 
@@ -1,10 +1,12 @@
 import pandas as pd
 import os
 from pathlib import Path
-import matplotlib.pyplot as plt
 import numpy as np
 from loguru import logger
 
+from raster_figures import Panel, save_matplotlib_figure
+from recordings import read_recording
+
 # Constants
 _BASE_FOLDER = Path(r"C:\Users\resca\OneDrive - Politecnico di Milano\_Dottorato\6 - Tesisti\2024_2025_Vegetali\2_Misure sacche\_Trial-101")
 _OUTPUT_DIR = Path("Outputs") / "ACE_Subplots"
@@ -32,10 +34,10 @@ def plot_ace_subplots(data_folder: Path):
     if not ace_folder.exists():
         raise FileNotFoundError(f"Could not find folder for ACE compound at {ace_folder}")
     
-    fig, axes = plt.subplots(1, 4, figsize=(20, 5), sharey=True)
+    panels = [Panel() for _ in _SENSOR_LABELS]
     
     for sensor_idx, sensor_label in enumerate(_SENSOR_LABELS):
-        ax = axes[sensor_idx]
+        panel = panels[sensor_idx]
         export_data = pd.DataFrame(columns=["Time [s]", "Voltage", "Concentration"])
         
         for conc, label, color in zip(CONCENTRATIONS, CONC_LABELS, CONC_COLORS):
@@ -46,8 +48,11 @@ def plot_ace_subplots(data_folder: Path):
             
             for csv_file in folder.iterdir():
                 if csv_file.is_file() and "csv" in csv_file.name:
-                    tmp_data = pd.read_csv(csv_file, header=6)
-                    tmp_data["Seconds"] = [x * _SAMPLE_RATE for x in range(len(tmp_data))]
+                    tmp_data = read_recording(
+                        csv_file,
+                        columns=[sensor_label, TEMPERATURE_MODULATION_COL],
+                        sample_rate=_SAMPLE_RATE,
+                    )
                     
                     if SQ_TR_COL in tmp_data[TEMPERATURE_MODULATION_COL].unique():
                         # Extract data for the second Sq+Tr period
@@ -61,7 +66,7 @@ def plot_ace_subplots(data_folder: Path):
                         )
                         
                         # Plot the data
-                        ax.plot(time_values, meas_volt_data_period, label=label, color=color)
+                        panel.plot(time_values, meas_volt_data_period, label=label, color=color)
                         
                         # Prepare data for export
                         sensor_export_data = pd.DataFrame({
@@ -80,16 +85,22 @@ def plot_ace_subplots(data_folder: Path):
                 logger.info(f"Data for {sensor_label} ({conc_label}) exported to {export_file_path}")
         
         # Finalize subplot
-        ax.set_title(f"Sensor: {sensor_label}")
-        ax.set_xlabel("Time [s]")
-        ax.set_ylabel("Voltage [V]")
-        ax.legend(loc="upper right")
+        panel.title = f"Sensor: {sensor_label}"
+        panel.xlabel = "Time [s]"
+        panel.ylabel = "Voltage [V]"
+        panel.legend = True
     
     # Finalize figure
-    plt.tight_layout()
     output_file_path = _OUTPUT_DIR / "ACE_Subplots.png"
-    plt.savefig(output_file_path, dpi=300, bbox_inches="tight")
-    plt.show()
+    save_matplotlib_figure(
+        output_file_path,
+        panels,
+        figsize=(20, 5),
+        sharey=True,
+        dpi=300,
+        legend_loc="upper right",
+        show=True,
+    )
     logger.info(f"Plot saved at {output_file_path}")
 
 
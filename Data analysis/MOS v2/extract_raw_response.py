@@ -5,6 +5,8 @@ from pathlib import Path
 import seaborn as sns
 import click
 
+from recordings import is_recording, read_recording
+
 #_BASE_FOLDER = Path("D:\\_Data\\_eNose\\_Trial-101\\")
 _BASE_FOLDER = Path(r"C:\Users\resca\OneDrive - Politecnico di Milano\_Dottorato\6 - Tesisti\2024_2025_Vegetali\2_Misure sacche\_Trial-101")
 _SAMPLE_RATE = 0.1
@@ -21,7 +23,7 @@ def get_sq_tr_df(tmp_data, remove_baseline, normalize_cleaning, normalize_max):
     sq_tr_df = pd.DataFrame(columns=["Repetition", "Sensor", "Data", "x"])
     for sensor_label in _SENSOR_LABELS:
         # Convert to resistance
-        res_values = (5 / tmp_data[sensor_label]) * 10000 - 10000
+        res_values = (5 / tmp_data[sensor_label].astype(float)) * 10000 - 10000
         r0 = res_values.loc[tmp_data.Stage == "Cleaning"].mean()
         # We need to find the start and end point of the real measurement phase
         meas_rec_data = res_values[tmp_data["Temperature Modulation"] == _SQ_TR_COL]
@@ -84,8 +86,8 @@ def extract_single_period_df(remove_baseline, normalize_cleaning, normalize_max)
         if folder.exists():
             # If the folder exists
             for csv_file in folder.iterdir():
-                if csv_file.is_file() and "csv" in csv_file.name:
-                    tmp_data = pd.read_csv(csv_file, header=6)
+                if is_recording(csv_file):
+                    tmp_data = read_recording(csv_file)
                     temperature_modulation_patterns = tmp_data[
                         "Temperature Modulation"
                     ].unique()
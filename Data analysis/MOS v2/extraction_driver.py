@@ -0,0 +1,161 @@
+"""
+This module runs the feature extraction of many recordings, shared by the
+feature extraction scripts.
+
+The features of the recordings that are not in the cache are extracted, in
+worker processes if requested, and stored in the cache. Failed recordings are
+reported and left out. The features of all the recordings are then merged in
+a single frame, with the columns identifying each recording added by a label
+function of the script.
+
+Usage:
+
+>>> @click.command()
+... @extraction_options
+... def extract_features(data_folder, plot, jobs, normalization, force, chunk_size):
+...     cache = open_cache(_CACHE_DIR, _SENSOR_LABELS, normalization, chunk_size)
+...     features = extract_recordings(
+...         extract_file_features, extraction_jobs, add_labels, cache, jobs, force
+...     )
+"""
+
+from pathlib import Path
+from typing import Optional
+
+import click
+import pandas as pd
+from loguru import logger
+
+import sq_tr_features
+from feature_cache import FeatureCache
+from parallel_jobs import run_jobs
+
+
+def extraction_options(command):
+    """Add the options of the feature extraction scripts to a click command."""
+    options = [
+        click.option("--data-folder", default=None),
+        click.option("--plot/--no-plot", "-p", is_flag=True, default=False),
+        click.option(
+            "--jobs",
+            "-j",
+            default=1,
+            type=click.IntRange(min=1),
+            help="Number of recordings processed in parallel.",
+        ),
+        click.option(
+            "--normalization",
+            type=click.Choice(sq_tr_features.NORMALIZATIONS),
+            default=sq_tr_features.DEFAULT_NORMALIZATION,
+            help="Normalization of the sensors response.",
+        ),
+        click.option(
+            "--force",
+            is_flag=True,
+            help="Extract the features of all the recordings, even the cached ones.",
+        ),
+        click.option(
+            "--chunk-size",
+            default=None,
+            type=click.IntRange(min=1),
+            help="Read the recordings in chunks of this many rows, with one row "
+            "of features for each completed Sq+Tr cycle, normalized with the "
+            "statistics of the rows up to the end of the cycle.",
+        ),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def check_options(
+    data_folder: Optional[str], default_folder: Path, plot: bool, chunk_size
+) -> Path:
+    """Return the data folder, checking the options of the extraction."""
+    if data_folder is None:
+        data_folder = default_folder
+    else:
+        data_folder = Path(data_folder)
+        if not data_folder.exists():
+            raise FileNotFoundError(f"Could not find folder {data_folder}")
+    if plot and chunk_size is not None:
+        raise click.UsageError("--plot cannot be used with --chunk-size")
+    logger.debug(f"Retrieving data from {data_folder}")
+    return data_folder
+
+
+def open_cache(
+    cache_dir: Path, sensor_labels, normalization, chunk_size
+) -> FeatureCache:
+    """Return the cache of the features extracted with these parameters."""
+    return FeatureCache(
+        cache_dir,
+        {
+            "sample_rate": sq_tr_features.SAMPLE_RATE,
+            "sq_tr_period_seconds": sq_tr_features.SQ_TR_PERIOD_SECONDS,
+            "normalization": normalization,
+            "sensors": sensor_labels,
+            # Each cycle only depends on the rows up to its end, not on the chunks
+            "streaming": chunk_size is not None,
+        },
+    )
+
+
+def extract_recordings(
+    extract_file, jobs, label, cache: FeatureCache, n_workers=1, force=False
+) -> pd.DataFrame:
+    """
+    Extract the features of the recordings and merge them in a single frame.
+
+    Args:
+        - extract_file: top level function returning the features of a
+          recording, or None if it has no Sq+Tr phase
+        - jobs: tuples of arguments of extract_file, one for each recording,
+          starting with its file
+        - label: function adding the columns identifying a recording to its
+          features, called with the features and the job of the recording
+        - cache: cache of the features of each recording
+        - n_workers: number of worker processes
+        - force: if True, the cached recordings are extracted again
+
+    Returns:
+        - the features of all the recordings
+    """
+    # Recordings with their key in the cache, and the ones to be extracted
+    keys = {job[0]: cache.key(job[0]) for job in jobs}
+    extraction_jobs = [job for job in jobs if force or not cache.contains(keys[job[0]])]
+    logger.debug(
+        f"Extracting features from {len(extraction_jobs)} recordings, "
+        f"{len(jobs) - len(extraction_jobs)} cached"
+    )
+
+    # Extract the features, in worker processes if requested
+    n_failed = 0
+    try:
+        for job, file_features, error in run_jobs(
+            extract_file, extraction_jobs, n_workers
+        ):
+            if error is not None:
+                n_failed += 1
+                logger.error(f"Could not extract features from {job[0]}: {error}")
+                continue
+            logger.debug(f"Extracted features from {job[0]}")
+            cache.store(keys[job[0]], file_features)
+    finally:
+        cache.save()
+    if n_failed:
+        logger.warning(f"{n_failed} recordings failed, their features are missing")
+
+    # Merge the features of all the recordings once
+    features_list = []
+    for job in jobs:
+        key = keys[job[0]]
+        if not cache.contains(key):
+            # The extraction of the recording failed
+            continue
+        file_features = cache.load(key)
+        if file_features is not None:
+            features_list.append(label(file_features, job))
+    if not features_list:
+        return pd.DataFrame()
+    return pd.concat(features_list, ignore_index=True)
@@ -0,0 +1,94 @@
+"""
+This module allows to cache the features extracted from each recording, so
+that only new or changed recordings are processed again.
+
+Entries are content addressed: the key of a recording is the digest of its
+SHA-256 and of the extraction parameters, including the version of the
+extraction code and of the loader of the recordings, so that changing any
+of them misses the cache instead of returning stale features. Recordings
+are only hashed again when their size or modification time changed, as
+recorded in the manifest of the cache.
+
+Usage:
+
+>>> cache = FeatureCache(cache_dir, {"sample_rate": 0.1})
+>>> key = cache.key(csv_file)
+>>> if not cache.contains(key):
+...     cache.store(key, extract(csv_file))
+>>> features = cache.load(key)
+>>> cache.save()
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+import pandas as pd
+
+import recordings
+import sq_tr_features
+from recordings import file_hash, file_state
+
+# Version of the extraction code, changing whenever the shared engine or the
+# loading of the recordings changes
+CODE_VERSION = hashlib.sha256(
+    "".join(
+        file_hash(Path(module.__file__)) for module in (sq_tr_features, recordings)
+    ).encode()
+).hexdigest()
+# File in the cache folder recording the state of each recording
+_MANIFEST_FILE = "_manifest.json"
+
+
+class FeatureCache:
+    """
+    Folder of per-recording feature frames, stored as pickle files named
+    after their key.
+    """
+
+    def __init__(self, cache_dir: Path, parameters: dict):
+        """
+        Args:
+            - cache_dir: folder of the cache, created if it does not exist
+            - parameters: JSON serializable extraction parameters, part of
+              the key of every entry
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.parameters = {**parameters, "code_version": CODE_VERSION}
+        self.manifest_file = self.cache_dir / _MANIFEST_FILE
+        self.manifest = {}
+        if self.manifest_file.exists():
+            self.manifest = json.loads(self.manifest_file.read_text())
+
+    def key(self, file: Path) -> str:
+        """Return the key of the features of a recording."""
+        state = file_state(file, self.manifest.get(str(file)))
+        self.manifest[str(file)] = state
+        content = json.dumps(
+            {"sha256": state["sha256"], **self.parameters}, sort_keys=True
+        )
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def entry_file(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pkl"
+
+    def contains(self, key: str) -> bool:
+        return self.entry_file(key).exists()
+
+    def load(self, key: str):
+        """Return the cached features, None for recordings without any."""
+        return pd.read_pickle(self.entry_file(key))
+
+    def store(self, key: str, features):
+        """Store the features of a recording, or None if it has none."""
+        # Written to a temporary file first, so that interrupted runs do not
+        # leave truncated entries
+        entry_file = self.entry_file(key)
+        tmp_file = entry_file.with_suffix(".tmp")
+        pd.to_pickle(features, tmp_file)
+        tmp_file.replace(entry_file)
+
+    def save(self):
+        """Write the manifest, to avoid hashing unchanged recordings again."""
+        self.manifest_file.write_text(json.dumps(self.manifest, indent=2))
@@ -4,21 +4,102 @@ them in the preferred location.
 Just run the script with a path as a parameter, that is the folder where
 you want to save the figures. If this directory does not exist, 
 the script will try to create it.
+Figures are rendered with the raster renderer, that is much faster than
+matplotlib for batch exports; matplotlib can still be used with
+--renderer matplotlib.
+Recordings can be processed in parallel with --jobs, and the figures of
+recordings that did not change since the last run are not created again.
 """
 
+import json
+import time
 from pathlib import Path
 from sys import argv
 
-import matplotlib.pyplot as plt
+import matplotlib
+
+# Figures are only saved to files, never shown
+matplotlib.use("Agg")
 import numpy as np
-import pandas as pd
 import click
 
+from parallel_jobs import run_jobs
+from raster_figures import Panel, save_atlas, save_figure, save_matplotlib_figure
+from recordings import file_state, is_recording, read_recording
+
 _DEFAULT_DATA_DIR = Path("D:\\_Data\\_eNose\\_Trial-101\\")
+# File in the output folder recording the source of each figure
+_MANIFEST_FILE = "_figures_manifest.json"
 
 sensor_labels = ["S-1", "S-2", "S-3", "S-4", "S-5", "S-6", "S-7", "S-8"]
 
 
+def build_panels(tmp_data, title):
+    """Return the panels of the figure of a recording."""
+    sensors = Panel(title=title, xlabel="Seconds", legend=True)
+    for sensor_label in sensor_labels:
+        sensors.plot(tmp_data["Seconds"], tmp_data[sensor_label], label=sensor_label)
+    environment = Panel(
+        xlabel="Seconds", ylabel="Temperature", twin_ylabel="Humidity [%]", legend=True
+    )
+    environment.plot(tmp_data["Seconds"], tmp_data["Temperature"], label="Temperature")
+    environment.plot(
+        tmp_data["Seconds"],
+        tmp_data["Humidity"],
+        color="orange",
+        label="Humidity",
+        twin=True,
+    )
+    return [sensors, environment]
+
+
+def is_up_to_date(entry, state, renderer, output_dir, csv_file):
+    """Return True if the figure of a recording does not need to be created."""
+    return (
+        entry is not None
+        and entry.get("sha256") == state["sha256"]
+        and entry.get("renderer") == renderer
+        # Figures named without their recording are created again
+        and entry["figure"].endswith(f"-{csv_file.stem}.png")
+        and (output_dir / entry["figure"]).exists()
+    )
+
+
+def export_figure(csv_file, compound, concentration, output_dir, renderer, atlas):
+    """
+    Create the figure of a recording.
+
+    Returns:
+        - name of the figure file
+        - panels of the figure if atlas is True, to be tiled by the caller
+    """
+    tmp_data = read_recording(
+        csv_file,
+        columns=sensor_labels + ["Temperature", "Humidity", "Temperature Modulation"],
+        sample_rate=0.1,
+    )
+
+    # The labels are categorical, titles show them as an array of strings
+    temp_options = np.asarray(tmp_data["Temperature Modulation"].unique())
+    if len(temp_options) == 1:
+        temperature_m_value = temp_options[0]
+    else:
+        temperature_m_value = temp_options[1]
+
+    panels = build_panels(
+        tmp_data,
+        f"{compound}-{concentration}-{temp_options}",
+    )
+    # Named after the recording too, so that recordings with the same
+    # modulation are not written to the same file by different workers
+    figure = f"{compound}-{concentration}-{temperature_m_value}-{csv_file.stem}.png"
+    if renderer == "raster":
+        save_figure(output_dir / figure, panels)
+    else:
+        save_matplotlib_figure(output_dir / figure, panels)
+    return figure, panels if atlas else None
+
+
 @click.command()
 @click.option(
     "--data_dir", default=_DEFAULT_DATA_DIR, help="Folder containing raw data."
@@ -26,7 +107,29 @@ sensor_labels = ["S-1", "S-2", "S-3", "S-4", "S-5", "S-6", "S-7", "S-8"]
 @click.option(
     "--output_dir", default="_figures", help="Folder where figures will be stored."
 )
-def create_figures(data_dir, output_dir):
+@click.option(
+    "--renderer",
+    type=click.Choice(["raster", "matplotlib"]),
+    default="raster",
+    help="Library used to render the figures.",
+)
+@click.option(
+    "--atlas",
+    is_flag=True,
+    help="Also tile the figures of each folder in a single atlas image.",
+)
+@click.option(
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of recordings processed in parallel.",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Create all the figures, even the ones that are up to date.",
+)
+def create_figures(data_dir, output_dir, renderer, atlas, jobs, force):
     """Create figures of data collected with temperature modulation electronic nose."""
     try:
         output_dir = Path(output_dir)
@@ -38,62 +141,94 @@ def create_figures(data_dir, output_dir):
         data_dir = Path(data_dir)
     except:
         raise
+    start_time = time.perf_counter()
+    manifest_file = output_dir / _MANIFEST_FILE
+    manifest = {}
+    if manifest_file.exists() and not force:
+        manifest = json.loads(manifest_file.read_text())
+
+    # Recordings whose figure must be created
+    export_jobs = []
+    states = {}
+    atlases = {}
+    n_skipped = 0
     for folder in data_dir.iterdir():
         compound = folder.name.split("_")[0]
         concentration = folder.name.split("_")[1][:-3]
 
         folder = data_dir / f"{compound}_{concentration}ppm"
         if folder.exists():
-            print(f"{compound}-{concentration}")
+            folder_jobs = []
             for csv_file in folder.iterdir():
-                if csv_file.is_file() and "csv" in csv_file.name:
-                    tmp_data = pd.read_csv(csv_file, header=6)
-                    tmp_data["Seconds"] = [x * 0.1 for x in range(len(tmp_data))]
-
-                    temp_options = tmp_data["Temperature Modulation"].unique()
-                    if len(temp_options) == 1:
-                        temperature_m_value = temp_options[0]
-                    else:
-                        temperature_m_value = temp_options[1]
-
-                    fig, ax = plt.subplots(1, 2, figsize=(12, 6))
-                    for sensor_label in sensor_labels:
-                        ax[0].plot(
-                            tmp_data["Seconds"],
-                            tmp_data[sensor_label],
-                            label=sensor_label,
-                        )
-                    ax[0].set_title(
-                        f'{compound}-{concentration}-{tmp_data["Temperature Modulation"].unique()}'
-                    )
-                    ax[0].set_xlabel("Seconds")
-                    ax[0].legend()
-
-                    ax2 = ax[1].twinx()
-                    lns1 = ax[1].plot(
-                        tmp_data["Seconds"],
-                        tmp_data["Temperature"],
-                        label="Temperature",
-                    )
-                    ax[1].set_ylabel("Temperature")
-                    # secax_y = plt.secondary_yaxis('left')
-                    lns2 = ax2.plot(
-                        tmp_data["Seconds"],
-                        tmp_data["Humidity"],
-                        c="orange",
-                        label="Humidity",
+                if is_recording(csv_file):
+                    key = str(csv_file)
+                    entry = manifest.get(key)
+                    states[key] = file_state(csv_file, entry)
+                    up_to_date = is_up_to_date(
+                        entry, states[key], renderer, output_dir, csv_file
                     )
-                    ax2.set_ylabel("Humidity [%]")
-                    ax[1].set_xlabel("Seconds")
-                    lns = lns1 + lns2
-                    labs = [l.get_label() for l in lns]
-                    ax[1].legend(lns, labs, loc=0)
-
-                    fig.savefig(
-                        output_dir
-                        / f"{compound}-{concentration}-{temperature_m_value}.png"
+                    if up_to_date:
+                        # The file may have been touched without being changed
+                        manifest[key] = {**entry, **states[key]}
+                    job = (
+                        csv_file,
+                        compound,
+                        concentration,
+                        output_dir,
+                        renderer,
+                        atlas,
                     )
-                    plt.close()
+                    folder_jobs.append((job, up_to_date))
+            # The atlas needs the panels of all the figures of the folder
+            atlas_file = output_dir / f"{compound}-{concentration}-atlas.png"
+            new_atlas = (
+                atlas
+                and len(folder_jobs) > 0
+                and (
+                    not atlas_file.exists()
+                    or not all(up_to_date for _, up_to_date in folder_jobs)
+                )
+            )
+            if new_atlas:
+                atlases[(compound, concentration)] = []
+            for job, up_to_date in folder_jobs:
+                if up_to_date and not new_atlas:
+                    n_skipped += 1
+                else:
+                    export_jobs.append(job)
+
+    # Create the figures, in worker processes if requested
+    n_failed = 0
+    try:
+        results = run_jobs(export_figure, export_jobs, jobs)
+        for index, (job, result, error) in enumerate(results, 1):
+            csv_file, compound, concentration = job[:3]
+            key = str(csv_file)
+            progress = f"[{index}/{len(export_jobs)}] {compound}-{concentration}"
+            if error is not None:
+                n_failed += 1
+                manifest.pop(key, None)
+                print(f"{progress} {csv_file.name}: failed, {error}")
+                continue
+            figure, panels = result
+            manifest[key] = {**states[key], "renderer": renderer, "figure": figure}
+            print(f"{progress} {csv_file.name} -> {figure}")
+            if panels is not None:
+                atlases[(compound, concentration)].append(panels)
+    finally:
+        manifest_file.write_text(json.dumps(manifest, indent=2))
+
+    for (compound, concentration), figures in atlases.items():
+        if figures:
+            save_atlas(
+                output_dir / f"{compound}-{concentration}-atlas.png",
+                figures,
+                n_columns=2,
+            )
+    print(
+        f"{len(export_jobs) - n_failed} figures created, {n_skipped} up to date, "
+        f"{n_failed} failed in {time.perf_counter() - start_time:.1f} s"
+    )
 
 
 if __name__ == "__main__":
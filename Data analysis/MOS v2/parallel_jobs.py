@@ -0,0 +1,52 @@
+"""
+This module allows to process many recordings with the same function, in
+worker processes if requested.
+
+Errors are returned with the job that raised them instead of aborting the
+whole run, so that the scripts can report the recordings that failed and
+keep the results of the others.
+
+Usage:
+
+>>> for job, result, error in run_jobs(export_figure, jobs, n_workers=4):
+...     if error is not None:
+...         print(f"{job[0]}: failed, {error}")
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+
+def run_job(call):
+    """Run a job in a worker, returning the error instead of raising it."""
+    function, job = call
+    try:
+        return function(*job), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def run_jobs(function, jobs, n_workers=1):
+    """
+    Call function(*job) for each job.
+
+    Args:
+        - function: top level function, so that it can be sent to the workers
+        - jobs: list of tuples of arguments
+        - n_workers: number of worker processes, 1 to run the jobs in this one
+
+    Yields:
+        - job, its result, and None, or job, None and the error it raised, in
+          the order of the jobs
+    """
+    calls = [(function, job) for job in jobs]
+    executor = ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 else None
+    try:
+        if executor is not None:
+            results = executor.map(run_job, calls)
+        else:
+            results = map(run_job, calls)
+        for job, (result, error) in zip(jobs, results):
+            yield job, result, error
+    finally:
+        if executor is not None:
+            executor.shutdown()
@@ -0,0 +1,388 @@
+"""
+This module allows to render line plots of the recordings straight to PNG
+files, for batch exports of many figures.
+
+Figures are drawn with Pillow on an RGB raster, without the per-figure setup
+of matplotlib. Each trace is reduced to the first, minimum, maximum and last
+sample of every pixel column before being drawn, so that the time needed for
+a figure depends on its size rather than on the number of samples. Figures
+are made of panels, tiled side by side, and several figures can be tiled in
+a single atlas image. The same panels can also be rendered with matplotlib,
+which is only imported when needed.
+
+Usage:
+
+>>> panel = Panel(title="S-1", xlabel="Seconds")
+>>> panel.plot(seconds, voltage, label="S-1")
+>>> save_figure("S-1.png", [panel])
+"""
+
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Colors of the traces without one, as in the default matplotlib cycle
+DEFAULT_COLORS = [
+    "#1f77b4",
+    "#ff7f0e",
+    "#2ca02c",
+    "#d62728",
+    "#9467bd",
+    "#8c564b",
+    "#e377c2",
+    "#7f7f7f",
+    "#bcbd22",
+    "#17becf",
+]
+# Size of each panel, in pixels
+PANEL_SIZE = (600, 450)
+FONT_SIZE = 12
+# Space around the plot area of a panel, for the axes labels
+MARGIN_LEFT = 64
+MARGIN_RIGHT = 16
+MARGIN_TWIN = 64
+MARGIN_TOP = 28
+MARGIN_BOTTOM = 44
+TICK_LENGTH = 4
+N_TICKS = 6
+# Fraction of the data range added above and below it, as matplotlib does
+Y_PADDING = 0.05
+
+
+@dataclass
+class Trace:
+    x: np.ndarray
+    y: np.ndarray
+    color: Optional[str] = None
+    label: Optional[str] = None
+
+
+@dataclass
+class Panel:
+    """
+    Axes holding line plots, with an optional second y axis on the right.
+    """
+
+    title: str = ""
+    xlabel: str = ""
+    ylabel: str = ""
+    twin_ylabel: str = ""
+    legend: bool = False
+    ylim: Optional[Tuple[float, float]] = None
+    traces: List[Trace] = field(default_factory=list)
+    # Traces drawn against the second y axis
+    twin_traces: List[Trace] = field(default_factory=list)
+
+    def plot(self, x, y, color=None, label=None, twin=False):
+        """Add a line plot of y against x."""
+        if color is None:
+            n_traces = len(self.traces) + len(self.twin_traces)
+            color = DEFAULT_COLORS[n_traces % len(DEFAULT_COLORS)]
+        trace = Trace(
+            np.asarray(x, dtype=float), np.asarray(y, dtype=float), color, label
+        )
+        if twin:
+            self.twin_traces.append(trace)
+        else:
+            self.traces.append(trace)
+
+
+def get_font(size=FONT_SIZE):
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # Pillow < 10.1 only has a fixed size bitmap font
+        return ImageFont.load_default()
+
+
+def nice_ticks(vmin, vmax, n_ticks=N_TICKS):
+    """
+    Return ticks between vmin and vmax, spaced by 1, 2 or 5 times a power of 10.
+    """
+    if not vmax > vmin:
+        return np.array([vmin])
+    raw_step = (vmax - vmin) / n_ticks
+    power = 10.0 ** np.floor(np.log10(raw_step))
+    for multiple in (1, 2, 5, 10):
+        step = multiple * power
+        if step >= raw_step:
+            break
+    first = np.ceil(vmin / step - 1e-9) * step
+    ticks = np.arange(first, vmax + step * 1e-9, step)
+    # Avoid labels such as -0 or 0.30000000000000004
+    return np.round(ticks / step) * step + 0.0
+
+
+def data_range(traces, axis, padding=0.0):
+    values = [getattr(trace, axis) for trace in traces]
+    values = [v[np.isfinite(v)] for v in values]
+    values = [v for v in values if len(v)]
+    if not values:
+        return 0.0, 1.0
+    vmin = min(v.min() for v in values)
+    vmax = max(v.max() for v in values)
+    if vmin == vmax:
+        return vmin - 0.5, vmax + 0.5
+    pad = (vmax - vmin) * padding
+    return vmin - pad, vmax + pad
+
+
+def trace_pixels(trace, x_range, y_range, box):
+    """
+    Return the pixel coordinates of the polyline drawing a trace.
+
+    When a trace has more samples than twice the pixel columns of the box,
+    only the first, minimum, maximum and last sample of each column are
+    kept, which draws the same picture.
+    """
+    left, top, right, bottom = box
+    x, y = trace.x, trace.y
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.all():
+        x, y = x[finite], y[finite]
+    if len(x) == 0:
+        return []
+    px = left + (x - x_range[0]) * ((right - left) / (x_range[1] - x_range[0]))
+    py = bottom - (y - y_range[0]) * ((bottom - top) / (y_range[1] - y_range[0]))
+    py = np.clip(py, top, bottom)
+    columns = np.floor(px).astype(np.int64)
+    if len(x) > 2 * (right - left) and np.all(np.diff(columns) >= 0):
+        starts = np.flatnonzero(np.diff(columns, prepend=columns[0] - 1))
+        ends = np.append(starts[1:], len(py)) - 1
+        points = np.empty((len(starts), 4, 2))
+        points[:, :, 0] = columns[starts, np.newaxis] + 0.5
+        points[:, 0, 1] = py[starts]
+        points[:, 1, 1] = np.minimum.reduceat(py, starts)
+        points[:, 2, 1] = np.maximum.reduceat(py, starts)
+        points[:, 3, 1] = py[ends]
+        px, py = points[:, :, 0].ravel(), points[:, :, 1].ravel()
+    return np.column_stack((px, py)).ravel().tolist()
+
+
+def draw_text(image, xy, text, font, anchor="la", angle=0, fill="black"):
+    if not text:
+        return
+    if angle == 0:
+        ImageDraw.Draw(image).text(xy, text, font=font, fill=fill, anchor=anchor)
+        return
+    # Rotated text is drawn on its own image, pasted on the figure
+    bbox = font.getbbox(text)
+    label = Image.new("L", (bbox[2] + 2, bbox[3] + 2), 0)
+    ImageDraw.Draw(label).text((1, 1), text, font=font, fill=255)
+    label = label.rotate(angle, expand=True)
+    x = int(xy[0] - label.width / 2)
+    y = int(xy[1] - label.height / 2)
+    image.paste(Image.new("RGB", label.size, fill), (x, y), label)
+
+
+def draw_panel(image, panel, origin, size=PANEL_SIZE, font=None):
+    """
+    Draw a panel on an image.
+
+    Args:
+        - image: Pillow RGB image
+        - panel: panel to be drawn
+        - origin: position of the top left corner of the panel in the image
+        - size: width and height of the panel
+    """
+    font = font or get_font()
+    draw = ImageDraw.Draw(image)
+    x0, y0 = origin
+    width, height = size
+    right_margin = MARGIN_TWIN if panel.twin_traces else MARGIN_RIGHT
+    box = (
+        x0 + MARGIN_LEFT,
+        y0 + MARGIN_TOP,
+        x0 + width - right_margin,
+        y0 + height - MARGIN_BOTTOM,
+    )
+    left, top, right, bottom = box
+    x_range = data_range(panel.traces + panel.twin_traces, "x")
+    axes = [(panel.traces, panel.ylim or data_range(panel.traces, "y", Y_PADDING))]
+    if panel.twin_traces:
+        axes.append((panel.twin_traces, data_range(panel.twin_traces, "y", Y_PADDING)))
+
+    # Traces
+    for traces, y_range in axes:
+        for trace in traces:
+            points = trace_pixels(trace, x_range, y_range, box)
+            if len(points) >= 4:
+                draw.line(points, fill=trace.color, width=1)
+
+    # Axes, ticks and their labels
+    draw.rectangle(box, outline="black")
+    x_scale = (right - left) / (x_range[1] - x_range[0])
+    for tick in nice_ticks(*x_range):
+        x = left + (tick - x_range[0]) * x_scale
+        draw.line((x, bottom, x, bottom + TICK_LENGTH), fill="black")
+        draw_text(image, (x, bottom + TICK_LENGTH + 2), f"{tick:g}", font, "ma")
+    for axis, (traces, y_range) in enumerate(axes):
+        y_scale = (bottom - top) / (y_range[1] - y_range[0])
+        for tick in nice_ticks(*y_range):
+            y = bottom - (tick - y_range[0]) * y_scale
+            if axis == 0:
+                draw.line((left - TICK_LENGTH, y, left, y), fill="black")
+                draw_text(image, (left - TICK_LENGTH - 2, y), f"{tick:g}", font, "rm")
+            else:
+                draw.line((right, y, right + TICK_LENGTH, y), fill="black")
+                draw_text(image, (right + TICK_LENGTH + 2, y), f"{tick:g}", font, "lm")
+
+    # Title and axes labels
+    # Titles are drawn on a single line
+    title = " ".join(panel.title.split())
+    draw_text(image, ((left + right) / 2, y0 + MARGIN_TOP / 2), title, font, "mm")
+    draw_text(image, ((left + right) / 2, y0 + height - 4), panel.xlabel, font, "md")
+    center = (top + bottom) / 2
+    draw_text(image, (x0 + FONT_SIZE / 2 + 2, center), panel.ylabel, font, angle=90)
+    draw_text(
+        image,
+        (x0 + width - FONT_SIZE / 2 - 2, center),
+        panel.twin_ylabel,
+        font,
+        angle=90,
+    )
+
+    if panel.legend:
+        draw_legend(draw, panel.traces + panel.twin_traces, box, font)
+
+
+def draw_legend(draw, traces, box, font):
+    entries = [trace for trace in traces if trace.label]
+    if not entries:
+        return
+    line_height = FONT_SIZE + 4
+    text_width = max(draw.textlength(trace.label, font=font) for trace in entries)
+    legend_right = box[2] - 6
+    legend_left = legend_right - text_width - 32
+    legend_top = box[1] + 6
+    legend_bottom = legend_top + line_height * len(entries) + 4
+    draw.rectangle(
+        (legend_left, legend_top, legend_right, legend_bottom),
+        fill="white",
+        outline="lightgray",
+    )
+    for index, trace in enumerate(entries):
+        y = legend_top + 2 + line_height * (index + 0.5)
+        draw.line((legend_left + 4, y, legend_left + 22, y), fill=trace.color, width=2)
+        draw.text(
+            (legend_left + 28, y), trace.label, font=font, fill="black", anchor="lm"
+        )
+
+
+def render_figure(
+    panels: Sequence[Panel], panel_size=PANEL_SIZE, sharey=False
+) -> Image.Image:
+    """
+    Return an image with the panels side by side.
+
+    Args:
+        - panels: panels of the figure
+        - panel_size: width and height of each panel
+        - sharey: if True, the panels without ylim share the same y range
+    """
+    width, height = panel_size
+    image = Image.new("RGB", (width * len(panels), height), "white")
+    font = get_font()
+    if sharey:
+        traces = [trace for panel in panels for trace in panel.traces]
+        ylim = data_range(traces, "y", Y_PADDING)
+    for index, panel in enumerate(panels):
+        if sharey and panel.ylim is None:
+            panel = replace(panel, ylim=ylim)
+        draw_panel(image, panel, (index * width, 0), panel_size, font)
+    return image
+
+
+def render_atlas(
+    figures: Sequence[Sequence[Panel]], n_columns=4, panel_size=PANEL_SIZE
+) -> Image.Image:
+    """
+    Return an image with several figures tiled in a grid.
+
+    Args:
+        - figures: panels of each figure
+        - n_columns: number of figures in each row of the grid
+        - panel_size: width and height of each panel
+    """
+    width, height = panel_size
+    figure_width = width * max((len(panels) for panels in figures), default=1)
+    n_rows = -(-len(figures) // n_columns)
+    image = Image.new(
+        "RGB", (figure_width * min(len(figures), n_columns), height * n_rows), "white"
+    )
+    font = get_font()
+    for index, panels in enumerate(figures):
+        row, column = divmod(index, n_columns)
+        for panel_index, panel in enumerate(panels):
+            origin = (column * figure_width + panel_index * width, row * height)
+            draw_panel(image, panel, origin, panel_size, font)
+    return image
+
+
+def save_figure(
+    file: Path, panels: Sequence[Panel], panel_size=PANEL_SIZE, sharey=False
+):
+    """Render the panels side by side and save them as a PNG file."""
+    render_figure(panels, panel_size, sharey).save(file, compress_level=1)
+
+
+def save_atlas(
+    file: Path, figures: Sequence[Sequence[Panel]], n_columns=4, panel_size=PANEL_SIZE
+):
+    """Render several figures tiled in a grid and save them as a PNG file."""
+    render_atlas(figures, n_columns, panel_size).save(file, compress_level=1)
+
+
+def save_matplotlib_figure(
+    file: Path,
+    panels: Sequence[Panel],
+    figsize=None,
+    sharey=False,
+    dpi=None,
+    legend_loc=0,
+    show=False,
+):
+    """
+    Render the panels side by side with matplotlib and save them.
+
+    Args:
+        - file: output file
+        - panels: panels of the figure
+        - figsize: width and height of the figure in inches, 6 by 6 for each
+          panel if None
+        - sharey: if True, the panels share the same y axis
+        - dpi: resolution of the saved figure, the matplotlib default if None
+        - legend_loc: location of the legends, the best one if 0
+        - show: if True, the figure is shown before being closed
+    """
+    import matplotlib.pyplot as plt
+
+    if figsize is None:
+        figsize = (6 * len(panels), 6)
+    fig, ax = plt.subplots(1, len(panels), figsize=figsize, sharey=sharey)
+    for panel, panel_ax in zip(panels, np.atleast_1d(ax)):
+        lines = []
+        for trace in panel.traces:
+            lines += panel_ax.plot(trace.x, trace.y, c=trace.color, label=trace.label)
+        if panel.twin_traces:
+            twin_ax = panel_ax.twinx()
+            for trace in panel.twin_traces:
+                lines += twin_ax.plot(
+                    trace.x, trace.y, c=trace.color, label=trace.label
+                )
+            twin_ax.set_ylabel(panel.twin_ylabel)
+        panel_ax.set_title(panel.title)
+        panel_ax.set_xlabel(panel.xlabel)
+        panel_ax.set_ylabel(panel.ylabel)
+        if panel.ylim is not None:
+            panel_ax.set_ylim(panel.ylim)
+        if panel.legend:
+            panel_ax.legend(lines, [l.get_label() for l in lines], loc=legend_loc)
+    fig.tight_layout()
+    fig.savefig(file, dpi=dpi, bbox_inches="tight")
+    if show:
+        plt.show()
+    plt.close(fig)
@@ -0,0 +1,181 @@
+"""
+This module allows to load the recordings exported by the eNose GUI.
+
+Recordings can be stored either as text files (txt/csv), with six header
+lines starting with `%` followed by the data columns, or as Parquet files,
+with typed columns and the header stored in the file metadata.
+Reading Parquet files requires pyarrow, which is also used to parse text
+files when installed.
+
+Both formats are loaded with the same column types, given by
+RECORDING_DTYPES, and only the requested columns are converted. Recordings
+too long to be loaded at once can be read in chunks of rows.
+
+Usage:
+
+>>> data = read_recording(csv_file, columns=["S-4", "Temperature Modulation"])
+>>> data.attrs["header"]["Custom Header"]
+>>> for chunk in iter_recording(csv_file, chunk_size=100000, columns=["S-4"]):
+...     print(chunk["S-4"].mean())
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+PARQUET_HEADER_KEY = b"mip.header"
+TEXT_HEADER_LINES = 6
+SENSOR_COLUMNS = ["S-1", "S-2", "S-3", "S-4", "S-5", "S-6", "S-7", "S-8"]
+# Types of the columns of the recordings, the labels of the stages and
+# of the temperature modulation patterns being repeated on every row
+RECORDING_DTYPES = {
+    "Packet_ID": "uint8",
+    "Temperature": "float32",
+    "Humidity": "float32",
+    "Pressure": "float32",
+    **{column: "float32" for column in SENSOR_COLUMNS},
+    "Stage": "category",
+    "Temperature Modulation": "category",
+}
+
+
+def is_recording(file: Path) -> bool:
+    """Return True if the file is a recording exported by the GUI."""
+    return file.is_file() and ("csv" in file.name or file.suffix == ".parquet")
+
+
+def csv_engine() -> str:
+    """Return the fastest pandas engine available to parse text recordings."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "c"
+    return "pyarrow"
+
+
+def read_header(file: Path) -> dict:
+    """
+    Return the header of a text recording, e.g. {"IIR Filter": "Off"}.
+
+    Each header line is written by the GUI as "% key: value".
+    """
+    header = {}
+    with open(file) as f:
+        for _ in range(TEXT_HEADER_LINES):
+            line = f.readline()
+            if not line.startswith("%"):
+                break
+            key, _, value = line[1:].partition(":")
+            header[key.strip()] = value.strip()
+    return header
+
+
+def read_recording(file: Path, columns=None, sample_rate=None) -> pd.DataFrame:
+    """
+    Load a recording exported by the GUI.
+
+    Args:
+        - file: path of the recording
+        - columns: optional list of columns to be loaded
+        - sample_rate: optional time between samples, in seconds, to add a
+          Seconds column with the time of each sample
+
+    Returns:
+        - pandas DataFrame with the recorded data, with the header of the
+          recording stored in its attrs["header"]
+    """
+    file = Path(file)
+    if file.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(file, columns=columns, memory_map=True)
+        data = table.to_pandas()
+        header = (table.schema.metadata or {}).get(PARQUET_HEADER_KEY)
+        data = data.astype(
+            {c: dtype for c, dtype in RECORDING_DTYPES.items() if c in data}
+        )
+        data.attrs["header"] = json.loads(header) if header is not None else {}
+    else:
+        data = pd.read_csv(
+            file,
+            header=TEXT_HEADER_LINES,
+            usecols=columns,
+            dtype=RECORDING_DTYPES,
+            engine=csv_engine(),
+        )
+        data.attrs["header"] = read_header(file)
+    if sample_rate is not None:
+        data["Seconds"] = np.arange(len(data)) * sample_rate
+    return data
+
+
+def iter_recording(file: Path, chunk_size: int, columns=None):
+    """
+    Load a recording exported by the GUI in chunks of rows, so that only one
+    chunk is held in memory at a time.
+
+    Args:
+        - file: path of the recording
+        - chunk_size: number of rows of each chunk
+        - columns: optional list of columns to be loaded
+
+    Yields:
+        - pandas DataFrames with consecutive rows of the recording, indexed
+          by their position in the recording
+    """
+    file = Path(file)
+    if file.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        start = 0
+        parquet_file = pq.ParquetFile(file, memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            chunk = batch.to_pandas()
+            chunk = chunk.astype(
+                {c: dtype for c, dtype in RECORDING_DTYPES.items() if c in chunk}
+            )
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
+    else:
+        # The pyarrow engine does not support reading in chunks
+        yield from pd.read_csv(
+            file,
+            header=TEXT_HEADER_LINES,
+            usecols=columns,
+            dtype=RECORDING_DTYPES,
+            chunksize=chunk_size,
+            engine="c",
+        )
+
+
+def file_hash(file: Path) -> str:
+    """Return the SHA-256 digest of a file."""
+    digest = hashlib.sha256()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_state(file: Path, previous=None) -> dict:
+    """
+    Return the size, modification time and SHA-256 digest of a file.
+
+    The file is only hashed again if its size or modification time changed
+    since the previous state.
+    """
+    stat = file.stat()
+    state = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    if (
+        previous is not None
+        and previous.get("mtime_ns") == stat.st_mtime_ns
+        and previous.get("size") == stat.st_size
+    ):
+        state["sha256"] = previous.get("sha256")
+    else:
+        state["sha256"] = file_hash(file)
+    return state
@@ -0,0 +1,601 @@
+"""
+This module extracts the features of the sensors response to the Sq+Tr
+temperature modulation, shared by the feature extraction scripts.
+
+The Sq+Tr phase of a recording is normalized and split into periods of
+SQ_TR_PERIOD_SECONDS, giving a (n_sensors, n_periods, n_samples) array.
+Features are then computed for all the sensors and periods at once, with
+reductions along the last axis, and the output frame is built in one go.
+
+Recordings too long to be held in memory, or live data, can instead be
+processed with SqTrStream, which emits the features of each Sq+Tr cycle as
+soon as it is completed. stream_recording_features feeds it with a recording
+read in chunks.
+
+Usage:
+
+>>> response = normalized_response(data, ["S-1", "S-2"])
+>>> features, markers, delta_r = extract_period_features(response)
+>>> features_df = features_frame(features, delta_r, ["S-1", "S-2"])
+"""
+
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import scipy.integrate
+import scipy.signal
+import scipy.stats
+
+from recordings import iter_recording
+
+SAMPLE_RATE = 0.1
+STAGE_COL = "Stage"
+CLEANING_STAGE = "Cleaning"
+TEMPERATURE_MODULATION_COL = "Temperature Modulation"
+
+SQ_TR_COL = "Sq+Tr"
+SQ_TR_PERIOD_SECONDS = 100
+SQ_TR_PERIOD_SAMPLES = int(SQ_TR_PERIOD_SECONDS / SAMPLE_RATE)
+SQ_TR_PERIODS = 12
+# Normalizations of the response: the cleaning stage resistance ratio (r_norm),
+# the z-score, or both
+NORMALIZATIONS = ("r_norm_zscore", "r_norm", "zscore")
+DEFAULT_NORMALIZATION = "r_norm_zscore"
+# DeltaR is the change of the max resistance of the square phase between these periods
+DELTA_R_PERIODS = (1, 10)
+
+PERIOD_FEATURES = [
+    "DeltaH",
+    "DeltaT1",
+    "DeltaT2",
+    "DeltaT3",
+    "SlopeH",
+    "SlopeL",
+    "AreaS",
+    "AreaT",
+]
+# Time (s) and value of the points used to compute the features of a period
+MARKER_COLUMNS = [
+    "Start Resistance Time",
+    "Start Resistance",
+    "Target dY/dX Time",
+    "Target dY/dX Resistance",
+    "Threshold Crossing Time",
+    "Threshold Crossing Resistance",
+    "Max Resistance Time",
+    "Max Resistance",
+    "Min Resistance Triangle First Half Time",
+    "Min Resistance Triangle First Half",
+    "Max Resistance Triangle Time",
+    "Max Resistance Triangle",
+    "Min Resistance Triangle Second Half Time",
+    "Min Resistance Triangle Second Half",
+]
+
+
+def normalized_response(
+    data: pd.DataFrame, sensor_labels, normalization=DEFAULT_NORMALIZATION
+) -> np.ndarray:
+    """
+    Return the normalized resistance of the sensors during the Sq+Tr phase.
+
+    Args:
+        - data: recording
+        - sensor_labels: columns of the sensors
+        - normalization: one of NORMALIZATIONS. With "r_norm_zscore" the
+          resistance is divided by its mean during the cleaning stage, then
+          z-scored; "r_norm" and "zscore" only apply one of the two steps
+
+    Returns:
+        - array with shape (n_sensors, n_samples)
+    """
+    if normalization not in NORMALIZATIONS:
+        raise ValueError(f"Unknown normalization {normalization}")
+    # Convert to resistance, in double precision as the channels are loaded
+    # as float32
+    res_values = 5 / data[sensor_labels].astype(float) * 10000 - 10000
+    meas_rec_data = res_values.loc[data[TEMPERATURE_MODULATION_COL] == SQ_TR_COL]
+    meas_rec_data = meas_rec_data.to_numpy(dtype=float).T
+    if normalization in ("r_norm_zscore", "r_norm"):
+        r0 = res_values.loc[data[STAGE_COL] == CLEANING_STAGE].mean().to_numpy()
+        meas_rec_data = meas_rec_data / r0[:, np.newaxis]
+    if normalization in ("r_norm_zscore", "zscore"):
+        meas_rec_data = scipy.stats.zscore(meas_rec_data, axis=1)
+    return meas_rec_data
+
+
+def period_features(periods: np.ndarray):
+    """
+    Compute the features of periods of the Sq+Tr response.
+
+    Args:
+        - periods: array with shape (..., n_samples), one period of the
+          response along the last axis
+
+    Returns:
+        - features, with shape (..., len(PERIOD_FEATURES))
+        - markers, with shape (..., len(MARKER_COLUMNS))
+    """
+    n_samples = periods.shape[-1]
+    initial_resistance = periods[..., 0]
+    end_resistance = periods[..., -1]
+
+    # Max resistance during the square phase
+    resistance_values = periods[..., : int(n_samples / 2) - 50]
+    resistance_values_filt = scipy.signal.savgol_filter(
+        resistance_values, 35, 2, axis=-1
+    )
+    dy_dx = np.gradient(resistance_values_filt, SAMPLE_RATE, axis=-1)
+    # First point reaching 70% of the max slope, and first one below it after
+    threshold = 0.7 * np.max(dy_dx, axis=-1, keepdims=True)
+    above_threshold = dy_dx >= threshold
+    target_dy_dx_time = np.argmax(above_threshold, axis=-1)
+    below_threshold = ~above_threshold & (
+        np.arange(dy_dx.shape[-1]) >= target_dy_dx_time[..., np.newaxis]
+    )
+    if not np.all(np.any(below_threshold, axis=-1)):
+        raise IndexError("The slope of the square phase never falls below threshold")
+    threshold_crossing_time = np.argmax(below_threshold, axis=-1)
+    resistance_value_target_dy_dx = take(resistance_values, target_dy_dx_time)
+    resistance_value_threshold_dy_dx = take(resistance_values, threshold_crossing_time)
+    max_resistance_square = np.max(resistance_values, axis=-1)
+    max_resistance_square_time = np.argmax(resistance_values, axis=-1)
+
+    # Max resistance during the triangle phase
+    triangle_start = int(n_samples * 5.5 / 8)
+    max_resistance_triangle = np.max(periods[..., triangle_start:], axis=-1)
+    max_resistance_triangle_time = np.argmax(periods[..., triangle_start:], axis=-1)
+    # Min resistance during the first and the second half of the triangle phase
+    first_half_start = int(n_samples / 2 + 10)
+    second_half_start = int(n_samples * 3 / 4)
+    first_half = periods[..., first_half_start:second_half_start]
+    min_resistance_first_half_triangle = np.min(first_half, axis=-1)
+    min_resistance_first_half_triangle_time = np.argmin(first_half, axis=-1)
+    second_half = periods[..., second_half_start:]
+    min_resistance_second_half_triangle = np.min(second_half, axis=-1)
+    min_resistance_second_half_triangle_time = np.argmin(second_half, axis=-1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta_high = max_resistance_square - initial_resistance
+        delta_t1 = max_resistance_square - min_resistance_first_half_triangle
+        delta_t2 = min_resistance_first_half_triangle - max_resistance_triangle
+        delta_t3 = max_resistance_triangle - min_resistance_second_half_triangle
+        slope_high = (
+            (resistance_value_threshold_dy_dx - resistance_value_target_dy_dx)
+            / (threshold_crossing_time - target_dy_dx_time)
+            * SAMPLE_RATE
+        )
+        # The time of the min is relative to the start of the first half
+        slope_low = (min_resistance_first_half_triangle - max_resistance_triangle) / (
+            (min_resistance_first_half_triangle_time - max_resistance_square_time)
+            * SAMPLE_RATE
+        )
+    area_high = scipy.integrate.simpson(
+        y=periods[..., : int(n_samples / 2) - 10] - initial_resistance[..., np.newaxis],
+        x=np.arange(0, int(n_samples / 2 - 10)),
+        axis=-1,
+    )
+    triangle = periods[..., int(n_samples / 2) + 10 :]
+    x_triangle = np.arange(0, int(n_samples / 2 - 10))
+    if triangle.shape[-1] == len(x_triangle):
+        area_low = scipy.integrate.simpson(
+            y=triangle - end_resistance[..., np.newaxis], x=x_triangle, axis=-1
+        )
+    else:
+        # Periods with an odd number of samples
+        area_low = np.full(periods.shape[:-1], np.nan)
+
+    features = np.stack(
+        [
+            delta_high,
+            delta_t1,
+            delta_t2,
+            delta_t3,
+            slope_high,
+            slope_low,
+            area_high,
+            area_low,
+        ],
+        axis=-1,
+    )
+    markers = np.stack(
+        [
+            np.zeros(periods.shape[:-1]),
+            initial_resistance,
+            target_dy_dx_time * SAMPLE_RATE,
+            resistance_value_target_dy_dx,
+            threshold_crossing_time * SAMPLE_RATE,
+            resistance_value_threshold_dy_dx,
+            max_resistance_square_time * SAMPLE_RATE,
+            max_resistance_square,
+            (first_half_start + min_resistance_first_half_triangle_time) * SAMPLE_RATE,
+            min_resistance_first_half_triangle,
+            (triangle_start + max_resistance_triangle_time) * SAMPLE_RATE,
+            max_resistance_triangle,
+            (second_half_start + min_resistance_second_half_triangle_time)
+            * SAMPLE_RATE,
+            min_resistance_second_half_triangle,
+        ],
+        axis=-1,
+    )
+    return features, markers
+
+
+def take(values, indices):
+    """Return values[..., indices] for indices with one index per row."""
+    return np.take_along_axis(values, indices[..., np.newaxis], axis=-1)[..., 0]
+
+
+def period_data(response, period):
+    """
+    Return the response during a period, with shape (n_sensors, n_samples).
+
+    The last period is a copy of the previous one, as in the original
+    extraction.
+    """
+    period = min(period, SQ_TR_PERIODS - 2)
+    return response[
+        :, period * SQ_TR_PERIOD_SAMPLES : (period + 1) * SQ_TR_PERIOD_SAMPLES
+    ]
+
+
+def extract_period_features(response: np.ndarray):
+    """
+    Compute the features of all the periods of the Sq+Tr response.
+
+    The complete periods are computed at once, as a (n_sensors, n_periods,
+    SQ_TR_PERIOD_SAMPLES) array; an incomplete period at the end of the
+    recording is computed on its own. The features of missing periods are
+    NaN.
+
+    Args:
+        - response: normalized response, with shape (n_sensors, n_samples)
+
+    Returns:
+        - features, with shape (n_sensors, SQ_TR_PERIODS, len(PERIOD_FEATURES))
+        - markers, with shape (n_sensors, SQ_TR_PERIODS, len(MARKER_COLUMNS))
+        - DeltaR of each sensor, with shape (n_sensors,)
+    """
+    n_sensors, n_samples = response.shape
+    features = np.full((n_sensors, SQ_TR_PERIODS, len(PERIOD_FEATURES)), np.nan)
+    markers = np.full((n_sensors, SQ_TR_PERIODS, len(MARKER_COLUMNS)), np.nan)
+    computed = np.zeros(SQ_TR_PERIODS, dtype=bool)
+    # The last period is not computed on its own data
+    n_periods = SQ_TR_PERIODS - 1
+    n_complete = min(n_samples // SQ_TR_PERIOD_SAMPLES, n_periods)
+    if n_complete > 0:
+        periods = response[:, : n_complete * SQ_TR_PERIOD_SAMPLES].reshape(
+            n_sensors, n_complete, SQ_TR_PERIOD_SAMPLES
+        )
+        features[:, :n_complete], markers[:, :n_complete] = period_features(periods)
+        computed[:n_complete] = True
+    if n_complete < n_periods and n_samples > n_complete * SQ_TR_PERIOD_SAMPLES:
+        periods = response[:, np.newaxis, n_complete * SQ_TR_PERIOD_SAMPLES :]
+        (
+            features[:, n_complete : n_complete + 1],
+            markers[:, n_complete : n_complete + 1],
+        ) = period_features(periods)
+        computed[n_complete] = True
+    features[:, n_periods] = features[:, n_periods - 1]
+    markers[:, n_periods] = markers[:, n_periods - 1]
+    computed[n_periods] = computed[n_periods - 1]
+
+    max_resistance = MARKER_COLUMNS.index("Max Resistance")
+    first, last = DELTA_R_PERIODS
+    r_max_first = markers[:, first, max_resistance] if computed[first] else 0
+    r_max_last = markers[:, last, max_resistance] if computed[last] else 0
+    delta_r = np.broadcast_to(r_max_last - r_max_first, (n_sensors,))
+    return features, markers, delta_r
+
+
+def features_frame(features, delta_r, sensor_labels) -> pd.DataFrame:
+    """
+    Build the features frame, with one row for each sensor and period.
+    """
+    n_sensors, n_periods, _ = features.shape
+    features_df = pd.DataFrame(
+        features.reshape(n_sensors * n_periods, -1), columns=PERIOD_FEATURES
+    )
+    features_df["DeltaR"] = np.repeat(delta_r, n_periods)
+    features_df[TEMPERATURE_MODULATION_COL] = SQ_TR_COL
+    features_df["Sensor"] = np.repeat(sensor_labels, n_periods)
+    features_df["Repetition"] = np.tile(np.arange(n_periods), n_sensors)
+    return features_df
+
+
+def extract_square_tr_features(
+    data: pd.DataFrame, sensor_labels, normalization=DEFAULT_NORMALIZATION
+) -> pd.DataFrame:
+    """Return the features of the Sq+Tr response of the sensors of a recording."""
+    response = normalized_response(data, sensor_labels, normalization)
+    features, _, delta_r = extract_period_features(response)
+    return features_frame(features, delta_r, sensor_labels)
+
+
+class RunningStats:
+    """
+    Running count, mean and variance of several traces, updated with
+    blocks of samples by merging their statistics (Chan et al.).
+    """
+
+    def __init__(self, n_traces):
+        self.count = 0
+        self.mean = np.zeros(n_traces)
+        self.m2 = np.zeros(n_traces)
+
+    def update(self, values):
+        """Add samples, with shape (n_traces, n_samples)."""
+        n_samples = values.shape[1]
+        if n_samples == 0:
+            return
+        mean = values.mean(axis=1)
+        m2 = np.sum((values - mean[:, np.newaxis]) ** 2, axis=1)
+        delta = mean - self.mean
+        count = self.count + n_samples
+        self.mean = self.mean + delta * n_samples / count
+        self.m2 = self.m2 + m2 + delta**2 * self.count * n_samples / count
+        self.count = count
+
+    def std(self):
+        """Return the population standard deviation, as scipy.stats.zscore."""
+        if self.count == 0:
+            return np.full_like(self.mean, np.nan)
+        return np.sqrt(self.m2 / self.count)
+
+
+class SqTrStream:
+    """
+    Streaming extraction of the features of the Sq+Tr response, for
+    recordings too long to be loaded at once or for live data.
+
+    Samples are added in chunks of any size, down to single packets. The
+    mean resistance of the cleaning stage and the statistics of the Sq+Tr
+    response are kept as running values, and the response of the current
+    cycle is buffered until the cycle is completed, so that the memory used
+    is bounded by one cycle per sensor.
+
+    A cycle starts when the temperature modulation switches to Sq+Tr, and
+    every SQ_TR_PERIOD_SAMPLES samples after it while the modulation lasts;
+    cycles interrupted by another modulation are dropped. The repetitions
+    are counted from the start of each Sq+Tr phase.
+
+    All the features are linear in the response, so they are computed on
+    the resistance and then scaled by the normalization known at the end of
+    the cycle: the running cleaning stage mean for r_norm, the running
+    standard deviation of the Sq+Tr response for the z-score. Unlike the
+    extraction of a whole recording, which uses the statistics of all of
+    it, the features of a cycle do not depend on the samples after it.
+    DeltaR is NaN until the last of DELTA_R_PERIODS is completed.
+
+    Usage:
+
+    >>> stream = SqTrStream(["S-1", "S-2"])
+    >>> for chunk in iter_recording(csv_file, chunk_size=100000):
+    ...     features_df = stream.update(chunk)
+    """
+
+    def __init__(self, sensor_labels, normalization=DEFAULT_NORMALIZATION):
+        if normalization not in NORMALIZATIONS:
+            raise ValueError(f"Unknown normalization {normalization}")
+        self.sensor_labels = list(sensor_labels)
+        self.normalization = normalization
+        n_sensors = len(self.sensor_labels)
+        # Sum and number of the non-NaN cleaning stage resistances
+        self.cleaning_sum = np.zeros(n_sensors)
+        self.cleaning_count = np.zeros(n_sensors)
+        self.response_stats = RunningStats(n_sensors)
+        # Resistance of the cycle being filled
+        self.cycle = np.empty((n_sensors, SQ_TR_PERIOD_SAMPLES))
+        self.n_cycle_samples = 0
+        self.in_sq_tr = False
+        self.repetition = 0
+        # Max resistance of the square phase of the first of DELTA_R_PERIODS
+        self.r_max_first = None
+        self.delta_r = np.full(n_sensors, np.nan)
+
+    def baseline(self):
+        """Return the mean resistance of the cleaning stage so far."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.cleaning_sum / self.cleaning_count
+
+    def scale(self):
+        """Return the factor normalizing the response, for each sensor."""
+        scale = np.ones(len(self.sensor_labels))
+        if self.normalization in ("r_norm_zscore", "r_norm"):
+            scale = 1 / self.baseline()
+        if self.normalization in ("r_norm_zscore", "zscore"):
+            # Standard deviation of the response after the r_norm step
+            scale = scale / (self.response_stats.std() * np.abs(scale))
+        return scale
+
+    def update(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """
+        Add consecutive rows of a recording.
+
+        Returns:
+            - features of the cycles completed by the chunk, as in
+              features_frame, with one row for each cycle and sensor
+        """
+        return self.update_arrays(
+            chunk[self.sensor_labels].to_numpy(dtype=float).T,
+            chunk[STAGE_COL].to_numpy(),
+            chunk[TEMPERATURE_MODULATION_COL].to_numpy(),
+        )
+
+    def append(self, voltages, stage, modulation) -> pd.DataFrame:
+        """
+        Add a single packet, e.g. while recording.
+
+        Args:
+            - voltages: voltage of each sensor
+            - stage: stage of the measurement
+            - modulation: temperature modulation pattern
+        """
+        return self.update_arrays(
+            np.asarray(voltages, dtype=float)[:, np.newaxis],
+            np.array([stage]),
+            np.array([modulation]),
+        )
+
+    def update_arrays(self, voltages, stages, modulations) -> pd.DataFrame:
+        """
+        Add samples, with the voltages with shape (n_sensors, n_samples) and
+        the stages and modulations with shape (n_samples,).
+        """
+        resistance = 5 / voltages * 10000 - 10000
+        features = []
+        delta_r = []
+        repetitions = []
+        cleaning = stages == CLEANING_STAGE
+        sq_tr = modulations == SQ_TR_COL
+        # Runs of samples with the same stage and modulation, processed in
+        # order so that each cycle only depends on the samples before its end
+        kinds = 2 * sq_tr + cleaning
+        boundaries = np.flatnonzero(np.diff(kinds)) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [len(kinds)]))
+        for start, end in zip(starts, ends):
+            if start == end:
+                continue
+            if cleaning[start]:
+                samples = resistance[:, start:end]
+                self.cleaning_sum += np.nansum(samples, axis=1)
+                self.cleaning_count += np.sum(~np.isnan(samples), axis=1)
+            if not sq_tr[start]:
+                self.in_sq_tr = False
+                continue
+            if not self.in_sq_tr:
+                # A new Sq+Tr phase starts with a new cycle
+                self.in_sq_tr = True
+                self.n_cycle_samples = 0
+                self.repetition = 0
+                self.r_max_first = None
+                self.delta_r = np.full(len(self.sensor_labels), np.nan)
+            while start < end:
+                filled = self.n_cycle_samples
+                n_samples = min(end - start, SQ_TR_PERIOD_SAMPLES - filled)
+                samples = resistance[:, start : start + n_samples]
+                self.cycle[:, filled : filled + n_samples] = samples
+                self.response_stats.update(samples)
+                self.n_cycle_samples += n_samples
+                start += n_samples
+                if self.n_cycle_samples == SQ_TR_PERIOD_SAMPLES:
+                    features.append(self.close_cycle())
+                    delta_r.append(self.delta_r)
+                    repetitions.append(self.repetition)
+                    self.n_cycle_samples = 0
+                    self.repetition += 1
+
+        n_sensors = len(self.sensor_labels)
+        features = np.array(features).reshape(-1, n_sensors, len(PERIOD_FEATURES))
+        delta_r = np.array(delta_r).reshape(-1, n_sensors)
+        return self.cycles_frame(features, delta_r, repetitions)
+
+    def close_cycle(self):
+        """
+        Return the normalized features of the completed cycle, with shape
+        (n_sensors, len(PERIOD_FEATURES)), and update DeltaR.
+        """
+        features, markers = period_features(self.cycle)
+        scale = self.scale()
+        r_max = markers[:, MARKER_COLUMNS.index("Max Resistance")]
+        first, last = DELTA_R_PERIODS
+        if self.repetition == first:
+            self.r_max_first = r_max
+        elif self.repetition == last and self.r_max_first is not None:
+            self.delta_r = (r_max - self.r_max_first) * scale
+        return features * scale[:, np.newaxis]
+
+    def cycles_frame(self, features, delta_r, repetitions) -> pd.DataFrame:
+        """
+        Build the features frame, with one row for each cycle and sensor,
+        from the features with shape (n_cycles, n_sensors, n_features) and
+        DeltaR with shape (n_cycles, n_sensors).
+        """
+        n_cycles, n_sensors, n_features = features.shape
+        features_df = pd.DataFrame(
+            features.reshape(n_cycles * n_sensors, n_features),
+            columns=PERIOD_FEATURES,
+        )
+        features_df["DeltaR"] = delta_r.reshape(-1)
+        features_df[TEMPERATURE_MODULATION_COL] = SQ_TR_COL
+        features_df["Sensor"] = np.tile(self.sensor_labels, n_cycles)
+        features_df["Repetition"] = np.repeat(
+            np.array(repetitions, dtype=int), n_sensors
+        )
+        return features_df
+
+
+def stream_recording_features(
+    file: Path, sensor_labels, normalization, chunk_size: int
+) -> Optional[pd.DataFrame]:
+    """
+    Return the features of each completed Sq+Tr cycle of a recording, read in
+    chunks of chunk_size rows, or None if it has none.
+    """
+    stream = SqTrStream(sensor_labels, normalization)
+    columns = list(sensor_labels) + [STAGE_COL, TEMPERATURE_MODULATION_COL]
+    features_list = []
+    for chunk in iter_recording(file, chunk_size, columns=columns):
+        cycles_features = stream.update(chunk)
+        if not cycles_features.empty:
+            features_list.append(cycles_features)
+    if not features_list:
+        return None
+    return pd.concat(features_list, ignore_index=True)
+
+
+def sq_tr_pattern():
+    """Return the heater voltage of a Sq+Tr period, sampled as the response."""
+    square_values = [0]
+    square_values = np.append(
+        square_values, np.ones(int(SQ_TR_PERIOD_SAMPLES / 2) - 2) * 5
+    )
+    square_values = np.append(square_values, [0])
+    square_values = np.append(square_values, [0.02 * x for x in range(250)])
+    square_values = np.append(square_values, [5 - 0.02 * x for x in range(250)])
+    return square_values
+
+
+def plot_period(period_values, markers, files):
+    """
+    Plot the response during a period, with the points used to compute its
+    features, and save it to files.
+    """
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots()
+    x_values = np.linspace(0, SQ_TR_PERIOD_SECONDS, SQ_TR_PERIOD_SAMPLES)
+    ax2 = ax.twinx()
+    ax.plot(x_values, period_values, "-", label="Sensor data")
+    ax2.plot(x_values, sq_tr_pattern(), c="orange", alpha=0.7, label="SqTr")
+    ax.set_xlabel("Time [s]")
+    ax.set_ylabel("Normalized resistance")
+    ax2.set_ylabel("Heater voltage [V]")
+    colors = ["red", "pink", "magenta", "black", "tab:green", "orange", "tab:blue"]
+    for index, color in enumerate(colors):
+        ax.plot(markers[2 * index], markers[2 * index + 1], "o", c=color)
+    for file in files:
+        fig.savefig(file, dpi=300, bbox_inches="tight")
+    plt.close(fig)
+
+
+def plot_response(response_values, files):
+    """Plot the response during the periods 1 to 5, and save it to files."""
+    import matplotlib.pyplot as plt
+
+    x_values = np.linspace(
+        0, 5 * SQ_TR_PERIOD_SECONDS, int(5 * SQ_TR_PERIOD_SECONDS / SAMPLE_RATE)
+    )
+    fig = plt.figure()
+    plt.plot(
+        x_values,
+        response_values[SQ_TR_PERIOD_SAMPLES : 6 * SQ_TR_PERIOD_SAMPLES],
+    )
+    plt.xlabel("Time [s]")
+    plt.ylabel("Normalized resistance")
+    for file in files:
+        fig.savefig(file, dpi=300, bbox_inches="tight")
+    plt.close(fig)
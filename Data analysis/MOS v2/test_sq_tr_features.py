@@ -0,0 +1,119 @@
+"""
+Tests of the streaming extraction of the Sq+Tr features.
+
+Run with:
+
+>>> python -m pytest "Data analysis/MOS v2"
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sq_tr_features
+from sq_tr_features import (
+    CLEANING_STAGE,
+    SQ_TR_COL,
+    SQ_TR_PERIOD_SAMPLES,
+    STAGE_COL,
+    TEMPERATURE_MODULATION_COL,
+)
+
+SENSOR_LABELS = ["S-1", "S-2", "S-3"]
+
+
+def session(n_cleaning, n_cycles, baseline, rng):
+    """Return a cleaning stage followed by a Sq+Tr phase of n_cycles."""
+    n_sq_tr = n_cycles * SQ_TR_PERIOD_SAMPLES
+    t = np.arange(n_sq_tr) % SQ_TR_PERIOD_SAMPLES
+    half = SQ_TR_PERIOD_SAMPLES // 2
+    square = np.where(t < half, 1 - np.exp(-t / 40), np.exp(-(t - half) / 60))
+    triangle = np.where(t >= half, np.abs(t - 1.5 * half) / (half / 2), 0) * 0.3
+    columns = {}
+    for index, label in enumerate(SENSOR_LABELS):
+        base = baseline * (1 + index / 10)
+        noise = 0.01 * rng.standard_normal(n_cleaning + n_sq_tr)
+        response = np.concatenate((np.zeros(n_cleaning), 0.5 * square + triangle))
+        resistance = base * (1 + response + noise)
+        columns[label] = 5 * 10000 / (resistance + 10000)
+    data = pd.DataFrame(columns)
+    data[STAGE_COL] = [CLEANING_STAGE] * n_cleaning + ["Measure"] * n_sq_tr
+    data[TEMPERATURE_MODULATION_COL] = ["Const"] * n_cleaning + [SQ_TR_COL] * n_sq_tr
+    return data
+
+
+@pytest.fixture
+def recording():
+    """Two sessions, the second cleaning stage at a different baseline."""
+    rng = np.random.default_rng(0)
+    return pd.concat(
+        [session(2000, 11, 20000, rng), session(2000, 11, 30000, rng)],
+        ignore_index=True,
+    )
+
+
+def stream_features(recording, normalization, chunk_size):
+    stream = sq_tr_features.SqTrStream(SENSOR_LABELS, normalization)
+    return pd.concat(
+        [
+            stream.update(recording.iloc[start : start + chunk_size])
+            for start in range(0, len(recording), chunk_size)
+        ],
+        ignore_index=True,
+    )
+
+
+@pytest.mark.parametrize("normalization", sq_tr_features.NORMALIZATIONS)
+@pytest.mark.parametrize("chunk_size", [333, 777, 1000, 2500])
+def test_stream_does_not_depend_on_chunk_size(recording, normalization, chunk_size):
+    expected = stream_features(recording, normalization, len(recording))
+    features = stream_features(recording, normalization, chunk_size)
+    pd.testing.assert_frame_equal(features, expected)
+
+
+def test_packets_match_chunks(recording):
+    recording = recording.iloc[: 2000 + 2 * SQ_TR_PERIOD_SAMPLES]
+    stream = sq_tr_features.SqTrStream(SENSOR_LABELS)
+    voltages = recording[SENSOR_LABELS].to_numpy()
+    stages = recording[STAGE_COL].to_numpy()
+    modulations = recording[TEMPERATURE_MODULATION_COL].to_numpy()
+    features = pd.concat(
+        [
+            stream.append(voltages[index], stages[index], modulations[index])
+            for index in range(len(recording))
+        ],
+        ignore_index=True,
+    )
+    expected = stream_features(recording, sq_tr_features.DEFAULT_NORMALIZATION, 1000)
+    pd.testing.assert_frame_equal(features, expected)
+
+
+def test_delta_r_is_reset_by_each_phase(recording):
+    features = stream_features(recording, "zscore", len(recording))
+    # Each phase has 11 cycles, DeltaR is known from the last one
+    assert len(features) == 2 * 11 * len(SENSOR_LABELS)
+    first, last = sq_tr_features.DELTA_R_PERIODS
+    known = features["Repetition"] >= last
+    assert features.loc[known, "DeltaR"].notna().all()
+    assert features.loc[~known, "DeltaR"].isna().all()
+
+
+def test_stream_matches_whole_recording_with_r_norm(recording):
+    # With a single session, the cleaning stage mean is known before any cycle
+    first_session = recording.iloc[: 2000 + 11 * SQ_TR_PERIOD_SAMPLES]
+    features = stream_features(first_session, "r_norm", 1000)
+    expected = sq_tr_features.extract_square_tr_features(
+        first_session, SENSOR_LABELS, "r_norm"
+    )
+    expected = expected[expected["Repetition"] < sq_tr_features.SQ_TR_PERIODS - 1]
+    features = features.sort_values(["Sensor", "Repetition"], ignore_index=True)
+    expected = expected.reset_index(drop=True)
+    columns = sq_tr_features.PERIOD_FEATURES
+    np.testing.assert_allclose(
+        features[columns].to_numpy(), expected[columns].to_numpy(), rtol=1e-9
+    )
+    # DeltaR is only known by the stream from its last period
+    last = features["Repetition"] == sq_tr_features.DELTA_R_PERIODS[1]
+    np.testing.assert_allclose(
+        features.loc[last, "DeltaR"], expected.loc[last, "DeltaR"], rtol=1e-9
+    )
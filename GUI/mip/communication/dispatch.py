@@ -0,0 +1,358 @@
+"""
+Dispatch of the data received from the board to its consumers.
+
+The serial read thread only decodes the packets and pushes them
+into bounded queues. Consumer threads then pass them to the
+registered callbacks, so that a slow consumer (e.g. the data
+exporter) cannot delay the reading of data from the serial port.
+"""
+from collections import deque
+import threading
+import time
+
+from kivy.clock import Clock
+from kivy.event import EventDispatcher
+from kivy.properties import NumericProperty
+from loguru import logger
+
+from mip.communication.packets import DataPacket, DataPacketPool
+
+#############################################
+#                 Constants                 #
+#############################################
+
+OVERFLOW_BLOCK = "block"
+"""
+Overflow policy: the producer waits until there is room in the queue.
+"""
+
+OVERFLOW_DROP_OLDEST = "drop oldest"
+"""
+Overflow policy: the oldest batch in the queue is dropped and counted.
+"""
+
+OVERFLOW_DROP_NEWEST = "drop newest"
+"""
+Overflow policy: the new batch is dropped and counted.
+"""
+
+DEFAULT_QUEUE_SIZE = 256
+"""
+Default maximum number of batches waiting in each queue.
+"""
+
+STATISTICS_UPDATE_INTERVAL = 0.5
+"""
+Interval, in seconds, between updates of the queue statistics properties.
+"""
+
+
+class BatchQueue:
+    """
+    Bounded single-producer single-consumer queue.
+
+    The queue is built on top of a deque, whose append and popleft
+    operations are atomic, so that no lock is needed when data are
+    exchanged between the producer and the consumer thread. Events
+    are only used to wait when the queue is empty or full.
+
+    As with queue.Queue, the consumer calls task_done after handling
+    each item, so that the queue knows when all the items put in it
+    have been handled, and not only removed.
+    """
+
+    def __init__(
+        self, max_size=DEFAULT_QUEUE_SIZE, overflow_policy=OVERFLOW_DROP_OLDEST
+    ):
+        if overflow_policy not in (
+            OVERFLOW_BLOCK,
+            OVERFLOW_DROP_OLDEST,
+            OVERFLOW_DROP_NEWEST,
+        ):
+            raise ValueError(f"{overflow_policy} is not a valid overflow policy")
+        self.max_size = max_size
+        self.overflow_policy = overflow_policy
+        self.items = deque()
+        self.not_empty = threading.Event()
+        self.not_full = threading.Event()
+        self.not_full.set()
+        self.closed = False
+        self.unfinished_lock = threading.Lock()
+        self.unfinished_tasks = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item):
+        """
+        Append an item to the queue, applying the overflow policy.
+
+        Args:
+            - item: the item to be appended
+
+        Returns:
+            - the item that was dropped because the queue was full,
+              None if no item was dropped
+        """
+        dropped = None
+        items = self.items
+        if len(items) >= self.max_size:
+            if self.overflow_policy == OVERFLOW_BLOCK:
+                while len(items) >= self.max_size and not self.closed:
+                    self.not_full.clear()
+                    if len(items) >= self.max_size:
+                        self.not_full.wait(0.1)
+            elif self.overflow_policy == OVERFLOW_DROP_OLDEST:
+                try:
+                    dropped = items.popleft()
+                except IndexError:
+                    pass
+            else:
+                return item
+        if dropped is None:
+            # A dropped item is replaced, so the count does not change
+            with self.unfinished_lock:
+                self.unfinished_tasks += 1
+        items.append(item)
+        self.not_empty.set()
+        return dropped
+
+    def get(self, timeout=None):
+        """
+        Remove and return the oldest item in the queue.
+
+        Args:
+            - timeout: maximum time to wait for an item, in seconds
+
+        Returns:
+            - the oldest item, None if the queue was still empty
+              after the timeout
+        """
+        items = self.items
+        while True:
+            try:
+                item = items.popleft()
+                self.not_full.set()
+                return item
+            except IndexError:
+                self.not_empty.clear()
+                # An item may have been appended before clearing the event
+                if len(items) == 0 and not self.not_empty.wait(timeout):
+                    return None
+
+    def task_done(self):
+        """
+        Mark an item returned by get as handled.
+        """
+        with self.unfinished_lock:
+            self.unfinished_tasks -= 1
+
+    def is_done(self):
+        """
+        Return True if all the items put in the queue were handled.
+        """
+        return self.unfinished_tasks == 0
+
+    def close(self):
+        """
+        Wake up a producer waiting for room in the queue.
+        """
+        self.closed = True
+        self.not_full.set()
+
+
+class ConsumerWorker(threading.Thread):
+    """
+    Thread passing the batches received from its queue to its callbacks.
+
+    Batch callbacks receive the whole NumPy structured array decoded by
+    the read thread, while packet callbacks receive one DataPacket for
+    each row of the array.
+    """
+
+    def __init__(
+        self,
+        name,
+        max_queue_size=DEFAULT_QUEUE_SIZE,
+        overflow_policy=OVERFLOW_DROP_OLDEST,
+    ):
+        super(ConsumerWorker, self).__init__(name=name, daemon=True)
+        self.queue = BatchQueue(max_queue_size, overflow_policy)
+        self.batch_callbacks = []
+        self.packet_callbacks = []
+        self.packet_pool = None
+        self.dropped_packets = 0
+        self.running = True
+
+    def has_callbacks(self):
+        return len(self.batch_callbacks) > 0 or len(self.packet_callbacks) > 0
+
+    def push(self, packets):
+        """
+        Append a batch of packets to the queue of the worker.
+        """
+        dropped = self.queue.put(packets)
+        if dropped is not None:
+            self.dropped_packets += len(dropped)
+
+    def run(self):
+        while self.running:
+            packets = self.queue.get(timeout=0.1)
+            if packets is None:
+                continue
+            try:
+                self.consume(packets)
+            except Exception:
+                logger.exception(f"Error while consuming packets in {self.name}")
+            finally:
+                self.queue.task_done()
+
+    def consume(self, packets):
+        for callback in self.batch_callbacks:
+            callback(packets)
+        if self.packet_callbacks:
+            pool = self.packet_pool
+            for counter, temp, hum, press, res in packets.tolist():
+                if pool is None:
+                    packet = DataPacket(counter, temp, hum, press, *res)
+                else:
+                    packet = pool.acquire(counter, temp, hum, press, res)
+                for callback in self.packet_callbacks:
+                    callback(packet)
+                if pool is not None:
+                    pool.release(packet)
+
+    def is_idle(self):
+        return self.queue.is_done()
+
+    def stop(self):
+        self.running = False
+        self.queue.close()
+
+
+class PacketDispatcher(EventDispatcher):
+    """
+    Fan out the packets decoded by the read thread to consumer threads.
+
+    Each callback is assigned to one consumer worker. Callbacks on the
+    same worker are called in order, while callbacks on different
+    workers run concurrently, so that a slow callback only delays the
+    other callbacks on its own worker.
+
+    Usage:
+
+    >>> dispatcher = PacketDispatcher(n_workers=2)
+    >>> dispatcher.add_callback(graph_manager.update_plots, worker=0)
+    >>> dispatcher.add_callback(exporter.add_packet, worker=1)
+    >>> dispatcher.dispatch(decode_data_packets(data_block))
+    """
+
+    queue_depth = NumericProperty(0)
+    """
+    NumericProperty holding the number of batches waiting in the
+    fullest consumer queue.
+    """
+
+    dropped_packets = NumericProperty(0)
+    """
+    NumericProperty holding the total number of packets dropped
+    because a consumer queue was full.
+    """
+
+    def __init__(
+        self,
+        n_workers=2,
+        max_queue_size=DEFAULT_QUEUE_SIZE,
+        overflow_policy=OVERFLOW_DROP_OLDEST,
+        **kwargs,
+    ):
+        super(PacketDispatcher, self).__init__(**kwargs)
+        self.workers = [
+            ConsumerWorker(f"ConsumerWorker-{idx}", max_queue_size, overflow_policy)
+            for idx in range(max(1, n_workers))
+        ]
+        for worker in self.workers:
+            worker.start()
+        self.statistics_event = Clock.schedule_interval(
+            self.update_statistics, STATISTICS_UPDATE_INTERVAL
+        )
+
+    def get_worker(self, worker):
+        # Wrap around, so that callbacks can be assigned to a given
+        # worker index regardless of the number of workers
+        return self.workers[worker % len(self.workers)]
+
+    def add_callback(self, callback, worker=0):
+        """
+        Add a callback receiving one DataPacket at a time.
+
+        Args:
+            - callback: the callback to be added
+            - worker: index of the consumer worker calling the callback
+        """
+        callbacks = self.get_worker(worker).packet_callbacks
+        if callback not in callbacks:
+            callbacks.append(callback)
+
+    def add_batch_callback(self, callback, worker=0):
+        """
+        Add a callback receiving whole blocks of decoded packets.
+
+        Args:
+            - callback: the callback to be added
+            - worker: index of the consumer worker calling the callback
+        """
+        callbacks = self.get_worker(worker).batch_callbacks
+        if callback not in callbacks:
+            callbacks.append(callback)
+
+    def dispatch(self, packets):
+        """
+        Push a block of decoded packets to all the workers with callbacks.
+
+        Args:
+            - packets: structured array of decoded packets
+        """
+        for worker in self.workers:
+            if worker.has_callbacks():
+                worker.push(packets)
+
+    def enable_packet_pool(self, max_size=64):
+        for worker in self.workers:
+            worker.packet_pool = DataPacketPool(max_size=max_size)
+
+    def disable_packet_pool(self):
+        for worker in self.workers:
+            worker.packet_pool = None
+
+    def wait_until_empty(self, timeout=1.0):
+        """
+        Wait until all the queued packets have been consumed.
+
+        Args:
+            - timeout: maximum waiting time, in seconds
+
+        Returns:
+            - True if all the queues were emptied, False otherwise
+        """
+        deadline = time.monotonic() + timeout
+        while not all(worker.is_idle() for worker in self.workers):
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def pending_batches(self):
+        """
+        Return the number of batches not yet consumed by all the workers.
+        """
+        return sum(worker.queue.unfinished_tasks for worker in self.workers)
+
+    def update_statistics(self, *args):
+        self.queue_depth = max(len(worker.queue) for worker in self.workers)
+        self.dropped_packets = sum(worker.dropped_packets for worker in self.workers)
+
+    def stop(self):
+        self.statistics_event.cancel()
+        for worker in self.workers:
+            worker.stop()
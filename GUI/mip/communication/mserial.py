@@ -1,13 +1,34 @@
 from datetime import datetime
 import serial
 import serial.tools.list_ports as list_ports
-import struct
 import threading
 from kivy.properties import NumericProperty, BooleanProperty, StringProperty
 from kivy.event import EventDispatcher
 import time
 from loguru import logger
 from mip.export.csv_exporter import CSVExporter
+from mip.export.journal import JournalWriter
+from mip.communication.dispatch import (
+    PacketDispatcher,
+    DEFAULT_QUEUE_SIZE,
+    OVERFLOW_DROP_OLDEST,
+)
+from mip.communication.packets import (
+    DATA_PACKET_HEADER,
+    DATA_PACKET_TAIL,
+    BME_CONF_PACKET_HEADER,
+    BME_CONF_PACKET_TAIL,
+    DATA_PACKET_SIZE,
+    BME_CONF_PACKET_SIZE,
+    DATA_PACKET_STRUCT,
+    DATA_PACKET_DTYPE,
+    DECODED_PACKET_DTYPE,
+    BME_CONF_PACKET_STRUCT,
+    PacketFramer,
+    decode_data_packets,
+    DataPacket,
+    DataPacketPool,
+)
 from sys import platform
 
 #############################################
@@ -29,6 +50,16 @@ BOARD_CONNECTED = 2
 Board connected status.
 """
 
+DEFAULT_WORKER = 0
+"""
+Consumer worker calling the GUI callbacks.
+"""
+
+EXPORT_WORKER = 1
+"""
+Consumer worker calling the data exporter.
+"""
+
 START_STREAMING_CMD = "a"
 """
 Command to start streaming data.
@@ -74,26 +105,6 @@ TM_5V_CMD = "O"
 TM_0V_CMD = "o"
 
 
-"""!
-@brief Data packet header byte.
-"""
-DATA_PACKET_HEADER = 0xAA
-
-"""!
-@brief Data packet tail byte.
-"""
-DATA_PACKET_TAIL = 0xF0
-
-"""!
-@brief BME Configuration header byte.
-"""
-BME_CONF_PACKET_HEADER = 0xBB
-
-"""!
-@brief DBME Configuration tail byte.
-"""
-BME_CONF_PACKET_TAIL = 0xB0
-
 """!
 @brief BME Configuration header byte.
 """
@@ -168,19 +179,49 @@ class MIPSerial(EventDispatcher, metaclass=Singleton):
 
     save_data = BooleanProperty()
 
-    def __init__(self, baudrate=115200):
+    dispatch_queue_depth = NumericProperty(defaultvalue=0)
+    """
+    NumericProperty holding the number of data blocks waiting
+    to be consumed in the fullest consumer queue.
+    """
+
+    dropped_packets = NumericProperty(defaultvalue=0)
+    """
+    NumericProperty holding the number of packets dropped
+    because a consumer could not keep up with the data rate.
+    """
+
+    def __init__(
+        self,
+        baudrate=115200,
+        n_workers=2,
+        max_queue_size=DEFAULT_QUEUE_SIZE,
+        overflow_policy=OVERFLOW_DROP_OLDEST,
+        auto_connect=True,
+        port_name=None,
+    ):
         self.port_name = ""
+        self.requested_port_name = port_name
         self.baudrate = baudrate
-        self.read_state = 0
-        self.packet_type = ""
+        self.framer = PacketFramer()
         self.received_packet_time = 0
         self.samples_read = 0
-        self.callbacks = []
+        self.dispatcher = PacketDispatcher(
+            n_workers=n_workers,
+            max_queue_size=max_queue_size,
+            overflow_policy=overflow_policy,
+        )
+        self.dispatcher.bind(queue_depth=self.setter("dispatch_queue_depth"))
+        self.dispatcher.bind(dropped_packets=self.setter("dropped_packets"))
+
+        self.journal_dir = None
+        self.journal = None
 
         self.configure_exporter()
 
-        find_port_thread = threading.Thread(target=self.find_port, daemon=True)
-        find_port_thread.start()
+        if auto_connect:
+            find_port_thread = threading.Thread(target=self.find_port, daemon=True)
+            find_port_thread.start()
 
     def configure_exporter(self):
         self.exporter = CSVExporter()
@@ -209,19 +250,78 @@ class MIPSerial(EventDispatcher, metaclass=Singleton):
                 "temperature_modulation"
             )
         )
-        self.add_callback(self.exporter.add_packet)
+        self.add_batch_callback(self.exporter.add_packets, worker=EXPORT_WORKER)
 
-    def add_callback(self, callback):
+    def add_callback(self, callback, worker=DEFAULT_WORKER):
         """
         Append callback to the list of callbacks that
         are called upon the complete reception of a
         data packet from the device.
 
+        Callbacks are called by a consumer worker thread,
+        not by the thread reading from the serial port.
+
         Args:
             callback: the callback to be appended to the list
+            worker: index of the consumer worker calling the callback
+        """
+        self.dispatcher.add_callback(callback, worker)
+
+    def add_batch_callback(self, callback, worker=DEFAULT_WORKER):
         """
-        if callback not in self.callbacks:
-            self.callbacks.append(callback)
+        Append callback to the list of callbacks that
+        are called with every block of data packets
+        received from the device.
+
+        The callback receives a NumPy structured array with
+        DECODED_PACKET_DTYPE, holding one row per packet.
+
+        Args:
+            callback: the callback to be appended to the list
+            worker: index of the consumer worker calling the callback
+        """
+        self.dispatcher.add_batch_callback(callback, worker)
+
+    def enable_packet_pool(self, max_size=64):
+        """
+        Recycle the packets sent to the receiver callbacks.
+
+        When enabled, the same DataPacket objects are reused for
+        the following packets once all the callbacks have returned.
+        Callbacks that keep a reference to a packet must store
+        packet.copy() instead.
+
+        Args:
+            max_size: maximum number of packets kept in each pool
+        """
+        self.dispatcher.enable_packet_pool(max_size=max_size)
+
+    def disable_packet_pool(self):
+        """
+        Allocate a new packet for every sample received.
+        """
+        self.dispatcher.disable_packet_pool()
+
+    def enable_journal(self, journal_dir):
+        """
+        Journal the raw bytes received from the board.
+
+        From the next streaming session on, all the bytes read from
+        the serial port are appended, with their reception time, to
+        a journal in the given folder. Journals can be read back with
+        mip.export.journal.JournalReader, and replayed through the
+        receiver callbacks with mip.communication.replay.
+
+        Args:
+            journal_dir: folder in which journal sessions are stored
+        """
+        self.journal_dir = journal_dir
+
+    def disable_journal(self):
+        """
+        Stop journaling the raw bytes received from the board.
+        """
+        self.journal_dir = None
 
     def find_port(self):
         """!
@@ -233,11 +333,14 @@ class MIPSerial(EventDispatcher, metaclass=Singleton):
         """
         mip_port_found = False
         while not mip_port_found:
-            ports = list_ports.comports()
-            for port in ports:
-                mip_port_found = self.check_mip_port(port.device)
+            if self.requested_port_name is not None:
+                port_names = [self.requested_port_name]
+            else:
+                port_names = [port.device for port in list_ports.comports()]
+            for port_name in port_names:
+                mip_port_found = self.check_mip_port(port_name)
                 if mip_port_found:
-                    self.port_name = port.device
+                    self.port_name = port_name
                     if self.connect() == 0:
                         break
                     else:
@@ -256,7 +359,7 @@ class MIPSerial(EventDispatcher, metaclass=Singleton):
         logger.debug("Checking: {}".format(port_name))
         time.sleep(2)
         try:
-            port = serial.Serial(port=port_name, baudrate=self.baudrate)
+            port = serial.serial_for_url(port_name, baudrate=self.baudrate)
             if port.is_open:
                 port.write(CONN_REQUEST_CMD.encode("utf-8"))
                 time.sleep(2)
@@ -278,7 +381,9 @@ class MIPSerial(EventDispatcher, metaclass=Singleton):
     def connect(self):
         for i in range(5):
             try:
-                self.port = serial.Serial(port=self.port_name, baudrate=self.baudrate)
+                self.port = serial.serial_for_url(
+                    self.port_name, baudrate=self.baudrate
+                )
                 if self.port.isOpen():
                     logger.debug("Device connected")
                     self.connected = BOARD_CONNECTED
@@ -313,6 +418,10 @@ class MIPSerial(EventDispatcher, metaclass=Singleton):
             self.temp_rh_samples_read = 0
             self.data_sample_rate = "0.00"
             self.temperature_sample_rate = "0.00"
+            if self.journal_dir is not None:
+                journal = JournalWriter(self.journal_dir)
+                journal.open()
+                self.journal = journal
             try:
                 self.port.write(START_STREAMING_CMD.encode("utf-8"))
                 logger.debug("Starting data streaming")
@@ -332,128 +441,90 @@ class MIPSerial(EventDispatcher, metaclass=Singleton):
             try:
                 self.port.write(STOP_STREAMING_CMD.encode("utf-8"))
                 logger.debug("Stopping data streaming")
+                # Let the consumers handle the packets already received
+                if not self.dispatcher.wait_until_empty():
+                    # The exporter closes its session below and drops
+                    # the batches that are still in the queues
+                    logger.warning(
+                        f"{self.dispatcher.pending_batches()} batches of packets "
+                        "were not consumed before the end of the stream"
+                    )
                 self.is_streaming = False
-                self.read_state = 0
+                self.framer.reset()
+                self.close_journal()
             except:
                 logger.critical("Could not write command to board")
         else:
             logger.critical("Board is not connected")
 
+    def close_journal(self):
+        journal = self.journal
+        self.journal = None
+        if journal is not None:
+            journal.close()
+
     def read_data(self):
+        """
+        Read and parse data from the serial port.
+
+        All the bytes available on the port are drained with a single
+        read, and then processed in one pass.
+        """
         while self.connected == BOARD_CONNECTED:
-            if self.port.in_waiting > 0:
-                # READ STATE 0
-                if self.read_state == 0:
-                    b = self.port.read(1)
-                    # Header byte
-                    b = struct.unpack("B", b)[0]
-                    if b == DATA_PACKET_HEADER or b == BME_CONF_PACKET_HEADER:
-                        self.read_state = 1
-                        if b == BME_CONF_PACKET_HEADER:
-                            self.packet_type = "bme conf"
-                        else:
-                            self.packet_type = "data"
-                # READ STATE 1
-                elif self.read_state == 1:
-                    if self.packet_type == "data":
-                        # Packet counter
-                        packet_counter = self.port.read(1)
-                        packet_counter = struct.unpack("B", packet_counter)[0]
-                    elif self.packet_type == "bme conf":
-                        # Configurations from BME280
-                        bme280_settings = self.port.read(5)
-                        bme280_settings = struct.unpack("5B", bme280_settings)
-                        self.bme280_humidity_oversampling = (
-                            self.get_bme280_oversampling_conf_value(bme280_settings[0])
-                        )
-                        self.bme280_temperature_oversampling = (
-                            self.get_bme280_oversampling_conf_value(bme280_settings[1])
-                        )
-                        self.bme280_pressure_oversampling = (
-                            self.get_bme280_oversampling_conf_value(bme280_settings[2])
-                        )
-                        self.bme280_standby_time = (
-                            self.get_bme280_standby_time_conf_value(bme280_settings[3])
-                        )
-                        self.bme280_iir_filter = self.get_bme280_iir_filter_conf_value(
-                            bme280_settings[4]
-                        )
-                    self.read_state = 2
-                # READ STATE 2
-                elif self.read_state == 2:
-                    if self.packet_type == "data":
-                        # Resistance bytes
-                        resistance_bytes = self.port.read(32)
-
-                        # Unpack bytes
-                        s_1 = struct.unpack("4B", resistance_bytes[:4])
-                        s_2 = struct.unpack("4B", resistance_bytes[4:8])
-                        s_3 = struct.unpack("4B", resistance_bytes[8:12])
-                        s_4 = struct.unpack("4B", resistance_bytes[12:16])
-                        s_5 = struct.unpack("4B", resistance_bytes[16:20])
-                        s_6 = struct.unpack("4B", resistance_bytes[20:24])
-                        s_7 = struct.unpack("4B", resistance_bytes[24:28])
-                        s_8 = struct.unpack("4B", resistance_bytes[28:32])
-
-                        # Convert resistance
-                        res_s_1 = self.convert_voltage(s_1)
-                        res_s_2 = self.convert_voltage(s_2)
-                        res_s_3 = self.convert_voltage(s_3)
-                        res_s_4 = self.convert_voltage(s_4)
-                        res_s_5 = self.convert_voltage(s_5)
-                        res_s_6 = self.convert_voltage(s_6)
-                        res_s_7 = self.convert_voltage(s_7)
-                        res_s_8 = self.convert_voltage(s_8)
-                        self.read_state = 3
-                    elif self.packet_type == "bme conf":
-                        end_byte = self.port.read(1)
-                        end_byte = struct.unpack("1B", end_byte)[0]
-                        if end_byte == BME_CONF_PACKET_TAIL:
-                            self.read_state = 0
-                elif self.read_state == 3:
-                    # Temperature and humidity
-
-                    pressure_raw = self.port.read(4)
-                    temperature_raw = self.port.read(4)
-                    humidity_raw = self.port.read(4)
-
-                    temperature_raw = struct.unpack("4B", temperature_raw)
-                    humidity_raw = struct.unpack("4B", humidity_raw)
-                    pressure_raw = struct.unpack("4B", pressure_raw)
-
-                    temperature = self.convert_temperature(temperature_raw)
-                    humidity = self.convert_humidity(humidity_raw)
-                    pressure = self.convert_pressure(pressure_raw)
-                    self.read_state = 4
-                elif self.read_state == 4:
-                    end_byte = self.port.read(1)
-                    end_byte = struct.unpack("B", end_byte)[0]
-                    if end_byte == DATA_PACKET_TAIL:
-                        # Check CRC
-                        self.read_state = 0
-                        self.samples_read += 1
-                        self.update_computed_sample_rate()
-                        # Create packet and send it to the receiver callbacks
-                        packet = DataPacket(
-                            temperature=temperature,
-                            humidity=humidity,
-                            pressure=pressure,
-                            s_1=res_s_1,
-                            s_2=res_s_2,
-                            s_3=res_s_3,
-                            s_4=res_s_4,
-                            s_5=res_s_5,
-                            s_6=res_s_6,
-                            s_7=res_s_7,
-                            s_8=res_s_8,
-                            packet_counter=packet_counter,
-                        )
-                        for callback in self.callbacks:
-                            callback(packet)
-                    else:
-                        logger.critical("Skipped one packet")
-                        self.read_state = 0
-            time.sleep(0.001)
+            bytes_waiting = self.port.in_waiting
+            if bytes_waiting > 0:
+                data = self.port.read(bytes_waiting)
+                journal = self.journal
+                if journal is not None:
+                    journal.write(data)
+                self.process_data(data)
+            else:
+                time.sleep(0.001)
+
+    def process_data(self, data):
+        """
+        Parse a chunk of raw bytes received from the board.
+
+        Every complete packet is decoded in one pass and handed over
+        to the consumer workers, which call the receiver callbacks
+        in their own threads.
+
+        Args:
+            - data: bytes received from the board
+        """
+        data_block, conf_packets = self.framer.feed(data)
+        for conf_packet in conf_packets:
+            self.parse_bme280_configuration(conf_packet)
+        if len(data_block) == 0:
+            return
+        packets = decode_data_packets(data_block)
+        self.update_computed_sample_rate(len(packets))
+        # Hand the block over to the consumer workers
+        self.dispatcher.dispatch(packets)
+
+    def parse_bme280_configuration(self, conf_packet):
+        """
+        Update BME280 settings from a configuration packet.
+
+        Args:
+            - conf_packet: complete BME configuration packet
+        """
+        bme280_settings = BME_CONF_PACKET_STRUCT.unpack(conf_packet)[1:6]
+        self.bme280_humidity_oversampling = self.get_bme280_oversampling_conf_value(
+            bme280_settings[0]
+        )
+        self.bme280_temperature_oversampling = self.get_bme280_oversampling_conf_value(
+            bme280_settings[1]
+        )
+        self.bme280_pressure_oversampling = self.get_bme280_oversampling_conf_value(
+            bme280_settings[2]
+        )
+        self.bme280_standby_time = self.get_bme280_standby_time_conf_value(
+            bme280_settings[3]
+        )
+        self.bme280_iir_filter = self.get_bme280_iir_filter_conf_value(
+            bme280_settings[4]
+        )
 
     def compute_num_samples_sample_rate(self, sample_rate):
         """
@@ -469,14 +540,17 @@ class MIPSerial(EventDispatcher, metaclass=Singleton):
         frequency = sample_rate.split(" ")[0]
         self.sample_rate_num_samples = int(frequency)
 
-    def update_computed_sample_rate(self):
+    def update_computed_sample_rate(self, n_samples=1):
         # Compute overall data sample rate
-        if self.samples_read == 1:
+        previous_samples_read = self.samples_read
+        self.samples_read += n_samples
+        if previous_samples_read == 0:
             self.received_packet_time = datetime.now()
-        if self.samples_read > 0 and self.samples_read % 10 == 0:
+        if self.samples_read // 10 > previous_samples_read // 10:
             curr_time = datetime.now()
             diff = curr_time - self.received_packet_time
-            self.data_sample_rate = (self.samples_read) / diff.total_seconds()
+            if diff.total_seconds() > 0:
+                self.data_sample_rate = (self.samples_read) / diff.total_seconds()
 
     def retrieve_bme280_configuration(self):
         """
@@ -750,57 +824,3 @@ class MIPSerial(EventDispatcher, metaclass=Singleton):
         assert isinstance(voltage, tuple)
         voltage_v = voltage[0] << 24 | voltage[1] << 16 | voltage[2] << 8 | voltage[3]
         return (voltage_v / pow(2, 16)) * 5
-
-
-class DataPacket:
-    """Data packet holding data received from board."""
-
-    def __init__(
-        self,
-        packet_counter=0,
-        temperature=0,
-        humidity=0,
-        pressure=0,
-        s_1=0,
-        s_2=0,
-        s_3=0,
-        s_4=0,
-        s_5=0,
-        s_6=0,
-        s_7=0,
-        s_8=0,
-    ):
-        self.packet_counter = packet_counter
-        self.temperature = temperature
-        self.humidity = humidity
-        self.pressure = pressure
-        self.resistance_values = [s_1, s_2, s_3, s_4, s_5, s_6, s_7, s_8]
-
-    def get_packet_counter(self):
-        return self.packet_counter
-
-    def get_temperature(self):
-        return self.temperature
-
-    def get_humidity(self):
-        return self.humidity
-
-    def get_pressure(self):
-        return self.pressure
-
-    def get_resistance(self, channel_number=None):
-        if channel_number == None:
-            return self.resistance_values
-
-        if channel_number < 0 or channel_number > 8:
-            return 0
-        else:
-            return self.resistance_values[channel_number]
-
-    def get_resistance_array(self):
-        return self.resistance_values
-
-    def __str__(self):
-        st = f"[{self.packet_counter}] - {self.temperature:.2f} - "
-        st += f"{self.humidity:.2f} - {self.pressure:.2f} - {self.resistance_values}"
-        return st
@@ -0,0 +1,358 @@
+"""
+Definition of the packets exchanged with the board.
+
+This module defines the layout of the data and BME280 configuration
+packets sent by the board, the framing engine used to extract them
+from the serial byte stream, and the classes holding decoded data.
+"""
+from array import array
+import struct
+
+from loguru import logger
+import numpy as np
+
+#############################################
+#                 Constants                 #
+#############################################
+
+"""!
+@brief Data packet header byte.
+"""
+DATA_PACKET_HEADER = 0xAA
+
+"""!
+@brief Data packet tail byte.
+"""
+DATA_PACKET_TAIL = 0xF0
+
+"""!
+@brief BME Configuration header byte.
+"""
+BME_CONF_PACKET_HEADER = 0xBB
+
+"""!
+@brief DBME Configuration tail byte.
+"""
+BME_CONF_PACKET_TAIL = 0xB0
+
+"""!
+@brief Size in bytes of a complete data packet, header and tail included.
+"""
+DATA_PACKET_SIZE = 47
+
+"""!
+@brief Size in bytes of a complete BME configuration packet, header and tail included.
+"""
+BME_CONF_PACKET_SIZE = 7
+
+"""!
+@brief Precompiled layout of a data packet.
+
+Header, packet counter, 8 big-endian voltages, pressure,
+temperature, humidity and tail.
+"""
+DATA_PACKET_STRUCT = struct.Struct(">BB8I3IB")
+
+"""!
+@brief NumPy view of a raw data packet.
+
+Same layout as DATA_PACKET_STRUCT, used to decode a block of
+packets with a single np.frombuffer call.
+"""
+DATA_PACKET_DTYPE = np.dtype(
+    [
+        ("header", "u1"),
+        ("packet_counter", "u1"),
+        ("voltage", ">u4", (8,)),
+        ("pressure", ">u4"),
+        ("temperature", ">u4"),
+        ("humidity", ">u4"),
+        ("tail", "u1"),
+    ]
+)
+
+"""!
+@brief Decoded data packets, with values converted to physical units.
+
+The field order matches the DataPacket constructor, so that each row
+of a decoded block can be converted into a DataPacket.
+"""
+DECODED_PACKET_DTYPE = np.dtype(
+    [
+        ("packet_counter", "u1"),
+        ("temperature", "f8"),
+        ("humidity", "f8"),
+        ("pressure", "f8"),
+        ("resistance", "f8", (8,)),
+    ]
+)
+
+"""!
+@brief Precompiled layout of a BME configuration packet.
+"""
+BME_CONF_PACKET_STRUCT = struct.Struct(">B5BB")
+
+
+class PacketFramer:
+    """
+    Framing engine for the byte stream received from the board.
+
+    Bytes read from the serial port are appended to an internal
+    buffer, and all the complete packets available are extracted
+    in a single pass. When a header byte is not followed by the
+    expected tail, the framer drops one byte and searches for the
+    next header, so that it can resynchronize with the stream.
+
+    Usage:
+
+    >>> framer = PacketFramer()
+    >>> data_block, conf_packets = framer.feed(port.read(port.in_waiting))
+    >>> packets = decode_data_packets(data_block)
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.skipped_packets = 0
+        self.in_sync = True
+
+    def reset(self):
+        """
+        Discard any partially received packet.
+        """
+        self.buffer.clear()
+        self.in_sync = True
+
+    def feed(self, data):
+        """
+        Append new bytes and extract all the complete packets.
+
+        Args:
+            - data: bytes read from the serial port
+
+        Returns:
+            - contiguous bytearray with all the complete data packets,
+              whose length is a multiple of DATA_PACKET_SIZE
+            - list of complete BME configuration packets
+        """
+        buffer = self.buffer
+        buffer += data
+        data_block = bytearray()
+        conf_packets = []
+        buffer_len = len(buffer)
+        idx = 0
+        while idx < buffer_len:
+            header = buffer[idx]
+            if header == DATA_PACKET_HEADER:
+                end = idx + DATA_PACKET_SIZE
+                if end > buffer_len:
+                    break
+                if buffer[end - 1] == DATA_PACKET_TAIL:
+                    data_block += buffer[idx:end]
+                    idx = end
+                    self.in_sync = True
+                    continue
+                self.packet_skipped()
+            elif header == BME_CONF_PACKET_HEADER:
+                end = idx + BME_CONF_PACKET_SIZE
+                if end > buffer_len:
+                    break
+                if buffer[end - 1] == BME_CONF_PACKET_TAIL:
+                    conf_packets.append(bytes(buffer[idx:end]))
+                    idx = end
+                    self.in_sync = True
+                    continue
+            idx += 1
+        del buffer[:idx]
+        return data_block, conf_packets
+
+    def packet_skipped(self):
+        self.skipped_packets += 1
+        # Log only once for every loss of synchronization
+        if self.in_sync:
+            logger.critical("Skipped one packet")
+            self.in_sync = False
+
+
+def decode_data_packets(data_block):
+    """
+    Decode a block of raw data packets.
+
+    The raw bytes are viewed as a NumPy structured array without
+    copying them, and all the values are then converted to
+    physical units with vectorized operations.
+
+    Args:
+        - data_block: contiguous raw data packets, as returned
+          by PacketFramer.feed
+
+    Returns:
+        - structured array with DECODED_PACKET_DTYPE, one row per packet
+
+    Usage:
+    >>> packets = decode_data_packets(data_block)
+    ... packets["resistance"][:, 3]
+    ... array([2.31, 2.32, 2.30])
+    """
+    raw = np.frombuffer(data_block, dtype=DATA_PACKET_DTYPE)
+    packets = np.empty(len(raw), dtype=DECODED_PACKET_DTYPE)
+    packets["packet_counter"] = raw["packet_counter"]
+    np.divide(raw["temperature"], 100, out=packets["temperature"])
+    np.divide(raw["humidity"], 1000, out=packets["humidity"])
+    np.divide(raw["pressure"], 100, out=packets["pressure"])
+    np.divide(raw["voltage"], pow(2, 16), out=packets["resistance"])
+    packets["resistance"] *= 5
+    return packets
+
+
+class DataPacket:
+    """
+    Data packet holding data received from board.
+
+    The packet uses __slots__ and stores the eight channel values
+    in a compact array of doubles, so that long packet histories
+    take as little memory as possible. Packets handed out by a
+    DataPacketPool are recycled once all the callbacks have
+    returned: callbacks that need to keep them must store a copy.
+    """
+
+    __slots__ = (
+        "packet_counter",
+        "temperature",
+        "humidity",
+        "pressure",
+        "resistance_values",
+        "pooled",
+    )
+
+    def __init__(
+        self,
+        packet_counter=0,
+        temperature=0,
+        humidity=0,
+        pressure=0,
+        s_1=0,
+        s_2=0,
+        s_3=0,
+        s_4=0,
+        s_5=0,
+        s_6=0,
+        s_7=0,
+        s_8=0,
+    ):
+        self.packet_counter = packet_counter
+        self.temperature = temperature
+        self.humidity = humidity
+        self.pressure = pressure
+        self.resistance_values = array("d", (s_1, s_2, s_3, s_4, s_5, s_6, s_7, s_8))
+        self.pooled = False
+
+    def set_values(self, packet_counter, temperature, humidity, pressure, resistances):
+        """
+        Overwrite the packet values in place.
+
+        Args:
+            - packet_counter: packet counter
+            - temperature: temperature value
+            - humidity: humidity value
+            - pressure: pressure value
+            - resistances: sequence with the eight channel values
+        """
+        self.packet_counter = packet_counter
+        self.temperature = temperature
+        self.humidity = humidity
+        self.pressure = pressure
+        # Written element by element, without allocating a new array
+        resistance_values = self.resistance_values
+        for channel, value in enumerate(resistances):
+            resistance_values[channel] = value
+
+    def copy(self):
+        """
+        Return a non-pooled copy of the packet.
+        """
+        return DataPacket(
+            self.packet_counter,
+            self.temperature,
+            self.humidity,
+            self.pressure,
+            *self.resistance_values,
+        )
+
+    def get_packet_counter(self):
+        return self.packet_counter
+
+    def get_temperature(self):
+        return self.temperature
+
+    def get_humidity(self):
+        return self.humidity
+
+    def get_pressure(self):
+        return self.pressure
+
+    def get_resistance(self, channel_number=None):
+        if channel_number == None:
+            return list(self.resistance_values)
+
+        if channel_number < 0 or channel_number > 8:
+            return 0
+        else:
+            return self.resistance_values[channel_number]
+
+    def get_resistance_array(self):
+        """
+        Return a list with the eight channel values, copied so that it
+        does not change when a pooled packet is reused.
+        """
+        return list(self.resistance_values)
+
+    def __str__(self):
+        st = f"[{self.packet_counter}] - {self.temperature:.2f} - "
+        st += f"{self.humidity:.2f} - {self.pressure:.2f} - {list(self.resistance_values)}"
+        return st
+
+
+class DataPacketPool:
+    """
+    Pool of recycled data packets.
+
+    Packets are taken from the pool with acquire and given back
+    with release, so that the read thread does not allocate a new
+    object for every sample. The pool is not thread safe: packets
+    must be acquired and released by the same thread.
+
+    Usage:
+
+    >>> pool = DataPacketPool(max_size=64)
+    >>> packet = pool.acquire(counter, temp, hum, press, resistances)
+    >>> pool.release(packet)
+    """
+
+    def __init__(self, max_size=64):
+        self.max_size = max_size
+        self.free_packets = []
+
+    def acquire(self, packet_counter, temperature, humidity, pressure, resistances):
+        """
+        Get a packet from the pool, filled with the given values.
+
+        A new packet is allocated when the pool is empty.
+        """
+        if self.free_packets:
+            packet = self.free_packets.pop()
+            packet.set_values(
+                packet_counter, temperature, humidity, pressure, resistances
+            )
+        else:
+            packet = DataPacket(
+                packet_counter, temperature, humidity, pressure, *resistances
+            )
+            packet.pooled = True
+        return packet
+
+    def release(self, packet):
+        """
+        Give a packet back to the pool.
+        """
+        if len(self.free_packets) < self.max_size:
+            self.free_packets.append(packet)
@@ -0,0 +1,110 @@
+"""
+Replay of raw data journals through the serial receiver callbacks.
+
+The chunks of bytes stored in a journal are parsed by MIPSerial as
+if they were just read from the serial port, so that the receiver
+callbacks (plots, data export, ...) can be run and debugged offline,
+without the board. Chunks can be replayed with their original timing,
+optionally sped up, or as fast as possible.
+
+The module can also be run from the GUI folder:
+
+    python -m mip.communication.replay Journal/20240101_120000 --max-speed
+"""
+import argparse
+import os
+from pathlib import Path
+import time
+
+# Keep Kivy from parsing the command line arguments of the replay tool
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+
+from loguru import logger
+
+from mip.communication.dispatch import OVERFLOW_BLOCK
+from mip.communication.mserial import MIPSerial
+from mip.export.journal import JournalReader
+
+
+def replay_journal(serial, journal_path, speed=1.0):
+    """
+    Feed the records of a journal to a MIPSerial instance.
+
+    Args:
+        - serial: MIPSerial instance parsing the data
+        - journal_path: folder of a journal session, or a single segment
+        - speed: replay speed with respect to the original timing,
+          None to replay as fast as possible
+
+    Returns:
+        - number of data packets decoded from the journal
+    """
+    serial.framer.reset()
+    serial.samples_read = 0
+    first_timestamp = None
+    start_time = time.monotonic()
+    for timestamp, data in JournalReader(journal_path):
+        if speed is not None:
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            delay = (timestamp - first_timestamp) / speed - (
+                time.monotonic() - start_time
+            )
+            if delay > 0:
+                time.sleep(delay)
+        serial.process_data(data)
+    if not serial.dispatcher.wait_until_empty(timeout=10.0):
+        logger.warning(
+            f"{serial.dispatcher.pending_batches()} batches of packets "
+            "were not consumed at the end of the replay"
+        )
+    return serial.samples_read
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a raw data journal.")
+    parser.add_argument("journal", help="Journal session folder or segment.")
+    speed_group = parser.add_mutually_exclusive_group()
+    speed_group.add_argument(
+        "--speed", type=float, default=1.0, help="Replay speed, 1 for real time."
+    )
+    speed_group.add_argument(
+        "--max-speed", action="store_true", help="Replay as fast as possible."
+    )
+    parser.add_argument(
+        "--export-dir", default=None, help="Export the replayed data to this folder."
+    )
+    parser.add_argument(
+        "--format", default="csv", help="Format of the exported data file."
+    )
+    args = parser.parse_args()
+
+    # Block instead of dropping packets, since the journal can be
+    # read faster than the consumers can handle it
+    serial = MIPSerial(overflow_policy=OVERFLOW_BLOCK, auto_connect=False)
+    exporter = serial.exporter
+    if args.export_dir is not None:
+        exporter.save_data = True
+        exporter.data_path = Path(args.export_dir)
+        exporter.data_path.mkdir(parents=True, exist_ok=True)
+        exporter.set_output_format(exporter, args.format)
+        exporter.init_file()
+
+    start_time = time.monotonic()
+    n_packets = replay_journal(
+        serial, args.journal, speed=None if args.max_speed else args.speed
+    )
+    elapsed = time.monotonic() - start_time
+
+    if args.export_dir is not None:
+        exporter.close_file()
+        logger.info(f"Replayed data exported to {exporter.file_name}")
+    logger.info(
+        f"Replayed {n_packets} packets in {elapsed:.2f} s "
+        f"({n_packets / max(elapsed, 1e-9):.0f} packets/s)"
+    )
+    serial.dispatcher.stop()
+
+
+if __name__ == "__main__":
+    main()
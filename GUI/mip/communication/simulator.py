@@ -0,0 +1,448 @@
+"""
+Software stand-in for the eNose board.
+
+The simulated board speaks the same serial protocol as the firmware:
+it answers the connection request, streams data packets on request,
+sends its BME280 configuration, accepts new BME280 settings, sample
+rate and temperature modulation commands. The sensor responses are
+synthetic, and follow the selected temperature modulation pattern.
+
+Boards are exposed either through a pseudo terminal (POSIX only),
+which the GUI opens as any other serial port, or through a TCP
+loopback socket, which pyserial opens with a socket:// URL:
+
+>>> board = SimulatedBoard(sample_rate=100)
+>>> server = BoardServer(board, transport=TcpTransport())
+>>> server.start()
+>>> serial = MIPSerial(port_name=server.port_name)
+
+The module can also be run from the GUI folder to start one or more
+boards until interrupted:
+
+    python -m mip.communication.simulator --boards 2 --rate 100 --transport tcp
+"""
+import argparse
+import os
+import select
+import socket
+import threading
+import time
+
+from loguru import logger
+import numpy as np
+
+from mip.communication.packets import (
+    BME_CONF_PACKET_HEADER,
+    BME_CONF_PACKET_TAIL,
+    DATA_PACKET_DTYPE,
+    DATA_PACKET_HEADER,
+    DATA_PACKET_TAIL,
+)
+
+#############################################
+#                 Constants                 #
+#############################################
+
+CONNECTION_STRING = b"COM Connection $$$"
+"""
+Answer of the board to the connection request.
+"""
+
+SAMPLE_RATE_CMDS = {b"1": 1, b"2": 10, b"3": 25, b"4": 50, b"5": 100}
+"""
+Sample rates, in Hz, selected by the sample rate commands.
+"""
+
+PATTERN_CMDS = {
+    b"O": "5V",
+    b"o": "0V",
+    b"r": "Ramp",
+    b"q": "Square",
+    b"w": "Sine",
+    b"t": "Triangle",
+    b"c": "Sq+Tr",
+}
+"""
+Temperature modulation patterns selected by the pattern commands.
+"""
+
+BME_SET_CONF_HEADER = b"t"
+"""
+Header of the packets setting a new BME280 configuration.
+"""
+
+BME_SET_CONF_TAIL = b"T"
+"""
+Tail of the packets setting a new BME280 configuration.
+"""
+
+DEFAULT_BME280_SETTINGS = bytes([0x01, 0x01, 0x01, 0x05, 0x00])
+"""
+Humidity, temperature and pressure oversampling, standby time
+and IIR filter codes of a freshly programmed board.
+"""
+
+MAX_BME280_SETTING_CODE = 0x07
+"""
+Largest valid code in a BME280 settings packet.
+"""
+
+RAMP_PERIOD = 300
+"""
+Period of the ramp pattern, in seconds, as in the firmware.
+"""
+
+PATTERN_PERIOD = 100
+"""
+Period of the square, sine, triangle and Sq+Tr patterns, in seconds.
+"""
+
+HEATER_VOLTAGE = 5.0
+"""
+Full scale heater voltage.
+"""
+
+MAX_WRITE_SIZE = 4096
+"""
+Maximum number of bytes written to the transport at once.
+"""
+
+
+def heater_voltage(pattern, t):
+    """
+    Compute the heater voltage of a temperature modulation pattern.
+
+    Args:
+        - pattern: name of the temperature modulation pattern
+        - t: array with the times from the start of the pattern, in seconds
+
+    Returns:
+        - array with the heater voltages
+    """
+    phase = (t % PATTERN_PERIOD) / PATTERN_PERIOD
+    triangle = 1 - np.abs(2 * phase - 1)
+    if pattern == "0V":
+        level = np.zeros_like(t)
+    elif pattern == "Ramp":
+        level = (t % RAMP_PERIOD) / RAMP_PERIOD
+    elif pattern == "Square":
+        level = (phase < 0.5).astype(float)
+    elif pattern == "Sine":
+        level = 0.5 + 0.5 * np.sin(2 * np.pi * phase)
+    elif pattern == "Triangle":
+        level = triangle
+    elif pattern == "Sq+Tr":
+        # Square wave in the first half period, triangle in the second one
+        square = ((phase * 4) % 2 < 1).astype(float)
+        level = np.where(phase < 0.5, square, 1 - np.abs(4 * phase - 3))
+    else:
+        level = np.ones_like(t)
+    return HEATER_VOLTAGE * level
+
+
+class SimulatedBoard:
+    """
+    Protocol and data generation of a simulated board.
+
+    The board is independent of the transport: received bytes are
+    passed to handle_input, which returns the bytes to be answered,
+    and the data packets due up to a given time are returned by
+    get_data.
+
+    Args:
+        - sample_rate: initial sample rate, in Hz. Any rate can be
+          used here, while the sample rate commands select the rates
+          supported by the firmware.
+        - seed: seed of the random noise added to the responses
+        - board_id: index of the board, changing its baseline responses
+    """
+
+    def __init__(self, sample_rate=10, seed=None, board_id=0):
+        self.sample_rate = sample_rate
+        self.board_id = board_id
+        self.rng = np.random.default_rng(seed)
+        self.bme280_settings = DEFAULT_BME280_SETTINGS
+        self.pattern = "5V"
+        self.streaming = False
+        self.packet_counter = 0
+        self.start_time = 0
+        self.pattern_start_time = 0
+        self.next_sample = 0
+        self.conf_packet = None
+        # Baseline and sensitivity of each sensor to the heater voltage
+        self.baseline = 1.0 + 0.3 * np.arange(8) + 0.05 * board_id
+        self.gain = 0.1 + 0.02 * np.arange(8)
+
+    def handle_input(self, data, now=None):
+        """
+        Handle the bytes received from the GUI.
+
+        Args:
+            - data: received bytes
+            - now: current monotonic time, in seconds
+
+        Returns:
+            - bytes to be sent back to the GUI
+        """
+        if now is None:
+            now = time.monotonic()
+        answer = bytearray()
+        for byte in data:
+            cmd = bytes([byte])
+            if self.conf_packet is not None:
+                # Inside a BME280 settings packet: as in the firmware, an
+                # invalid byte ends the packet and is handled as a command
+                if len(self.conf_packet) < len(DEFAULT_BME280_SETTINGS):
+                    if byte <= MAX_BME280_SETTING_CODE:
+                        self.conf_packet += cmd
+                        continue
+                elif cmd == BME_SET_CONF_TAIL:
+                    self.bme280_settings = bytes(self.conf_packet)
+                    self.conf_packet = None
+                    logger.debug(f"Board {self.board_id}: new BME280 settings")
+                    continue
+                self.conf_packet = None
+            if cmd == b"v":
+                answer += CONNECTION_STRING
+            elif cmd == b"a":
+                if not self.streaming:
+                    self.streaming = True
+                    self.start_time = now
+                    self.pattern_start_time = now
+                    self.next_sample = 0
+            elif cmd == b"s":
+                self.streaming = False
+            elif cmd == b"g":
+                answer += bytes([BME_CONF_PACKET_HEADER])
+                answer += self.bme280_settings
+                answer += bytes([BME_CONF_PACKET_TAIL])
+            elif cmd in SAMPLE_RATE_CMDS:
+                self.set_sample_rate(SAMPLE_RATE_CMDS[cmd], now)
+            elif cmd in PATTERN_CMDS:
+                self.pattern = PATTERN_CMDS[cmd]
+                self.pattern_start_time = now
+            if cmd == BME_SET_CONF_HEADER:
+                # 't' also selects the triangle pattern, as in the firmware
+                self.conf_packet = bytearray()
+        return bytes(answer)
+
+    def set_sample_rate(self, sample_rate, now=None):
+        if now is None:
+            now = time.monotonic()
+        if self.streaming:
+            # Restart the sample clock at the new rate
+            self.start_time = now
+            self.next_sample = 0
+        self.sample_rate = sample_rate
+
+    def get_data(self, now=None):
+        """
+        Generate the data packets due up to the given time.
+
+        Args:
+            - now: current monotonic time, in seconds
+
+        Returns:
+            - bytes of the generated data packets
+        """
+        if not self.streaming:
+            return b""
+        if now is None:
+            now = time.monotonic()
+        last_sample = int((now - self.start_time) * self.sample_rate)
+        n_packets = last_sample - self.next_sample
+        if n_packets <= 0:
+            return b""
+        samples = np.arange(self.next_sample, last_sample)
+        self.next_sample = last_sample
+        t = self.start_time + samples / self.sample_rate
+        return self.pack_packets(t).tobytes()
+
+    def pack_packets(self, t):
+        """
+        Build the data packets for the given sample times.
+
+        Args:
+            - t: array with the monotonic times of the samples
+
+        Returns:
+            - structured array with DATA_PACKET_DTYPE
+        """
+        n_packets = len(t)
+        heater = heater_voltage(self.pattern, t - self.pattern_start_time)
+        elapsed = t - self.start_time
+        voltage = self.baseline + np.outer(heater, self.gain)
+        voltage += self.rng.normal(0, 0.002, size=voltage.shape)
+        voltage = np.clip(voltage, 0, 5)
+        temperature = 25 + 0.5 * np.sin(2 * np.pi * elapsed / 600)
+        humidity = 45 + 2 * np.sin(2 * np.pi * elapsed / 900)
+        pressure = 1013.25 + self.rng.normal(0, 0.05, size=n_packets)
+
+        packets = np.empty(n_packets, dtype=DATA_PACKET_DTYPE)
+        packets["header"] = DATA_PACKET_HEADER
+        packets["packet_counter"] = (self.packet_counter + np.arange(n_packets)) % 256
+        packets["voltage"] = np.round(voltage / 5 * 2**16)
+        packets["pressure"] = np.round(pressure * 100)
+        packets["temperature"] = np.round(temperature * 100)
+        packets["humidity"] = np.round(humidity * 1000)
+        packets["tail"] = DATA_PACKET_TAIL
+        self.packet_counter = (self.packet_counter + n_packets) % 256
+        return packets
+
+
+class PtyTransport:
+    """
+    Pseudo terminal transport, available on POSIX systems only.
+
+    The board owns the master side of the terminal, and the GUI
+    opens the slave side, whose name is stored in port_name.
+    """
+
+    def __init__(self):
+        import tty
+
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        os.set_blocking(self.master_fd, False)
+        self.port_name = os.ttyname(self.slave_fd)
+
+    def read(self, timeout=0.001):
+        readable, _, _ = select.select([self.master_fd], [], [], timeout)
+        if not readable:
+            return b""
+        try:
+            return os.read(self.master_fd, 4096)
+        except (BlockingIOError, OSError):
+            # No process has the slave side open
+            return b""
+
+    def write(self, data):
+        view = memoryview(data)
+        while len(view) > 0:
+            try:
+                written = os.write(self.master_fd, view[:MAX_WRITE_SIZE])
+            except BlockingIOError:
+                # Nobody is reading: the data is lost, as on a real UART
+                return
+            view = view[written:]
+
+    def close(self):
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+
+class TcpTransport:
+    """
+    TCP loopback transport.
+
+    The board listens on a local port and serves one client at a time;
+    the GUI opens it with the socket:// URL stored in port_name.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(1)
+        self.client = None
+        host, port = self.server.getsockname()
+        self.port_name = f"socket://{host}:{port}"
+
+    def read(self, timeout=0.001):
+        sockets = [self.server] if self.client is None else [self.client]
+        readable, _, _ = select.select(sockets, [], [], timeout)
+        if not readable:
+            return b""
+        if self.client is None:
+            self.client, _ = self.server.accept()
+            self.client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return b""
+        try:
+            data = self.client.recv(4096)
+        except OSError:
+            data = b""
+        if len(data) == 0:
+            # The client disconnected, wait for the next one
+            self.client.close()
+            self.client = None
+        return data
+
+    def write(self, data):
+        if self.client is None:
+            return
+        try:
+            self.client.sendall(data)
+        except OSError:
+            self.client.close()
+            self.client = None
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        self.server.close()
+
+
+class BoardServer(threading.Thread):
+    """
+    Thread connecting a simulated board to a transport.
+    """
+
+    def __init__(self, board, transport=None):
+        super(BoardServer, self).__init__(daemon=True)
+        self.board = board
+        self.transport = transport if transport is not None else PtyTransport()
+        self.port_name = self.transport.port_name
+        self.running = True
+
+    def run(self):
+        board = self.board
+        transport = self.transport
+        while self.running:
+            data = transport.read()
+            now = time.monotonic()
+            if len(data) > 0:
+                answer = board.handle_input(data, now)
+                if len(answer) > 0:
+                    transport.write(answer)
+            packets = board.get_data(now)
+            if len(packets) > 0:
+                transport.write(packets)
+        transport.close()
+
+    def stop(self):
+        self.running = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run simulated eNose boards.")
+    parser.add_argument("--boards", type=int, default=1, help="Number of boards.")
+    parser.add_argument(
+        "--rate", type=float, default=10, help="Initial sample rate, in Hz."
+    )
+    parser.add_argument(
+        "--transport",
+        choices=["pty", "tcp"],
+        default="pty" if os.name == "posix" else "tcp",
+        help="Transport used to expose the boards.",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Noise seed.")
+    args = parser.parse_args()
+
+    servers = []
+    for board_id in range(args.boards):
+        board = SimulatedBoard(args.rate, seed=args.seed, board_id=board_id)
+        transport = PtyTransport() if args.transport == "pty" else TcpTransport()
+        server = BoardServer(board, transport)
+        server.start()
+        servers.append(server)
+        logger.info(f"Board {board_id} available on {server.port_name}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
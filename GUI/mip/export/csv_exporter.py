@@ -4,9 +4,101 @@ from kivy.event import EventDispatcher
 from datetime import datetime
 import json
 from loguru import logger
+import numpy as np
+import os
 from pathlib import Path
+import threading
+import time
 
-PACKET_BUFFER_MAX_DIM = 10
+from mip.communication.packets import DECODED_PACKET_DTYPE
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+FILE_BUFFER_SIZE = 1 << 16
+"""
+Size in bytes of the buffer of the output file.
+"""
+
+FLUSH_MAX_BUFFER_SIZE = 1 << 16
+"""
+Size in characters of the pending rows that triggers a write to the file.
+"""
+
+FLUSH_INTERVAL = 2.0
+"""
+Maximum time, in seconds, that rows can wait before being written to the file.
+"""
+
+DATA_COLUMNS = [
+    "Packet_ID",
+    "Temperature",
+    "Humidity",
+    "Pressure",
+    "S-1",
+    "S-2",
+    "S-3",
+    "S-4",
+    "S-5",
+    "S-6",
+    "S-7",
+    "S-8",
+    "Stage",
+    "Temperature Modulation",
+]
+"""
+Columns of the exported data files.
+"""
+
+DATA_FORMATS = ["txt", "csv", "parquet"]
+"""
+Supported formats of the exported data files.
+"""
+
+PARQUET_FORMAT = "parquet"
+"""
+Binary columnar format, requiring pyarrow.
+"""
+
+PARQUET_ROW_GROUP_SIZE = 6000
+"""
+Number of pending rows that triggers the writing of a row group to Parquet files.
+"""
+
+PARQUET_FLUSH_INTERVAL = 60.0
+"""
+Maximum time, in seconds, that rows can wait before being written to Parquet files.
+"""
+
+PARQUET_HEADER_KEY = b"mip.header"
+"""
+Key of the Parquet file metadata holding the header of the recording.
+"""
+
+
+def parquet_schema(header=None):
+    """
+    Return the Arrow schema of the exported Parquet files.
+
+    Args:
+        - header: dictionary with the header of the recording, stored
+          as JSON in the file metadata
+
+    Returns:
+        - pyarrow.Schema of the exported data
+    """
+    label = pa.dictionary(pa.int32(), pa.string())
+    fields = [pa.field("Packet_ID", pa.uint8())]
+    fields += [pa.field(column, pa.float64()) for column in DATA_COLUMNS[1:12]]
+    fields += [pa.field("Stage", label), pa.field("Temperature Modulation", label)]
+    metadata = None
+    if header is not None:
+        metadata = {PARQUET_HEADER_KEY: json.dumps(header).encode("utf-8")}
+    return pa.schema(fields, metadata=metadata)
 
 
 class CSVExporter(EventDispatcher):
@@ -25,20 +117,24 @@ class CSVExporter(EventDispatcher):
     def __init__(self):
         logger.debug("Data Exporter Initialized")
         self.load_export_settings()
-        self.packet_list = []
+        self.file = None
+        self.file_format = self.data_format
+        # True between init_file and close_file, the only time when rows
+        # are accepted
+        self.session_open = False
+        self.file_lock = threading.RLock()
+        self.pending_rows = []
+        self.pending_size = 0
+        self.last_flush_time = time.monotonic()
 
     def load_export_settings(self):
         if Path("settings.json").exists():
             with open("settings.json", "r") as f:
                 settings_json = json.load(f)
                 self.save_data = settings_json["save_data"]
-                self.data_format = settings_json["data_format"]
+                self.set_output_format(self, settings_json["data_format"])
                 self.data_path = Path(settings_json["data_path"])
                 self.custom_header = ""
-                if self.data_format == "csv":
-                    self.delim = ","
-                else:
-                    self.delim = " "
         else:
             self.save_data = False
             self.data_path = Path.cwd() / "Data"
@@ -57,110 +153,251 @@ class CSVExporter(EventDispatcher):
             logger.debug(f"Path does not exist. Saving data in {self.data_path}")
 
     def set_output_format(self, instance, data_format):
-        if data_format != "txt" and data_format != "csv":
+        if data_format not in DATA_FORMATS:
             logger.critical(f"{data_format} is not a valid format. Using txt instead.")
-            self.data_format = "txt"
-            self.delim = " "
+            data_format = "txt"
+        elif data_format == PARQUET_FORMAT and pa is None:
+            logger.critical("pyarrow is not installed. Using csv instead.")
+            data_format = "csv"
+        self.data_format = data_format
+        logger.debug(f"Saving data in {self.data_format} format")
+        if self.data_format == "csv":
+            self.delim = ","
         else:
-            self.format = data_format
-            logger.debug(f"Saving data in {self.format} format")
-            if self.data_format == "csv":
-                self.delim = ","
-            else:
-                self.delim = " "
+            self.delim = " "
 
     def is_streaming(self, instance, streaming):
         if streaming:
             self.load_export_settings()
-            self.packet_list = []
             self.init_file()
         else:
             self.close_file()
 
     def init_file(self):
         curr_time = datetime.now()
-        self.file_name = (
-            datetime.strftime(curr_time, "%Y%m%d_%H%M%S") + "." + self.data_format
-        )
-        self.file_name = self.data_path / self.file_name
-        if self.save_data:
-            self.write_header()
+        with self.file_lock:
+            # The format cannot change while the file is open
+            self.file_format = self.data_format
+            self.file_name = (
+                datetime.strftime(curr_time, "%Y%m%d_%H%M%S") + "." + self.file_format
+            )
+            self.file_name = self.data_path / self.file_name
+            # Rows left by a previous session must not reach this file
+            self.pending_rows = []
+            self.pending_size = 0
+            self.session_open = True
+            if self.save_data:
+                self.open_file()
+
+    def open_file(self):
+        """
+        Open the output file, writing the header if the file is new.
+
+        The file stays open for the whole session, and rows are
+        written through its buffer.
+        """
+        with self.file_lock:
+            if self.file is None and self.file_format == PARQUET_FORMAT:
+                # Parquet files cannot be appended to, and opening a writer
+                # truncates the file: an existing one goes to a new part file
+                self.file_name = self.new_part_file(Path(self.file_name))
+                self.file = pq.ParquetWriter(
+                    self.file_name,
+                    parquet_schema(self.get_header()),
+                    compression="zstd",
+                )
+                self.last_flush_time = time.monotonic()
+            elif self.file is None:
+                write_header = not Path(self.file_name).exists()
+                self.file = open(
+                    self.file_name, "a", buffering=FILE_BUFFER_SIZE, newline=""
+                )
+                self.last_flush_time = time.monotonic()
+                if write_header:
+                    self.write_header()
+
+    @staticmethod
+    def new_part_file(file_name):
+        """
+        Return file_name, or the first of file_name_part1, file_name_part2...
+        that does not exist yet.
+        """
+        part = 0
+        part_file = file_name
+        while part_file.exists():
+            part += 1
+            part_file = file_name.with_name(
+                f"{file_name.stem}_part{part}{file_name.suffix}"
+            )
+        if part > 0:
+            logger.warning(f"{file_name} already exists, writing to {part_file}")
+        return part_file
+
+    def get_header(self):
+        return {
+            "Humidity oversampling": self.bme280_humidity_oversampling,
+            "Temperature oversampling": self.bme280_temperature_oversampling,
+            "Pressure": self.bme280_pressure_oversampling,
+            "IIR Filter": self.bme280_iir_filter,
+            "Standby time": self.bme280_standby_time,
+            "Custom Header": self.custom_header,
+        }
 
     def write_header(self):
         header = ""
-        header += f"% Humidity oversampling: {self.bme280_humidity_oversampling}"
-        header += "\n"
-        header += f"% Temperature oversampling: {self.bme280_temperature_oversampling}"
-        header += "\n"
-        header += f"% Pressure: {self.bme280_pressure_oversampling}"
-        header += "\n"
-        header += f"% IIR Filter: {self.bme280_iir_filter}"
+        for key, value in self.get_header().items():
+            header += f"% {key}: {value}"
+            header += "\n"
+        header += self.delim.join(DATA_COLUMNS)
         header += "\n"
-        header += f"% Standby time: {self.bme280_standby_time}"
-        header += "\n"
-        header += f"% Custom Header: {self.custom_header}"
-        header += "\n"
-        header += "Packet_ID"
-        header += self.delim
-        header += "Temperature"
-        header += self.delim
-        header += "Humidity"
-        header += self.delim
-        header += "Pressure"
-        header += self.delim
-        header += "S-1"
-        header += self.delim
-        header += "S-2"
-        header += self.delim
-        header += "S-3"
-        header += self.delim
-        header += "S-4"
-        header += self.delim
-        header += "S-5"
-        header += self.delim
-        header += "S-6"
-        header += self.delim
-        header += "S-7"
-        header += self.delim
-        header += "S-8"
-        header += self.delim
-        header += "Stage"
-        header += self.delim
-        header += "Temperature Modulation"
-        header += "\n"
-        with open(self.file_name, "a") as f:
-            f.write(header)
+        self.file.write(header)
 
     def add_packet(self, packet):
-        if self.save_data:
-            self.packet_list.append(packet)
-            if len(self.packet_list) == PACKET_BUFFER_MAX_DIM:
-                for packet_temp in self.packet_list:
-                    self.write_packet(packet_temp)
-                self.packet_list = []
-
-    def write_packet(self, packet):
-        row = ""
-        row += str(packet.get_packet_counter())
-        row += self.delim
-        row += str(packet.get_temperature())
-        row += self.delim
-        row += str(packet.get_humidity())
-        row += self.delim
-        row += str(packet.get_pressure())
-        row += self.delim
-        res_values = packet.get_resistance_array()
-        for idx, resistance in enumerate(res_values):
-            row += str(resistance)
-            row += self.delim
-        row += self.measurement_stage
-        row += self.delim
-        row += self.temperature_modulation
-        row += "\n"
-        with open(self.file_name, "a") as f:
-            f.write(row)
+        if self.save_data and self.file_format == PARQUET_FORMAT:
+            packets = np.zeros(1, dtype=DECODED_PACKET_DTYPE)
+            packets[0] = (
+                packet.get_packet_counter(),
+                packet.get_temperature(),
+                packet.get_humidity(),
+                packet.get_pressure(),
+                packet.get_resistance_array(),
+            )
+            self.add_columns(packets)
+        elif self.save_data:
+            self.add_rows(
+                [
+                    (
+                        packet.get_packet_counter(),
+                        packet.get_temperature(),
+                        packet.get_humidity(),
+                        packet.get_pressure(),
+                        *packet.get_resistance_array(),
+                    )
+                ]
+            )
+
+    def add_packets(self, packets):
+        """
+        Add a block of decoded packets to the output file.
+
+        Args:
+            - packets: structured array of decoded packets, as
+              received by the serial batch callbacks
+        """
+        if not self.save_data or len(packets) == 0:
+            return
+        if self.file_format == PARQUET_FORMAT:
+            self.add_columns(packets)
+        else:
+            self.add_rows(
+                (counter, temp, hum, press, *res)
+                for counter, temp, hum, press, res in packets.tolist()
+            )
+
+    def add_rows(self, rows):
+        """
+        Format rows of values and append them to the pending buffer.
+
+        Stage and temperature modulation are the ones active when
+        the rows are received. Pending rows are written to the file
+        when the buffer is large enough or old enough.
+        """
+        delim = self.delim
+        suffix = delim + self.measurement_stage + delim + self.temperature_modulation
+        block = "".join([delim.join(map(str, row)) + suffix + "\n" for row in rows])
+        with self.file_lock:
+            if not self.session_open:
+                self.drop_late_rows(block.count("\n"))
+                return
+            self.pending_rows.append(block)
+            self.pending_size += len(block)
+            if (
+                self.pending_size >= FLUSH_MAX_BUFFER_SIZE
+                or time.monotonic() - self.last_flush_time >= FLUSH_INTERVAL
+            ):
+                self.write_pending_rows()
+
+    def add_columns(self, packets):
+        """
+        Append a block of decoded packets to the pending Parquet row group.
+
+        The block is kept as a structured array together with the
+        stage and temperature modulation active when it is received,
+        and is converted to columns only when the row group is written.
+        """
+        with self.file_lock:
+            if not self.session_open:
+                self.drop_late_rows(len(packets))
+                return
+            self.pending_rows.append(
+                (packets, self.measurement_stage, self.temperature_modulation)
+            )
+            self.pending_size += len(packets)
+            if (
+                self.pending_size >= PARQUET_ROW_GROUP_SIZE
+                or time.monotonic() - self.last_flush_time >= PARQUET_FLUSH_INTERVAL
+            ):
+                self.write_pending_rows()
+
+    def pending_table(self):
+        """
+        Convert the pending blocks of packets to an Arrow table.
+        """
+        packets = np.concatenate([block for block, _, _ in self.pending_rows])
+        lengths = [len(block) for block, _, _ in self.pending_rows]
+        stages = np.repeat([stage for _, stage, _ in self.pending_rows], lengths)
+        modulations = np.repeat([tm for _, _, tm in self.pending_rows], lengths)
+        columns = [
+            pa.array(packets["packet_counter"]),
+            pa.array(packets["temperature"]),
+            pa.array(packets["humidity"]),
+            pa.array(packets["pressure"]),
+        ]
+        for idx in range(packets["resistance"].shape[1]):
+            columns.append(
+                pa.array(np.ascontiguousarray(packets["resistance"][:, idx]))
+            )
+        columns.append(pa.array(stages, pa.string()).dictionary_encode())
+        columns.append(pa.array(modulations, pa.string()).dictionary_encode())
+        return pa.Table.from_arrays(columns, schema=self.file.schema)
+
+    def drop_late_rows(self, n_rows):
+        """
+        Discard rows received when no session is open, e.g. the last
+        batches of a stream reaching the exporter after close_file.
+        """
+        logger.warning(f"Dropped {n_rows} rows received outside of a session")
+
+    def write_pending_rows(self):
+        if self.file is None:
+            if not self.session_open:
+                # The file of a closed session is never opened again
+                logger.warning("Dropped the pending rows of a closed session")
+                self.pending_rows = []
+                self.pending_size = 0
+                return
+            self.open_file()
+        if self.file_format == PARQUET_FORMAT:
+            self.file.write_table(self.pending_table())
+        else:
+            self.file.write("".join(self.pending_rows))
+            self.file.flush()
+        self.pending_rows = []
+        self.pending_size = 0
+        self.last_flush_time = time.monotonic()
 
     def close_file(self):
-        if len(self.packet_list) > 0 and self.save_data:
-            for packet_temp in self.packet_list:
-                self.write_packet(packet_temp)
+        with self.file_lock:
+            if len(self.pending_rows) > 0 and self.save_data:
+                self.write_pending_rows()
+            self.pending_rows = []
+            self.pending_size = 0
+            self.session_open = False
+            if self.file is not None and self.file_format == PARQUET_FORMAT:
+                self.file.close()
+                self.file = None
+            elif self.file is not None:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+                self.file = None
@@ -0,0 +1,222 @@
+"""
+Append-only journal of the raw bytes received from the board.
+
+Every chunk of bytes read from the serial port is appended to the
+journal together with the host monotonic time at which it was read,
+before any parsing takes place. The journal is split in segments of
+bounded size, each one made of a fixed size header followed by
+records:
+
+    | timestamp (f8) | length (u4) | crc32 (u4) | payload |
+
+Records are only ever appended, so that after a crash all the
+records written to the operating system can still be read back:
+a truncated or corrupted record at the end of a segment is simply
+ignored. Segments are read through mmap, without loading them in
+memory.
+"""
+from datetime import datetime
+import mmap
+import os
+from pathlib import Path
+import struct
+import threading
+import time
+import zlib
+
+from loguru import logger
+
+#############################################
+#                 Constants                 #
+#############################################
+
+JOURNAL_MAGIC = b"MIPJ"
+"""
+Magic bytes at the beginning of every journal segment.
+"""
+
+JOURNAL_VERSION = 1
+"""
+Version of the journal segment format.
+"""
+
+SEGMENT_HEADER_STRUCT = struct.Struct(">4sHHdd")
+"""
+Segment header: magic, version, reserved, wall clock time and
+monotonic time at which the segment was created.
+"""
+
+RECORD_HEADER_STRUCT = struct.Struct(">dII")
+"""
+Record header: monotonic timestamp, payload length and payload crc32.
+"""
+
+SEGMENT_SUFFIX = ".mipj"
+"""
+File extension of journal segments.
+"""
+
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+"""
+Size in bytes after which a new segment is started.
+"""
+
+JOURNAL_FLUSH_INTERVAL = 0.5
+"""
+Maximum time, in seconds, that records can wait in the file buffer.
+"""
+
+
+class JournalWriter:
+    """
+    Writer of a raw data journal.
+
+    Each session is stored in its own folder, named after the time
+    at which it was opened, inside the journal folder.
+
+    Usage:
+
+    >>> journal = JournalWriter("Journal")
+    >>> journal.open()
+    >>> journal.write(port.read(port.in_waiting))
+    >>> journal.close()
+    """
+
+    def __init__(self, journal_dir, segment_size=DEFAULT_SEGMENT_SIZE):
+        self.journal_dir = Path(journal_dir)
+        self.segment_size = segment_size
+        self.session_dir = None
+        self.file = None
+        self.segment_idx = 0
+        self.segment_bytes = 0
+        self.last_flush_time = 0
+        self.lock = threading.Lock()
+
+    def open(self):
+        """
+        Start a new journal session.
+
+        Returns:
+            - path of the folder holding the segments of the session
+        """
+        with self.lock:
+            session_name = datetime.strftime(datetime.now(), "%Y%m%d_%H%M%S")
+            self.session_dir = self.journal_dir / session_name
+            self.session_dir.mkdir(parents=True, exist_ok=True)
+            self.segment_idx = 0
+            self.open_segment()
+        logger.debug(f"Journaling raw data in {self.session_dir}")
+        return self.session_dir
+
+    def open_segment(self):
+        segment_name = f"segment_{self.segment_idx:05d}{SEGMENT_SUFFIX}"
+        self.file = open(self.session_dir / segment_name, "wb")
+        self.file.write(
+            SEGMENT_HEADER_STRUCT.pack(
+                JOURNAL_MAGIC, JOURNAL_VERSION, 0, time.time(), time.monotonic()
+            )
+        )
+        self.segment_bytes = SEGMENT_HEADER_STRUCT.size
+        self.last_flush_time = time.monotonic()
+
+    def close_segment(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+
+    def write(self, data, timestamp=None):
+        """
+        Append a chunk of raw bytes to the journal.
+
+        Args:
+            - data: bytes read from the serial port
+            - timestamp: monotonic time at which the bytes were read,
+              defaults to the current time
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        with self.lock:
+            if self.file is None:
+                return
+            if self.segment_bytes >= self.segment_size:
+                self.close_segment()
+                self.segment_idx += 1
+                self.open_segment()
+            self.file.write(
+                RECORD_HEADER_STRUCT.pack(timestamp, len(data), zlib.crc32(data))
+            )
+            self.file.write(data)
+            self.segment_bytes += RECORD_HEADER_STRUCT.size + len(data)
+            if timestamp - self.last_flush_time >= JOURNAL_FLUSH_INTERVAL:
+                # Hand the records over to the operating system, so that
+                # they survive a crash of the application
+                self.file.flush()
+                self.last_flush_time = timestamp
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.close_segment()
+
+
+class JournalReader:
+    """
+    Reader of a raw data journal.
+
+    The reader accepts either the folder of a session or a single
+    segment, and iterates over the (timestamp, data) records in the
+    order in which they were written.
+
+    Usage:
+
+    >>> for timestamp, data in JournalReader("Journal/20240101_120000"):
+    ...     print(timestamp, len(data))
+    """
+
+    def __init__(self, path):
+        path = Path(path)
+        if path.is_dir():
+            self.segments = sorted(path.glob(f"*{SEGMENT_SUFFIX}"))
+        else:
+            self.segments = [path]
+        if len(self.segments) == 0:
+            raise FileNotFoundError(f"No journal segments found in {path}")
+
+    def __iter__(self):
+        for segment in self.segments:
+            yield from self.read_segment(segment)
+
+    def read_segment(self, segment):
+        """
+        Iterate over the valid records of a segment.
+
+        Args:
+            - segment: path of the segment
+
+        Yields:
+            - (timestamp, data) tuples
+        """
+        with open(segment, "rb") as f:
+            if os.fstat(f.fileno()).st_size < SEGMENT_HEADER_STRUCT.size:
+                logger.warning(f"Skipping empty journal segment {segment}")
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, version, _, _, _ = SEGMENT_HEADER_STRUCT.unpack_from(mm, 0)
+                if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION:
+                    raise ValueError(f"{segment} is not a valid journal segment")
+                offset = SEGMENT_HEADER_STRUCT.size
+                size = len(mm)
+                while offset + RECORD_HEADER_STRUCT.size <= size:
+                    timestamp, length, crc = RECORD_HEADER_STRUCT.unpack_from(
+                        mm, offset
+                    )
+                    start = offset + RECORD_HEADER_STRUCT.size
+                    data = mm[start : start + length]
+                    if len(data) < length or zlib.crc32(data) != crc:
+                        logger.warning(
+                            f"Truncated record at byte {offset} of {segment}"
+                        )
+                        return
+                    yield timestamp, data
+                    offset = start + length
@@ -29,6 +29,13 @@ The MeshLinePlot plot is a particular plot which draws a set of points using
 a mesh object. The points are given as a list of tuples, with each tuple
 being a (x, y) coordinate in the graph's units.
 
+When numpy is available, the points can also be given as arrays, which
+avoids building a tuple for each point and lets the plot project all of them
+in pixel space at once::
+
+    x = np.linspace(0, 100, 1001)
+    plot.set_data(x, np.sin(x / 10.))
+
 You can create different types of plots other than MeshLinePlot by inheriting
 from the Plot class and implementing the required functions. The Graph object
 provides a "canvas" to which a Plot's instructions are added. The plot object
@@ -41,6 +48,8 @@ The current availables plots are:
     * `MeshStemPlot`
     * `MeshLinePlot`
     * `SmoothLinePlot` - require Kivy 1.8.1
+    * `ScrollingLinePlot` - require numpy
+    * `MultiLinePlot` - require numpy
 
 .. note::
 
@@ -50,7 +59,8 @@ The current availables plots are:
 
 '''
 
-__all__ = ('Graph', 'Plot', 'MeshLinePlot', 'MeshStemPlot', 'LinePlot', 'SmoothLinePlot', 'ContourPlot')
+__all__ = ('Graph', 'Plot', 'MeshLinePlot', 'MeshStemPlot', 'LinePlot', 'SmoothLinePlot', 'ContourPlot',
+           'ScrollingLinePlot', 'MultiLinePlot')
 __version__ = '0.4-dev'
 
 from kivy.uix.widget import Widget
@@ -58,7 +68,7 @@ from kivy.uix.label import Label
 from kivy.uix.stencilview import StencilView
 from kivy.properties import NumericProperty, BooleanProperty,\
     BoundedNumericProperty, StringProperty, ListProperty, ObjectProperty,\
-    DictProperty, AliasProperty
+    DictProperty, AliasProperty, OptionProperty
 from kivy.clock import Clock
 from kivy.graphics import Mesh, Color, Rectangle
 from kivy.graphics import Fbo
@@ -68,9 +78,11 @@ from kivy.lang import Builder
 from kivy.logger import Logger
 from kivy import metrics
 from math import log10, floor, ceil
+from collections import OrderedDict
 from decimal import Decimal
 try:
     import numpy as np
+    from mip.graph.decimation import MinMaxDecimator
 except ImportError as e:
     np = None
 
@@ -140,6 +152,8 @@ class Graph(Widget):
     _ticks_minorx = ListProperty([])
     _ticks_majory = ListProperty([])
     _ticks_minory = ListProperty([])
+    # maximum number of tick mark labels kept rendered, shown or not
+    _grid_label_pool_size = 64
 
     tick_color = ListProperty([.25, .25, .25, 1])
     '''Color of the grid/ticks, default to 1/4. grey.
@@ -170,6 +184,13 @@ class Graph(Widget):
     '''
 
     def __init__(self, **kwargs):
+        # tick mark labels by axis and text, so that their textures are only
+        # rendered once, and the style they were rendered with
+        self._grid_label_pool = OrderedDict()
+        self._grid_label_style = None
+        # key and result of the last layout of the labels
+        self._labels_layout_key = None
+        self._labels_layout = None
         super(Graph, self).__init__(**kwargs)
 
         with self.canvas:
@@ -198,12 +219,12 @@ class Graph(Widget):
         ts = self._trigger_size = Clock.create_trigger(self._redraw_size)
         tc = self._trigger_color = Clock.create_trigger(self._update_colors)
 
-        self.bind(center=ts, padding=ts, precision=ts, plots=ts, x_grid=ts,
-                  y_grid=ts, draw_border=ts)
+        self.bind(center=ts, padding=ts, plots=ts, x_grid=ts, y_grid=ts,
+                  draw_border=ts)
         self.bind(xmin=t, xmax=t, xlog=t, x_ticks_major=t, x_ticks_minor=t,
                   xlabel=t, x_grid_label=t, ymin=t, ymax=t, ylog=t,
                   y_ticks_major=t, y_ticks_minor=t, ylabel=t, y_grid_label=t,
-                  font_size=t, label_options=t, x_ticks_angle=t)
+                  font_size=t, label_options=t, x_ticks_angle=t, precision=t)
         self.bind(tick_color=tc, background_color=tc, border_color=tc)
         self._trigger()
 
@@ -330,7 +351,6 @@ class Graph(Widget):
         ymin = self.ymin
         ymax = self.ymax
         xmin = self.xmin
-        precision = self.precision
         x_overlap = False
         y_overlap = False
         # set up x and y axis labels
@@ -355,10 +375,7 @@ class Graph(Widget):
         # now x and y tick mark labels
         if len(ylabels) and ylabel_grid:
             # horizontal size of the largest tick label, to have enough room
-            funcexp = exp10 if self.ylog else identity
             funclog = log10 if self.ylog else identity
-            ylabels[0].text = precision % funcexp(ypoints[0])
-            ylabels[0].texture_update()
             y1 = ylabels[0].texture_size
             y_start = y_next + (padding + y1[1] if len(xlabels) and xlabel_grid
                                 else 0) + \
@@ -370,9 +387,6 @@ class Graph(Widget):
             y_start -= y1[1] / 2.
             y1 = y1[0]
             for k in range(len(ylabels)):
-                ylabels[k].text = precision % funcexp(ypoints[k])
-                ylabels[k].texture_update()
-                ylabels[k].size = ylabels[k].texture_size
                 y1 = max(y1, ylabels[k].texture_size[0])
                 ylabels[k].pos = (
                     int(x_next),
@@ -382,25 +396,16 @@ class Graph(Widget):
             else:
                 x_next += y1 + padding
         if len(xlabels) and xlabel_grid:
-            funcexp = exp10 if self.xlog else identity
             funclog = log10 if self.xlog else identity
             # find the distance from the end that'll fit the last tick label
-            xlabels[0].text = precision % funcexp(xpoints[-1])
-            xlabels[0].texture_update()
-            xextent = x + width - xlabels[0].texture_size[0] / 2. - padding
+            xextent = x + width - xlabels[-1].texture_size[0] / 2. - padding
             # find the distance from the start that'll fit the first tick label
             if not x_next:
-                xlabels[0].text = precision % funcexp(xpoints[0])
-                xlabels[0].texture_update()
                 x_next = padding + xlabels[0].texture_size[0] / 2.
             xmin = funclog(xmin)
             ratio = (xextent - x_next) / float(funclog(self.xmax) - xmin)
             right = -1
             for k in range(len(xlabels)):
-                xlabels[k].text = precision % funcexp(xpoints[k])
-                # update the size so we can center the labels on ticks
-                xlabels[k].texture_update()
-                xlabels[k].size = xlabels[k].texture_size
                 half_ts = xlabels[k].texture_size[0] / 2.
                 xlabels[k].pos = (
                     int(x_next + (xpoints[k] - xmin) * ratio - half_ts),
@@ -417,12 +422,12 @@ class Graph(Widget):
         if ylabel:
             ylabel.y = int(y_next + (yextent - y_next) / 2. - ylabel.height / 2.)
             ylabel.angle = 90
-        if x_overlap:
-            for k in range(len(xlabels)):
-                xlabels[k].text = ''
-        if y_overlap:
-            for k in range(len(ylabels)):
-                ylabels[k].text = ''
+        # hide the tick labels rather than clearing their text, so that their
+        # textures can be reused
+        for k in range(len(xlabels)):
+            xlabels[k].opacity = 0 if x_overlap else 1
+        for k in range(len(ylabels)):
+            ylabels[k].opacity = 0 if y_overlap else 1
         return x_next - x, y_next - y, xextent - x, yextent - y
 
     def _update_ticks(self, size):
@@ -546,6 +551,12 @@ class Graph(Widget):
         self._mesh_rect_color.rgba = tuple(self.border_color)
 
     def _redraw_all(self, *args):
+        # the pooled labels are rendered again if their style changed
+        style = [self.font_size, self.x_ticks_angle,
+                 sorted(self.label_options.items())]
+        if style != self._grid_label_style:
+            self._grid_label_pool.clear()
+            self._grid_label_style = style
         # add/remove all the required labels
         xpoints_major, xpoints_minor = self._redraw_x(*args)
         ypoints_major, ypoints_minor = self._redraw_y(*args)
@@ -588,17 +599,10 @@ class Graph(Widget):
         else:
             n_labels = len(xpoints_major)
 
-        for k in range(n_labels, len(grids)):
-            self.remove_widget(grids[k])
-        del grids[n_labels:]
-
-        grid_len = len(grids)
-        grids.extend([None] * (n_labels - len(grids)))
-        for k in range(grid_len, n_labels):
-            grids[k] = GraphRotatedLabel(
-                font_size=font_size, angle=self.x_ticks_angle,
-                **self.label_options)
-            self.add_widget(grids[k])
+        funcexp = exp10 if self.xlog else identity
+        self._set_grid_labels(grids, 'x', [
+            self.precision % funcexp(point)
+            for point in xpoints_major[:n_labels]])
         return xpoints_major, xpoints_minor
 
     def _redraw_y(self, *args):
@@ -631,23 +635,72 @@ class Graph(Widget):
         else:
             n_labels = len(ypoints_major)
 
-        for k in range(n_labels, len(grids)):
-            self.remove_widget(grids[k])
-        del grids[n_labels:]
-
-        grid_len = len(grids)
-        grids.extend([None] * (n_labels - len(grids)))
-        for k in range(grid_len, n_labels):
-            grids[k] = Label(font_size=font_size, **self.label_options)
-            self.add_widget(grids[k])
+        funcexp = exp10 if self.ylog else identity
+        self._set_grid_labels(grids, 'y', [
+            self.precision % funcexp(point)
+            for point in ypoints_major[:n_labels]])
         return ypoints_major, ypoints_minor
 
+    def _get_grid_label(self, axis, text, index):
+        '''Return a tick mark label of the axis showing text, from the pool of
+        labels already rendered when possible. index tells apart the labels
+        with the same text.
+        '''
+        pool = self._grid_label_pool
+        key = (axis, text, index)
+        label = pool.pop(key, None)
+        if label is None:
+            if axis == 'x':
+                label = GraphRotatedLabel(
+                    font_size=self.font_size, angle=self.x_ticks_angle,
+                    **self.label_options)
+            else:
+                label = Label(font_size=self.font_size, **self.label_options)
+            label.text = text
+            label.texture_update()
+            label.size = label.texture_size
+        # most recently used last
+        pool[key] = label
+        while len(pool) > self._grid_label_pool_size:
+            pool.popitem(last=False)
+        return label
+
+    def _set_grid_labels(self, grids, axis, texts):
+        '''Show the tick mark labels of the axis with the given texts, reusing
+        the labels already rendered with the same text.
+        '''
+        counts = {}
+        labels = []
+        for text in texts:
+            index = counts.get(text, 0)
+            counts[text] = index + 1
+            labels.append(self._get_grid_label(axis, text, index))
+        for label in grids:
+            if label not in labels:
+                self.remove_widget(label)
+        for label in labels:
+            if label.parent is None:
+                self.add_widget(label)
+        grids[:] = labels
+
     def _redraw_size(self, *args):
         # size a 4-tuple describing the bounding box in which we can draw
         # graphs, it's (x0, y0, x1, y1), which correspond with the bottom left
         # and top right corner locations, respectively
         self._clear_buffer()
-        size = self._update_labels()
+        # the labels are only laid out again if something they depend on
+        # changed, their textures being tied to their text
+        key = (tuple(self.pos), tuple(self.size), self.padding,
+               self.xlog, self.xmin, self.xmax, self.ylog, self.ymin,
+               self.ymax, self.xlabel, self.ylabel, self.x_grid_label,
+               self.y_grid_label, self._grid_label_style,
+               tuple(self._ticks_majorx), tuple(self._ticks_majory),
+               tuple(map(id, self._x_grid_label)),
+               tuple(map(id, self._y_grid_label)))
+        if key != self._labels_layout_key:
+            self._labels_layout = self._update_labels()
+            self._labels_layout_key = key
+        size = self._labels_layout
         self.view_pos = self._plot_area.pos = (size[0], size[1])
         self.view_size = self._plot_area.size = (
             size[2] - size[0], size[3] - size[1])
@@ -1007,10 +1060,28 @@ class Plot(EventDispatcher):
     '''Index of the Y axis to use, defaults to 0
     '''
 
+    decimation = OptionProperty('none', options=['none', 'minmax'])
+    '''Decimation of the points before drawing them. With 'minmax', the
+    points are reduced to the minimum and the maximum of each pixel column,
+    so that traces with many more points than pixels are drawn faster while
+    keeping their spikes visible. The x values of the points must be sorted
+    and uniformly spaced, on a linear axis. Requires numpy.
+
+    :data:`decimation` is a :class:`~kivy.properties.OptionProperty`,
+    defaults to 'none'.
+    '''
+
     def __init__(self, **kwargs):
+        # x and y values set with set_data, used instead of points
+        self._xdata = None
+        self._ydata = None
+        # samples appended to the data since the last draw, None if unknown
+        self._n_appended = None
+        self._decimator = None
         super(Plot, self).__init__(**kwargs)
         self.ask_draw = Clock.create_trigger(self.draw)
-        self.bind(params=self.ask_draw, points=self.ask_draw)
+        self.bind(params=self.ask_draw, points=self.ask_draw,
+                  decimation=self.ask_draw)
         self._drawings = self.create_drawings()
 
     def funcx(self):
@@ -1049,6 +1120,109 @@ class Plot(EventDispatcher):
         ratioy = (size[3] - size[1]) / float(ymax - ymin)
         return lambda y: (funcy(y) - ymin) * ratioy + size[1]
 
+    @staticmethod
+    def _project_array(values, log, vmin, vmax, px_min, px_max):
+        if log:
+            values = np.log10(values)
+            vmin = log10(vmin)
+            vmax = log10(vmax)
+        ratio = (px_max - px_min) / float(vmax - vmin)
+        return (values - vmin) * ratio + px_min
+
+    def set_data(self, x, y=None, n_appended=None):
+        """Set the points of the plot from arrays, without building a tuple
+        for each point. `x` is either a (N, 2) array of (x, y) points, or the
+        array of the x values, with the y values given in `y`. The arrays are
+        not copied, so they should not be modified until the plot is drawn.
+
+        When the data is a scrolling window, `n_appended` is the number of
+        samples appended at its end since the last call, while the same
+        number of samples was dropped from its beginning. It lets the plot
+        update only what changed.
+        """
+        if np is None:
+            self.points = list(x) if y is None else list(zip(x, y))
+            return
+        if y is None:
+            data = np.asarray(x, dtype=float)
+            x, y = data[:, 0], data[:, 1]
+        xdata = np.asarray(x, dtype=float)
+        ydata = np.asarray(y, dtype=float)
+        if len(xdata) != ydata.shape[-1]:
+            raise ValueError("x and y must have the same length")
+        self._xdata = xdata
+        self._ydata = ydata
+        if n_appended is None or self._n_appended is None:
+            self._n_appended = None
+        else:
+            self._n_appended += n_appended
+        self.ask_draw()
+
+    def get_data(self):
+        """Return the x and y values of the points as two arrays.
+        """
+        if self._xdata is not None:
+            return self._xdata, self._ydata
+        data = np.asarray(self.points, dtype=float).reshape(-1, 2)
+        return data[:, 0], data[:, 1]
+
+    def get_bin_size(self, x):
+        """Return the number of samples falling in each pixel column, or 0 if
+        the points should not be decimated.
+        """
+        params = self.params
+        size = params["size"]
+        width = size[2] - size[0]
+        if (self.decimation == 'none' or params["xlog"] or width <= 0
+                or len(x) < 2 or x[-1] <= x[0]):
+            return 0
+        bin_size = int((len(x) - 1) * (params["xmax"] - params["xmin"])
+                       / (width * float(x[-1] - x[0])))
+        # bins of two samples or less would not remove any point
+        return bin_size if bin_size > 2 else 0
+
+    def get_visible_range(self, x):
+        """Return the start and end indices of the visible points, with the
+        first one on each side. The x values must be sorted.
+        """
+        params = self.params
+        start = max(np.searchsorted(x, params["xmin"]) - 1, 0)
+        end = np.searchsorted(x, params["xmax"], side='right') + 1
+        return start, end
+
+    def decimate(self, x, y):
+        """Return the x and y values of the points to be drawn, decimated
+        according to :attr:`decimation`.
+        """
+        n_appended = self._n_appended
+        self._n_appended = 0
+        bin_size = self.get_bin_size(x)
+        if not bin_size:
+            self._decimator = None
+            return x, y
+        start, end = self.get_visible_range(x)
+        x = x[start:end]
+        y = y[start:end]
+        if self._decimator is None:
+            self._decimator = MinMaxDecimator()
+        indices = self._decimator.decimate(y, bin_size, n_appended)
+        return x[indices], y[indices]
+
+    def project_points(self):
+        """Return all the points adjusted to the graph settings as a (N, 2)
+        float32 array, computed with a single vectorized operation per axis.
+        Requires numpy.
+        """
+        x, y = self.decimate(*self.get_data())
+        params = self.params
+        size = params["size"]
+        points = np.empty((len(x), 2), dtype=np.float32)
+        points[:, 0] = self._project_array(
+            x, params["xlog"], params["xmin"], params["xmax"], size[0], size[2])
+        points[:, 1] = self._project_array(
+            y, params["ylog"], params["ymin"], params["ymax"], size[1], size[3])
+        return points
+
     def unproject(self, x, y):
         """Return a function that unproject a pixel to a X/Y value on the plot
         (works only for linear, not log yet). `x`, `y`, is relative to the
@@ -1125,9 +1299,19 @@ class Plot(EventDispatcher):
         '''
         x_px = self.x_px()
         y_px = self.y_px()
-        for x, y in self.points:
+        if self._xdata is not None:
+            points = zip(self._xdata, self._ydata)
+        else:
+            points = self.points
+        for x, y in points:
             yield x_px(x), y_px(y)
 
+    def on_points(self, *largs):
+        # points set explicitly replace the ones set with set_data
+        self._xdata = None
+        self._ydata = None
+        self._n_appended = None
+
     def on_clear_plot(self, *largs):
         pass
 
@@ -1164,6 +1348,12 @@ class MeshLinePlot(Plot):
         self.plot_mesh()
 
     def plot_mesh(self):
+        if np is not None:
+            points = self.project_points()
+            vert = self.set_mesh_array_size(len(points))
+            vert[:, :2] = points
+            self._mesh.vertices = vert.ravel()
+            return
         points = [p for p in self.iterate_points()]
         mesh, vert, _ = self.set_mesh_size(len(points))
         for k, (x, y) in enumerate(points):
@@ -1171,6 +1361,15 @@ class MeshLinePlot(Plot):
             vert[k * 4 + 1] = y
         mesh.vertices = vert
 
+    def set_mesh_array_size(self, size):
+        """Return a (size, 4) float32 array for the vertices of the mesh, which
+        is passed to the mesh as a buffer instead of a list.
+        """
+        mesh = self._mesh
+        if len(mesh.indices) != size:
+            mesh.indices = list(range(size))
+        return np.zeros((size, 4), dtype=np.float32)
+
     def set_mesh_size(self, size):
         mesh = self._mesh
         vert = mesh.vertices
@@ -1192,6 +1391,14 @@ class MeshStemPlot(MeshLinePlot):
     '''
 
     def plot_mesh(self):
+        if np is not None:
+            points = self.project_points()
+            vert = self.set_mesh_array_size(len(points) * 2)
+            vert[0::2, 0] = points[:, 0]
+            vert[0::2, 1] = self.y_px()(0)
+            vert[1::2, :2] = points
+            self._mesh.vertices = vert.ravel()
+            return
         points = [p for p in self.iterate_points()]
         mesh, vert, _ = self.set_mesh_size(len(points) * 2)
         y0 = self.y_px()(0)
@@ -1225,6 +1432,9 @@ class LinePlot(Plot):
 
     def draw(self, *args):
         super(LinePlot, self).draw(*args)
+        if np is not None:
+            self._gline.points = self.project_points().ravel().tolist()
+            return
         # flatten the list
         points = []
         for x, y in self.iterate_points():
@@ -1236,6 +1446,247 @@ class LinePlot(Plot):
             self._gline.width = self.line_width
 
 
+class ScrollingLinePlot(Plot):
+    """ScrollingLinePlot draws a scrolling window of uniformly spaced samples,
+    such as the last seconds of a signal, whose new samples are notified
+    with the `n_appended` argument of :meth:`Plot.set_data`.
+
+    The y values are kept in a persistent vertex buffer, in which only the
+    new samples are written, in a circular slot. Each sample is written
+    twice, so that the window is always a contiguous range of vertices, and
+    the x value of a vertex is its index in the buffer. The projection to
+    pixels, and the scrolling, are done by the transformation of the canvas
+    instead of projecting the history again. Axis changes only update the
+    transformation.
+
+    When the window has more samples than :attr:`Plot.decimation` keeps,
+    i.e. more than two per pixel column with 'minmax', the decimated points
+    are projected instead, so that the vertices uploaded on each frame
+    depend on the width of the plot rather than on the window length. The
+    points are also projected with log axes. Mesh indices are unsigned
+    shorts, so longer windows are always decimated to fit in one mesh.
+    """
+
+    MAX_VERTICES = 65536
+
+    decimation = OptionProperty('minmax', options=['none', 'minmax'])
+
+    def create_drawings(self):
+        from kivy.graphics import PushMatrix, PopMatrix, Translate, Scale
+
+        self._color = Color(*self.color)
+        self._translate = Translate()
+        self._scale = Scale()
+        self._mesh = Mesh(mode='line_strip')
+        self.bind(color=lambda instr, value: setattr(self._color, "rgba", value))
+        # persistent vertex buffer, holding each sample twice
+        self._vertices = None
+        self._indices = None
+        # slot of the oldest sample in the vertex buffer
+        self._slot = 0
+        return [self._color, PushMatrix(), self._translate, self._scale,
+                self._mesh, PopMatrix()]
+
+    def draw(self, *args):
+        super(ScrollingLinePlot, self).draw(*args)
+        x, y = self.get_data()
+        n_points = len(y)
+        params = self.params
+        # mesh indices are unsigned shorts
+        if (n_points < 2 or 2 * n_points > self.MAX_VERTICES
+                or params["xlog"] or params["ylog"] or self.get_bin_size(x)):
+            self._draw_projected()
+            return
+        n_appended = self._n_appended
+        self._n_appended = 0
+        # the decimator missed the samples drawn without it
+        self._decimator = None
+
+        vert = self._vertices
+        if (n_appended is None or vert is None or len(vert) != 2 * n_points
+                or n_appended >= n_points):
+            vert = self._vertices = np.zeros((2 * n_points, 4),
+                                             dtype=np.float32)
+            vert[:, 0] = np.arange(2 * n_points)
+            vert[:n_points, 1] = y
+            vert[n_points:, 1] = y
+            self._indices = np.arange(2 * n_points, dtype=np.uint16)
+            self._slot = 0
+        elif n_appended:
+            slots = (self._slot + np.arange(n_appended)) % n_points
+            new_values = y[n_points - n_appended:]
+            vert[slots, 1] = new_values
+            vert[slots + n_points, 1] = new_values
+            self._slot = (self._slot + n_appended) % n_points
+        mesh = self._mesh
+        mesh.vertices = vert.ravel()
+        mesh.indices = self._indices[self._slot:self._slot + n_points]
+
+        # vertex k of the window is at x[0] + k * dx, in graph units
+        size = params["size"]
+        ratiox = (size[2] - size[0]) / float(params["xmax"] - params["xmin"])
+        ratioy = (size[3] - size[1]) / float(params["ymax"] - params["ymin"])
+        dx = (x[-1] - x[0]) / float(n_points - 1)
+        scalex = dx * ratiox
+        self._scale.xyz = (scalex, ratioy, 1)
+        self._translate.xy = (
+            size[0] + (x[0] - params["xmin"]) * ratiox - self._slot * scalex,
+            size[1] - params["ymin"] * ratioy)
+
+    def get_bin_size(self, x):
+        bin_size = super(ScrollingLinePlot, self).get_bin_size(x)
+        if len(x) > self.MAX_VERTICES:
+            # two points per bin, and two partial bins
+            min_bin_size = -(-2 * len(x) // (self.MAX_VERTICES - 4))
+            bin_size = max(bin_size, min_bin_size, 3)
+        return bin_size
+
+    def _draw_projected(self):
+        self._vertices = None
+        points = self.project_points()
+        vert = np.zeros((len(points), 4), dtype=np.float32)
+        vert[:, :2] = points
+        mesh = self._mesh
+        mesh.vertices = vert.ravel()
+        mesh.indices = np.arange(len(points), dtype=np.uint16)
+        self._scale.xyz = (1, 1, 1)
+        self._translate.xy = (0, 0)
+
+
+class MultiLinePlot(Plot):
+    """MultiLinePlot draws several traces sharing the same x values, such as
+    the channels of a board, with a single mesh. The points of all the traces
+    are packed in one vertex buffer, with the color of each trace as a vertex
+    attribute, so that they are drawn in one pass whatever their number.
+
+    The traces are set with :meth:`Plot.set_data`, with a (n_traces, N) array
+    of y values. Mesh indices are unsigned shorts, so the traces are decimated
+    as needed to fit in one mesh, in addition to :attr:`Plot.decimation`,
+    which defaults to 'minmax'.
+    """
+
+    MULTI_VS = '''
+    $HEADER$
+    attribute vec4 vColor;
+
+    void main(void) {
+        frag_color = vColor * vec4(1., 1., 1., opacity);
+        gl_Position = projection_mat * modelview_mat * vec4(vPosition.xy, 0., 1.);
+    }
+    '''
+
+    MULTI_FS = '''
+    $HEADER$
+
+    void main(void) {
+        gl_FragColor = frag_color;
+    }
+    '''
+
+    MAX_VERTICES = 65536
+
+    decimation = OptionProperty('minmax', options=['none', 'minmax'])
+
+    colors = ListProperty([])
+    '''Colors of the traces. The color of the plot is used for the traces
+    without one.
+    '''
+
+    def __init__(self, **kwargs):
+        self._decimators = []
+        super(MultiLinePlot, self).__init__(**kwargs)
+        self.bind(colors=self.ask_draw, color=self.ask_draw)
+
+    def create_drawings(self):
+        from kivy.graphics import RenderContext
+
+        self._grc = RenderContext(
+            vs=MultiLinePlot.MULTI_VS,
+            fs=MultiLinePlot.MULTI_FS,
+            use_parent_modelview=True,
+            use_parent_projection=True)
+        with self._grc:
+            self._mesh = Mesh(
+                mode='lines',
+                fmt=[(b'vPosition', 2, 'float'), (b'vColor', 4, 'float')])
+        return [self._grc]
+
+    def get_trace_colors(self, n_traces):
+        colors = np.empty((n_traces, 4), dtype=np.float32)
+        for trace in range(n_traces):
+            if trace < len(self.colors):
+                colors[trace] = self.colors[trace]
+            else:
+                colors[trace] = self.color
+        return colors
+
+    def draw(self, *args):
+        super(MultiLinePlot, self).draw(*args)
+        mesh = self._mesh
+        n_appended = self._n_appended
+        self._n_appended = 0
+        if self._xdata is None or len(self._xdata) == 0:
+            mesh.vertices = []
+            mesh.indices = []
+            return
+        x = self._xdata
+        ys = np.atleast_2d(self._ydata)
+        n_traces = len(ys)
+        params = self.params
+
+        # decimate each trace, so that all of them fit in the mesh
+        if not params["xlog"]:
+            start, end = self.get_visible_range(x)
+            x = x[start:end]
+            ys = ys[:, start:end]
+        if len(x) < 2:
+            mesh.vertices = []
+            mesh.indices = []
+            return
+        bin_size = self.get_bin_size(x)
+        n_points = len(x)
+        if n_points * n_traces > self.MAX_VERTICES:
+            # two points per bin, and two partial bins per trace
+            min_bin_size = -(-2 * n_points * n_traces
+                             // (self.MAX_VERTICES - 4 * n_traces))
+            bin_size = max(bin_size, min_bin_size, 3)
+        if bin_size:
+            if len(self._decimators) != n_traces:
+                self._decimators = [MinMaxDecimator() for _ in range(n_traces)]
+            traces = []
+            for trace in range(n_traces):
+                indices = self._decimators[trace].decimate(
+                    ys[trace], bin_size, n_appended)
+                traces.append((x[indices], ys[trace][indices]))
+            xs = np.concatenate([trace_x for trace_x, _ in traces])
+            ys = np.concatenate([trace_y for _, trace_y in traces])
+            lengths = np.array([len(trace_x) for trace_x, _ in traces])
+        else:
+            self._decimators = []
+            xs = np.tile(x, n_traces)
+            ys = ys.ravel()
+            lengths = np.full(n_traces, n_points)
+
+        # project all the points, and add the color of their trace
+        size = params["size"]
+        vert = np.empty((len(xs), 6), dtype=np.float32)
+        vert[:, 0] = self._project_array(
+            xs, params["xlog"], params["xmin"], params["xmax"], size[0], size[2])
+        vert[:, 1] = self._project_array(
+            ys, params["ylog"], params["ymin"], params["ymax"], size[1], size[3])
+        vert[:, 2:] = np.repeat(self.get_trace_colors(n_traces), lengths, axis=0)
+
+        # a segment between each point and the next one of the same trace
+        segment_starts = np.ones(len(xs), dtype=bool)
+        segment_starts[np.cumsum(lengths) - 1] = False
+        segment_starts = np.flatnonzero(segment_starts)
+        indices = np.empty(2 * len(segment_starts), dtype=np.uint16)
+        indices[0::2] = segment_starts
+        indices[1::2] = segment_starts + 1
+        mesh.vertices = vert.ravel()
+        mesh.indices = indices
+
+
 class SmoothLinePlot(Plot):
     '''Smooth Plot class, see module documentation for more information.
     This plot use a specific Fragment shader for a custom anti aliasing.
@@ -1294,6 +1745,9 @@ class SmoothLinePlot(Plot):
 
     def draw(self, *args):
         super(SmoothLinePlot, self).draw(*args)
+        if np is not None:
+            self._gline.points = self.project_points().ravel().tolist()
+            return
         # flatten the list
         points = []
         for x, y in self.iterate_points():
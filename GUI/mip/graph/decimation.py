@@ -0,0 +1,127 @@
+"""
+Decimation of the points of a plot.
+
+Plots showing long windows of data have many more points than pixels
+along the x axis. Drawing them all costs time, without adding anything
+to the picture. The decimators in this module reduce a trace to about
+two points per horizontal pixel, while keeping its spikes visible.
+"""
+import numpy as np
+
+
+class MinMaxDecimator:
+    """
+    Min/max decimation of a trace with uniformly spaced x values.
+
+    The samples are grouped in bins of `bin_size` consecutive samples,
+    one bin per pixel column, and only the minimum and the maximum of
+    each bin are kept, in the order in which they appear. The bins are
+    aligned to the absolute index of the samples, so that when the data
+    scrolls, i.e. new samples are appended and the oldest are dropped,
+    the bins already computed remain valid: only the bins holding new
+    samples and the partial bin at the left edge are computed again.
+
+    Usage:
+
+    >>> decimator = MinMaxDecimator()
+    >>> indices = decimator.decimate(y, bin_size=10)
+    >>> # 5 new samples were appended at the end of y
+    >>> indices = decimator.decimate(y, bin_size=10, n_appended=5)
+    >>> plot_x, plot_y = x[indices], y[indices]
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # Total number of samples seen, used as absolute index
+        self.total = 0
+        self.bin_size = 0
+        self.n_samples = 0
+        # Absolute index of the first cached bin
+        self.first_bin = 0
+        # Absolute indices of the two points kept for each cached bin
+        self.bin_indices = np.empty((0, 2), dtype=np.int64)
+
+    def bins_indices(self, y, start, bin_size):
+        """
+        Return the absolute indices of the minimum and the maximum of
+        the complete bins found in y, ordered by index.
+
+        Args:
+            - y: samples, whose length is a multiple of bin_size
+            - start: absolute index of the first sample of y
+            - bin_size: number of samples in each bin
+
+        Returns:
+            - array with shape (n_bins, 2)
+        """
+        bins = y.reshape(-1, bin_size)
+        offsets = start + np.arange(len(bins)) * bin_size
+        i_min = bins.argmin(axis=1) + offsets
+        i_max = bins.argmax(axis=1) + offsets
+        return np.sort(np.stack((i_min, i_max), axis=1), axis=1)
+
+    def decimate(self, y, bin_size, n_appended=None):
+        """
+        Decimate a trace.
+
+        Args:
+            - y: samples of the trace
+            - bin_size: number of samples in each bin
+            - n_appended: number of samples appended at the end of y since
+              the last call, while the same number of samples was dropped
+              from its beginning, or None if y changed in any other way
+
+        Returns:
+            - indices of the points of y to be drawn
+        """
+        n_samples = len(y)
+        if (
+            n_appended is None
+            or bin_size != self.bin_size
+            or n_samples != self.n_samples
+            or n_appended >= n_samples
+        ):
+            self.reset()
+            self.bin_size = bin_size
+            self.n_samples = n_samples
+            self.total = n_samples
+        else:
+            self.total += n_appended
+
+        start = self.total - n_samples
+        # Complete bins in the window
+        first_bin = -(-start // bin_size)
+        end_bin = self.total // bin_size
+
+        # Drop the bins that left the window, and compute the new ones
+        n_cached = len(self.bin_indices)
+        drop = min(max(first_bin - self.first_bin, 0), n_cached)
+        self.bin_indices = self.bin_indices[drop:]
+        self.first_bin += drop
+        if len(self.bin_indices) == 0:
+            self.first_bin = first_bin
+        next_bin = self.first_bin + len(self.bin_indices)
+        if end_bin > next_bin:
+            new_start = next_bin * bin_size
+            new_indices = self.bins_indices(
+                y[new_start - start : end_bin * bin_size - start],
+                new_start,
+                bin_size,
+            )
+            self.bin_indices = np.concatenate((self.bin_indices, new_indices))
+
+        # Partial bins at both edges of the window
+        parts = []
+        head = min(first_bin * bin_size, self.total) - start
+        if head > 0:
+            parts.append(self.partial_bin_indices(y[:head], start))
+        parts.append(self.bin_indices.ravel())
+        tail = self.total - max(end_bin * bin_size, start)
+        if tail > 0 and end_bin >= first_bin:
+            parts.append(self.partial_bin_indices(y[-tail:], self.total - tail))
+        return np.concatenate(parts) - start
+
+    def partial_bin_indices(self, y, start):
+        return np.sort(np.array([y.argmin(), y.argmax()]) + start)
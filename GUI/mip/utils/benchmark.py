@@ -0,0 +1,429 @@
+"""
+End-to-end benchmark of the acquisition pipeline.
+
+Each scenario connects MIPSerial to simulated boards streaming at a
+given rate, optionally with the data exporter and the graphs enabled,
+and measures:
+
+- the number of packets per second handled by each stage
+- the p50/p99 latency of each stage, from the time at which a sample
+  was generated by the board to the time at which the stage has
+  handled it:
+    - decode: the read thread has decoded and dispatched the packet
+    - export: the exporter has formatted (and possibly written) it
+    - plot: the graphs have been updated with it
+    - draw: the graphs have been redrawn after it was plotted
+- the CPU usage and the resident memory of the process
+
+Every board runs in its own process, with its own MIPSerial instance,
+so that scenarios with N boards load the machine as N GUIs would.
+Results are printed and optionally stored as JSON, so that they can
+be compared across versions.
+
+Run it from the GUI folder:
+
+    python -m mip.utils.benchmark --rates 10 100 --boards 1 4 --output bench.json
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Keep Kivy from parsing the command line arguments of the benchmark
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DEFAULT_RATES = [1, 10, 25, 50, 100]
+"""
+Sample rates, in Hz, of the default scenarios.
+"""
+
+DEFAULT_DURATION = 10.0
+"""
+Default duration of each scenario, in seconds.
+"""
+
+WARMUP_TIME = 1.0
+"""
+Time, in seconds, discarded at the beginning of each scenario.
+"""
+
+FRAME_INTERVAL = 1 / 60
+"""
+Interval, in seconds, between two frames of the simulated GUI loop.
+"""
+
+STAGES = ["decode", "export", "plot", "draw"]
+"""
+Stages whose latency is measured.
+"""
+
+
+class StageProbe:
+    """
+    Collect the latencies of the packets handled by a pipeline stage.
+
+    Packets are counted in the order in which they are handled, so
+    that the time at which each packet was sent can be computed from
+    the start time and the sample rate of the board: the k-th sample
+    is sent at the end of its sample period, (k + 1) / sample_rate
+    seconds after the start of the stream.
+    """
+
+    def __init__(self, board, warmup_time=WARMUP_TIME):
+        self.board = board
+        self.warmup_time = warmup_time
+        self.n_packets = 0
+        self.latencies = []
+        self.start_time = None
+        self.end_time = None
+
+    def packets_handled(self, n_packets):
+        now = time.monotonic()
+        board = self.board
+        samples = np.arange(self.n_packets, self.n_packets + n_packets)
+        self.n_packets += n_packets
+        sample_times = board.start_time + (samples + 1) / board.sample_rate
+        valid = sample_times >= board.start_time + self.warmup_time
+        if np.any(valid):
+            if self.start_time is None:
+                self.start_time = now
+            self.end_time = now
+            self.latencies.append(now - sample_times[valid])
+
+    def last_sample_time(self):
+        board = self.board
+        return board.start_time + self.n_packets / board.sample_rate
+
+    def summary(self):
+        if len(self.latencies) == 0:
+            return {"packets": 0, "packets_per_second": 0.0, "latencies": []}
+        latencies = np.concatenate(self.latencies)
+        elapsed = self.end_time - self.start_time
+        return {
+            "packets": int(len(latencies)),
+            "packets_per_second": len(latencies) / elapsed if elapsed > 0 else 0.0,
+            "latencies": latencies.tolist(),
+        }
+
+
+def memory_usage():
+    """
+    Return the current and peak resident memory of the process, in MB,
+    or None where they cannot be measured.
+    """
+    if resource is None:
+        return None, None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    peak /= 1024 * 1024 if sys.platform == "darwin" else 1024
+    current = None
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+            current /= 1024 * 1024
+    except (OSError, ValueError):
+        pass
+    return current, peak
+
+
+def run_board(rate, export, plot, duration, transport, data_format, board_id):
+    """
+    Run a scenario for one board in the current process.
+
+    Returns:
+        - dictionary with the metrics of the board
+    """
+    from kivy.clock import Clock
+    from kivy.lang import Builder
+
+    from mip.communication.mserial import (
+        BOARD_CONNECTED,
+        BOARD_DISCONNECTED,
+        DEFAULT_WORKER,
+        EXPORT_WORKER,
+        MIPSerial,
+    )
+    from mip.communication.simulator import (
+        BoardServer,
+        PtyTransport,
+        SimulatedBoard,
+        TcpTransport,
+    )
+
+    board = SimulatedBoard(sample_rate=rate, seed=board_id, board_id=board_id)
+    server = BoardServer(
+        board, PtyTransport() if transport == "pty" else TcpTransport()
+    )
+    server.start()
+
+    serial = MIPSerial(auto_connect=False)
+    probes = {stage: StageProbe(board) for stage in STAGES}
+
+    process_data = serial.process_data
+
+    def timed_process_data(data):
+        samples_read = serial.samples_read
+        process_data(data)
+        n_packets = serial.samples_read - samples_read
+        if n_packets > 0:
+            probes["decode"].packets_handled(n_packets)
+
+    serial.process_data = timed_process_data
+
+    export_dir = None
+    if export:
+        export_dir = tempfile.TemporaryDirectory()
+        serial.exporter.save_data = True
+        serial.exporter.data_path = Path(export_dir.name)
+        serial.exporter.set_output_format(serial.exporter, data_format)
+        serial.exporter.init_file()
+
+        def timed_export(packets):
+            probes["export"].packets_handled(len(packets))
+
+        # Called after the exporter, on the same worker
+        serial.add_batch_callback(timed_export, worker=EXPORT_WORKER)
+
+    graph_manager = None
+    if plot:
+        Builder.load_file("mip/widgets/graph_tabs.kv")
+        from mip.widgets.graph_tabs import GraphManager
+
+        graph_manager = GraphManager()
+        graph_manager.num_samples_per_second = int(rate)
+        serial.add_callback(graph_manager.update_plots, worker=DEFAULT_WORKER)
+
+        def timed_plot(packet):
+            probes["plot"].packets_handled(1)
+
+        serial.add_callback(timed_plot, worker=DEFAULT_WORKER)
+
+    serial.port_name = server.port_name
+    if serial.connect() != 0 or serial.connected != BOARD_CONNECTED:
+        raise RuntimeError(f"Could not connect to {server.port_name}")
+
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    serial.start_streaming()
+    draw_latencies = []
+    while time.monotonic() - wall_start < duration:
+        frame_start = time.monotonic()
+        # Time at which the last plotted sample was sent, before redrawing
+        sample_time = probes["plot"].last_sample_time()
+        Clock.tick()
+        if plot and sample_time >= board.start_time + WARMUP_TIME:
+            draw_latencies.append(time.monotonic() - sample_time)
+        time.sleep(max(0, FRAME_INTERVAL - (time.monotonic() - frame_start)))
+    serial.stop_streaming()
+    wall_time = time.monotonic() - wall_start
+    cpu_time = time.process_time() - cpu_start
+    if export:
+        serial.exporter.close_file()
+        export_dir.cleanup()
+    serial.connected = BOARD_DISCONNECTED
+    serial.port.close()
+    server.stop()
+
+    stages = {stage: probes[stage].summary() for stage in STAGES}
+    if plot:
+        stages["draw"] = {
+            "packets": len(draw_latencies),
+            "packets_per_second": None,
+            "latencies": draw_latencies,
+        }
+    rss, peak_rss = memory_usage()
+    return {
+        "board_id": board_id,
+        "stages": stages,
+        "cpu_percent": 100 * cpu_time / wall_time,
+        "rss_mb": rss,
+        "peak_rss_mb": peak_rss,
+        "dropped_packets": sum(
+            worker.dropped_packets for worker in serial.dispatcher.workers
+        ),
+        "skipped_packets": serial.framer.skipped_packets,
+    }
+
+
+def run_board_process(results, args):
+    """
+    Run a scenario for one board in a child process.
+
+    The metrics are put in the results queue, and the process then
+    exits right away: the widgets created by the plot scenarios can
+    otherwise keep the process from terminating.
+    """
+    from loguru import logger
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    try:
+        results.put(run_board(*args))
+    except Exception as e:
+        logger.exception("Benchmark failed")
+        results.put({"error": repr(e)})
+    results.close()
+    results.join_thread()
+    os._exit(0)
+
+
+def run_boards(context, board_args, timeout):
+    """
+    Run a scenario for several boards, each one in its own process.
+
+    Returns:
+        - list with the metrics of each board
+    """
+    results = context.Queue()
+    processes = [
+        context.Process(target=run_board_process, args=(results, args))
+        for args in board_args
+    ]
+    for process in processes:
+        process.start()
+    board_results = [results.get(timeout=timeout) for _ in processes]
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.kill()
+    errors = [result["error"] for result in board_results if "error" in result]
+    if errors:
+        raise RuntimeError(f"Benchmark failed: {errors[0]}")
+    return sorted(board_results, key=lambda result: result["board_id"])
+
+
+def sum_or_none(values):
+    if any(value is None for value in values):
+        return None
+    return sum(values)
+
+
+def summarize(board_results, rate, n_boards, export, plot):
+    """
+    Merge the metrics of the boards of a scenario.
+    """
+    stages = {}
+    for stage in STAGES:
+        results = [result["stages"][stage] for result in board_results]
+        latencies = [lat for result in results for lat in result["latencies"]]
+        if len(latencies) == 0:
+            continue
+        rates = [result["packets_per_second"] for result in results]
+        stages[stage] = {
+            "packets": len(latencies),
+            "packets_per_second": (
+                sum(rates) if all(r is not None for r in rates) else None
+            ),
+            "latency_p50_ms": 1000 * float(np.percentile(latencies, 50)),
+            "latency_p99_ms": 1000 * float(np.percentile(latencies, 99)),
+            "latency_max_ms": 1000 * float(np.max(latencies)),
+        }
+    return {
+        "rate": rate,
+        "boards": n_boards,
+        "export": export,
+        "plot": plot,
+        "stages": stages,
+        "cpu_percent": sum(result["cpu_percent"] for result in board_results),
+        "rss_mb": sum_or_none([result["rss_mb"] for result in board_results]),
+        "peak_rss_mb": sum_or_none([result["peak_rss_mb"] for result in board_results]),
+        "dropped_packets": sum(result["dropped_packets"] for result in board_results),
+        "skipped_packets": sum(result["skipped_packets"] for result in board_results),
+    }
+
+
+def format_scenario(result):
+    stages = " ".join(
+        f"{stage}={values['latency_p50_ms']:.1f}/{values['latency_p99_ms']:.1f}ms"
+        for stage, values in result["stages"].items()
+    )
+    decode = result["stages"].get("decode", {})
+    return (
+        f"{result['rate']:>6g} Hz x{result['boards']} "
+        f"export={'on ' if result['export'] else 'off'} "
+        f"plot={'on ' if result['plot'] else 'off'} | "
+        f"{decode.get('packets_per_second', 0):8.1f} pkt/s | "
+        f"CPU {result['cpu_percent']:5.1f}% | RSS {result['rss_mb'] or 0:6.1f} MB | "
+        f"dropped {result['dropped_packets']} | p50/p99 {stages}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the acquisition pipeline.")
+    parser.add_argument(
+        "--rates", type=float, nargs="+", default=DEFAULT_RATES, help="Rates, in Hz."
+    )
+    parser.add_argument(
+        "--boards", type=int, nargs="+", default=[1], help="Numbers of boards."
+    )
+    parser.add_argument(
+        "--export", choices=["on", "off"], nargs="+", default=["off", "on"]
+    )
+    parser.add_argument(
+        "--plot", choices=["on", "off"], nargs="+", default=["off", "on"]
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=DEFAULT_DURATION,
+        help="Duration of each scenario, in seconds.",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=["pty", "tcp"],
+        default="tcp",
+        help="Transport between the simulated boards and MIPSerial.",
+    )
+    parser.add_argument("--format", default="csv", help="Format of exported data.")
+    parser.add_argument("--output", default=None, help="JSON file for the results.")
+    args = parser.parse_args()
+
+    from loguru import logger
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    results = []
+    scenarios = itertools.product(args.rates, args.boards, args.export, args.plot)
+    context = multiprocessing.get_context("spawn")
+    for rate, n_boards, export, plot in scenarios:
+        export = export == "on"
+        plot = plot == "on"
+        board_args = [
+            (rate, export, plot, args.duration, args.transport, args.format, idx)
+            for idx in range(n_boards)
+        ]
+        board_results = run_boards(context, board_args, args.duration + 60)
+        result = summarize(board_results, rate, n_boards, export, plot)
+        results.append(result)
+        print(format_scenario(result), flush=True)
+
+    if args.output is not None:
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "duration": args.duration,
+            "transport": args.transport,
+            "scenarios": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Buffers holding the samples shown in the graphs.
+"""
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed size circular buffer holding the last samples of several traces.
+
+    Every sample is written twice, at idx and idx + size, so that the
+    last `size` samples of each trace are always available, oldest
+    first, as a contiguous view of the underlying array. Appending a
+    sample is therefore O(1), and reading the whole window requires
+    no copy, regardless of the window length.
+
+    Usage:
+
+    >>> buffer = RingBuffer(n_traces=1, size=3)
+    >>> for value in range(5):
+    ...     buffer.append([value])
+    >>> buffer.view(0)
+    array([2., 3., 4.])
+    """
+
+    def __init__(self, n_traces, size, fill_value=0.0):
+        self.n_traces = n_traces
+        self.size = size
+        self.data = np.full((n_traces, 2 * size), fill_value, dtype=float)
+        # Position of the oldest sample
+        self.idx = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, values):
+        """
+        Append one sample to each trace.
+
+        Args:
+            - values: sequence with one value for each trace
+        """
+        idx = self.idx
+        data = self.data
+        data[:, idx] = values
+        data[:, idx + self.size] = values
+        self.idx = idx + 1 if idx + 1 < self.size else 0
+
+    def extend(self, values):
+        """
+        Append several samples to each trace.
+
+        Args:
+            - values: array with shape (n_traces, n_samples)
+        """
+        values = np.asarray(values, dtype=float).reshape(self.n_traces, -1)
+        n_samples = values.shape[1]
+        if n_samples == 0:
+            return
+        if n_samples > self.size:
+            values = values[:, -self.size :]
+            n_samples = self.size
+        positions = (self.idx + np.arange(n_samples)) % self.size
+        self.data[:, positions] = values
+        self.data[:, positions + self.size] = values
+        self.idx = (self.idx + n_samples) % self.size
+
+    def view(self, trace=None):
+        """
+        Return the samples in the buffer, oldest first, without copying them.
+
+        Args:
+            - trace: index of the trace, None for all the traces
+
+        Returns:
+            - array view with shape (size,), or (n_traces, size)
+        """
+        if trace is None:
+            return self.data[:, self.idx : self.idx + self.size]
+        return self.data[trace, self.idx : self.idx + self.size]
+
+    def fill(self, value):
+        self.data.fill(value)
+        self.idx = 0
+
+
+class MonotonicDeque:
+    """
+    Deque of the candidate extremes of the last samples of a trace.
+
+    The deque holds the samples that can still be the maximum (or the
+    minimum) of a window ending at the last sample: each sample removes
+    from the tail the ones that it dominates, and leaves the head when
+    it is older than `size` samples. The values are therefore sorted
+    from the head, holding the extreme of the whole window, to the
+    tail, holding the last sample. Appending is O(1) amortized, and the
+    extreme of the last `window` samples is the first candidate not
+    older than the window, found in O(1) for the whole window and by
+    binary search for shorter ones.
+
+    The candidates are stored in arrays twice as long as the window,
+    compacted when the tail reaches their end.
+    """
+
+    def __init__(self, size, keep_max=True, fill_value=0.0):
+        self.size = size
+        self.keep_max = keep_max
+        self.indices = np.empty(2 * size, dtype=np.int64)
+        self.values = np.empty(2 * size, dtype=float)
+        self.fill(fill_value)
+
+    def fill(self, value):
+        """
+        Reset the deque as if `size` samples equal to value were appended.
+        """
+        # Equal samples dominate each other, only the last one is kept
+        self.count = self.size
+        self.indices[0] = self.size - 1
+        self.values[0] = value
+        self.head = 0
+        self.tail = 1
+
+    def append(self, value):
+        indices = self.indices
+        values = self.values
+        head = self.head
+        tail = self.tail
+        if self.keep_max:
+            while tail > head and values[tail - 1] <= value:
+                tail -= 1
+        else:
+            while tail > head and values[tail - 1] >= value:
+                tail -= 1
+        if head < tail and indices[head] <= self.count - self.size:
+            head += 1
+        if tail == len(indices):
+            n_candidates = tail - head
+            indices[:n_candidates] = indices[head:tail]
+            values[:n_candidates] = values[head:tail]
+            head = 0
+            tail = n_candidates
+        indices[tail] = self.count
+        values[tail] = value
+        self.head = head
+        self.tail = tail + 1
+        self.count += 1
+
+    def extreme(self, window=None):
+        """
+        Return the extreme of the last samples.
+
+        Args:
+            - window: number of samples, None for all the samples in the deque
+        """
+        if window is None or window >= self.size:
+            return self.values[self.head]
+        first = np.searchsorted(
+            self.indices[self.head : self.tail], self.count - window
+        )
+        return self.values[self.head + first]
+
+
+class SlidingExtrema:
+    """
+    Minimum and maximum of the last samples of a trace, updated on each
+    sample instead of scanning the samples again.
+
+    Usage:
+
+    >>> extrema = SlidingExtrema(size=1800)
+    >>> extrema.append(value)
+    >>> extrema.min(), extrema.max()
+    >>> # Extremes of the last 100 samples
+    >>> extrema.min(100), extrema.max(100)
+    """
+
+    def __init__(self, size, fill_value=0.0):
+        self.min_deque = MonotonicDeque(size, keep_max=False, fill_value=fill_value)
+        self.max_deque = MonotonicDeque(size, keep_max=True, fill_value=fill_value)
+
+    def append(self, value):
+        self.min_deque.append(value)
+        self.max_deque.append(value)
+
+    def min(self, window=None):
+        return float(self.min_deque.extreme(window))
+
+    def max(self, window=None):
+        return float(self.max_deque.extreme(window))
+
+    def fill(self, value):
+        self.min_deque.fill(value)
+        self.max_deque.fill(value)
@@ -5,16 +5,31 @@ from kivy.uix.tabbedpanel import TabbedPanel, TabbedPanelItem
 from kivy.uix.boxlayout import BoxLayout
 from kivy.properties import BooleanProperty, ObjectProperty, NumericProperty
 import re
-from mip.graph import LinePlot
+import threading
+import time
+import numpy as np
+from mip.graph import LinePlot, MultiLinePlot, ScrollingLinePlot
+from mip.widgets.buffers import SlidingExtrema
+from mip.widgets.history import SampleHistory
 from kivy.uix.tabbedpanel import TabbedPanelHeader
 from decimal import Decimal
 from math import pow, isclose
 from kivy.graphics import Color, Rectangle
+from kivy.clock import Clock
 import loguru
 
 # Default number of seconds to show
 DEFAULT_N_SECONDS = 180
 DEFAULT_SAMPLE_RATE = 10
+# Maximum number of redraws per second of the visible tab
+DEFAULT_MAX_FPS = 30
+# Number of redraws per second of the hidden tabs, 0 to redraw them only when shown
+DEFAULT_HIDDEN_TABS_FPS = 1
+# Maximum number of bins of history drawn beyond the last DEFAULT_N_SECONDS
+HISTORY_MAX_POINTS = 1000
+# Autoscale keeps the y range while it holds the data, unless the range fitting
+# the data is smaller than this fraction of it
+AUTOSCALE_SHRINK_RATIO = 0.5
 
 
 class GraphManager(TabbedPanel):
@@ -24,9 +39,13 @@ class GraphManager(TabbedPanel):
     autorange = BooleanProperty(False)
     n_seconds = NumericProperty(-DEFAULT_N_SECONDS)
 
+    max_fps = NumericProperty(DEFAULT_MAX_FPS)
+    hidden_tabs_fps = NumericProperty(DEFAULT_HIDDEN_TABS_FPS)
+
     def __init__(self, **kwargs):
         super(GraphManager, self).__init__(**kwargs)
-        self.n_points_per_update = 10
+        self.render_event = None
+        self.last_hidden_render_time = 0
         self.tabs_dict = {
             "S4-1": VoltagePlot(
                 color=[(0.5, 0.1, 0.1, 1)],
@@ -60,6 +79,20 @@ class GraphManager(TabbedPanel):
                 color=[(0.5, 0.1, 0.1, 1)],
                 legend=["AS-2"],
             ),
+            "Overlay": OverlayPlot(
+                n_plots=8,
+                color=[
+                    (0.9, 0.1, 0.1, 1),
+                    (0.9, 0.5, 0.1, 1),
+                    (0.9, 0.9, 0.1, 1),
+                    (0.1, 0.8, 0.1, 1),
+                    (0.1, 0.8, 0.8, 1),
+                    (0.2, 0.4, 0.9, 1),
+                    (0.6, 0.3, 0.9, 1),
+                    (0.9, 0.4, 0.7, 1),
+                ],
+                legend=["S4-1", "S4-2", "S4-3", "S4-4", "S6-1", "S6-2", "AS-1", "AS-2"],
+            ),
             "Temperature": TemperaturePlot(
                 color=(0.5, 0.1, 0.1, 1), legend="Temperature"
             ),
@@ -81,6 +114,42 @@ class GraphManager(TabbedPanel):
             )
             self.tabs_dict[tab].bind(autoscale=self.setter("autorange"))
             self.tabs_dict[tab].bind(xmin=self.setter("n_seconds"))
+        self.schedule_render()
+
+    def schedule_render(self):
+        """
+        Schedule the redraws of the plots on the Kivy clock.
+
+        Samples are only buffered as packets arrive: the plots are
+        redrawn at most max_fps times per second, whatever the rate of
+        the packets.
+        """
+        if self.render_event is not None:
+            self.render_event.cancel()
+        self.render_event = Clock.schedule_interval(self.render, 1.0 / self.max_fps)
+
+    def on_max_fps(self, instance, value):
+        self.schedule_render()
+
+    def on_current_tab(self, instance, value):
+        # Show the latest data as soon as a tab is selected
+        if value is not None and value.content is not None:
+            value.content.render()
+
+    def render(self, dt=0):
+        """
+        Redraw the visible tab, and the hidden ones at a lower rate.
+        """
+        visible_tab = self.current_tab.content if self.current_tab else None
+        if visible_tab is not None:
+            visible_tab.render()
+        if self.hidden_tabs_fps > 0:
+            now = time.monotonic()
+            if now - self.last_hidden_render_time >= 1.0 / self.hidden_tabs_fps:
+                self.last_hidden_render_time = now
+                for tab in self.tabs_dict.values():
+                    if tab is not visible_tab:
+                        tab.render()
 
     def on_autorange(self, instance, value):
         for tab in self.tabs_dict.keys():
@@ -103,6 +172,9 @@ class GraphManager(TabbedPanel):
         self.tabs_dict["S6-2"].update_plot(packet.get_resistance(5))
         self.tabs_dict["AS-1"].update_plot(packet.get_resistance(6))
         self.tabs_dict["AS-2"].update_plot(packet.get_resistance(7))
+        self.tabs_dict["Overlay"].update_plot(
+            [packet.get_resistance(channel) for channel in range(8)]
+        )
 
 
 class GraphPanelItem(BoxLayout):
@@ -117,7 +189,6 @@ class GraphPanelItem(BoxLayout):
 
     def __init__(self, n_plots=1, color=(0.5, 0.4, 0.4, 0.1), legend=[], **kwargs):
         self.max_seconds = self.xmin * (-1)
-        self.n_points_per_update = self.num_samples_per_second
         self.n_plots = n_plots
         if not isinstance(color, list):
             self.color = [color]
@@ -127,8 +198,15 @@ class GraphPanelItem(BoxLayout):
             self.legend = [legend]
         else:
             self.legend = legend
-        self.temp_points = [[] for _ in range(self.n_plots)]
-        self.y_points = [[] for _ in range(self.n_plots)]
+        self.n_new_points = 0
+        self.history = None
+        self.y_points = None
+        self.y_extrema = []
+        # Plots of the history older than the points, with its extremes
+        self.history_plots = []
+        self.history_range = None
+        # Guards the points, which are added from the serial threads
+        self.points_lock = threading.Lock()
         self.plots = []
         super(GraphPanelItem, self).__init__(**kwargs)
 
@@ -145,26 +223,101 @@ class GraphPanelItem(BoxLayout):
         self.graph.ymin = self.ymin
         self.graph.ymax = self.ymax
         self.graph.y_grid_label = True
-        self.n_points = (
-            self.max_seconds * self.num_samples_per_second
-        )  # Number of points to plot
-        self.time_between_points = (self.max_seconds) / float(self.n_points)
-        self.x_points = [x for x in range(-self.n_points, 0)]
-        for j in range(self.n_points):
-            self.x_points[j] = -self.max_seconds + j * self.time_between_points
+        self.init_points()
+        self.create_plots()
+        self.refresh_plots()
+
+    def create_plots(self):
+        """
+        Add to the graph a plot for each trace, with a plot of its history
+        drawn below it.
+        """
         for plot_index in range(self.n_plots):
-            self.y_points[plot_index] = [0 for y in range(-self.n_points, 0)]
             if plot_index > len(self.color):
                 color = self.color[0]
             else:
                 color = self.color[plot_index]
             # print(color)
-            plot = LinePlot(color=color)
-            plot.line_width = 2
-            plot.points = zip(self.x_points, self.y_points[plot_index])
+            history_plot = LinePlot(color=color)
+            self.history_plots.append(history_plot)
+            self.graph.add_plot(history_plot)
+            plot = ScrollingLinePlot(color=color)
             self.plots.append(plot)
             self.graph.add_plot(self.plots[plot_index])
 
+    def init_points(self):
+        """
+        Allocate the buffers of the points shown in the plots.
+
+        The y values of all the plots are stored in a ring buffer, so
+        that adding a new sample does not require moving the others.
+        """
+        self.n_points = (
+            self.max_seconds * self.num_samples_per_second
+        )  # Number of points to plot
+        self.time_between_points = (self.max_seconds) / float(self.n_points)
+        self.x_points = (
+            -self.max_seconds + np.arange(self.n_points) * self.time_between_points
+        )
+        # The points are the recent tier of the history
+        if self.history is None:
+            self.history = SampleHistory(
+                self.n_plots, self.n_points, self.num_samples_per_second
+            )
+        else:
+            self.history.reset_recent(self.n_points, self.num_samples_per_second)
+        self.y_points = self.history.recent
+        self.y_extrema = [SlidingExtrema(self.n_points) for _ in range(self.n_plots)]
+        self.n_new_points = 0
+
+    def refresh_plot(self, plot_index, n_appended=None):
+        # The ring buffer keeps being written by the consumer thread until
+        # the plot is drawn, so the plot gets a snapshot taken under the lock
+        y = self.y_points.view(plot_index).copy()
+        self.plots[plot_index].set_data(self.x_points, y, n_appended=n_appended)
+
+    def refresh_plots(self, n_appended=None):
+        for plot_index in range(self.n_plots):
+            self.refresh_plot(plot_index, n_appended=n_appended)
+
+    def refresh_history(self):
+        """
+        Draw the history older than the points, when the visible time
+        range goes beyond them.
+
+        The history is drawn as the minimum and maximum of its bins, at
+        the finest resolution with at most HISTORY_MAX_POINTS bins.
+        """
+        if -self.xmin <= self.max_seconds:
+            if self.history_range is not None:
+                self.history_range = None
+                self.draw_history(np.empty(0), np.empty((self.n_plots, 0)))
+            return
+        t_end = self.history.time
+        times, minimum, maximum, _ = self.history.query(
+            t_end + self.xmin, t_end, HISTORY_MAX_POINTS
+        )
+        x = np.repeat(times - t_end, 2)
+        y = np.empty((self.n_plots, len(x)))
+        y[:, 0::2] = minimum
+        y[:, 1::2] = maximum
+        self.draw_history(x, y)
+        if len(times) > 0:
+            self.history_range = (float(minimum.min()), float(maximum.max()))
+        else:
+            self.history_range = None
+
+    def draw_history(self, x, y):
+        """
+        Set the points of the history plots.
+
+        Args:
+            - x: times of the points, with shape (n,)
+            - y: values of the points of each trace, with shape (n_plots, n)
+        """
+        for plot_index, plot in enumerate(self.history_plots):
+            plot.set_data(x, y[plot_index])
+
     def on_plot_settings(self, instance, value):
         self.plot_settings.bind(n_seconds=self.setter("xmin"))
         self.plot_settings.bind(ymin=self.setter("ymin"))
@@ -182,28 +335,33 @@ class GraphPanelItem(BoxLayout):
         if value:
             self.autoscale_plots()
 
-    def autoscale_plots(self):
-        global_y_min = []
-        global_y_max = []
-        for plot_index in range(self.n_plots):
-            # Slice only the visible part
-            if abs(self.graph.xmin) < self.max_seconds:
-                y_points_slice = self.y_points[plot_index][
-                    (self.max_seconds - abs(self.graph.xmin))
-                    * self.num_samples_per_second :
-                ]
-            else:
-                y_points_slice = self.y_points[plot_index]
-
-            global_y_min.append(min(y_points_slice))
-            global_y_max.append(max(y_points_slice))
+    def get_n_visible_points(self):
+        if abs(self.graph.xmin) < self.max_seconds:
+            return self.n_points - int(
+                (self.max_seconds - abs(self.graph.xmin)) * self.num_samples_per_second
+            )
+        return self.n_points
 
-        y_min = min(global_y_min)
-        y_max = max(global_y_max)
+    def autoscale_plots(self):
+        n_visible = self.get_n_visible_points()
+        y_min = min(extrema.min(n_visible) for extrema in self.y_extrema)
+        y_max = max(extrema.max(n_visible) for extrema in self.y_extrema)
+        if self.history_range is not None:
+            y_min = min(y_min, self.history_range[0])
+            y_max = max(y_max, self.history_range[1])
         if y_min != y_max:
             min_val, max_val, major_ticks, minor_ticks = self.get_bounds_and_ticks(
                 y_min, y_max, 10
             )
+            # Small changes of the data do not move the axis, which would
+            # lay out the graph again
+            if (
+                self.graph.ymin <= y_min
+                and y_max <= self.graph.ymax
+                and max_val - min_val
+                >= AUTOSCALE_SHRINK_RATIO * (self.graph.ymax - self.graph.ymin)
+            ):
+                return
             self.graph.ymin = min_val
             self.graph.ymax = max_val
             self.graph.y_ticks_major = major_ticks
@@ -232,6 +390,11 @@ class GraphPanelItem(BoxLayout):
         )
         self.graph.x_ticks_major = major_ticks
         self.graph.x_ticks_minor = minor_ticks
+        if self.history is not None:
+            with self.points_lock:
+                self.refresh_history()
+                if self.autoscale:
+                    self.autoscale_plots()
 
     def on_data_sample_rate(self, instance, value):
         self.plot_settings.update_sample_rate(value)
@@ -240,42 +403,40 @@ class GraphPanelItem(BoxLayout):
         self.plot_settings.update_temperature_sample_rate(value)
 
     def update_plot(self, value, valid_data=True):
+        """
+        Add a sample to the plots. The plots are redrawn by render.
+        """
         if not isinstance(value, list):
             values = [value]
         else:
             values = value
-        for plot_index in range(self.n_plots):
-            self.temp_points[plot_index].append(values[plot_index])
-            if len(self.temp_points[plot_index]) == self.n_points_per_update:
-                for val in self.temp_points[plot_index]:
-                    self.y_points[plot_index].append(self.y_points[plot_index].pop(0))
-                    self.y_points[plot_index][-1] = val
-                self.temp_points[plot_index] = []
-                self.plots[plot_index].points = zip(
-                    self.x_points, self.y_points[plot_index]
-                )
-
-        if self.autoscale:
-            try:
-                self.autoscale_plots()
-            except:
-                loguru.logger.critical("Could not autoscale plots")
+        with self.points_lock:
+            self.history.append(values[: self.n_plots])
+            for plot_index in range(self.n_plots):
+                self.y_extrema[plot_index].append(values[plot_index])
+            self.n_new_points += 1
+
+    def render(self):
+        """
+        Redraw the plots with the samples added since the last call.
+        """
+        with self.points_lock:
+            n_appended = self.n_new_points
+            if n_appended == 0:
+                return
+            self.n_new_points = 0
+            self.refresh_plots(n_appended=n_appended)
+            self.refresh_history()
+            if self.autoscale:
+                try:
+                    self.autoscale_plots()
+                except:
+                    loguru.logger.critical("Could not autoscale plots")
 
     def on_num_samples_per_second(self, instance, value):
-        self.n_points = (
-            self.max_seconds * self.num_samples_per_second
-        )  # Number of points to plot
-        self.x_points = [x for x in range(-self.n_points, 0)]
-        self.time_between_points = (self.max_seconds) / float(self.n_points)
-        for j in range(self.n_points):
-            self.x_points[j] = -self.max_seconds + j * self.time_between_points
-        if self.num_samples_per_second < 30:
-            self.n_points_per_update = 1
-        else:
-            self.n_points_per_update = 10
-        for plot in range(self.n_plots):
-            self.y_points[plot] = [0 for y in range(-self.n_points, 0)]
-            self.plots[plot].points = zip(self.x_points, self.y_points[plot])
+        with self.points_lock:
+            self.init_points()
+            self.refresh_plots()
 
     def fexp(self, number):
         (sign, digits, exponent) = Decimal(number).as_tuple()
@@ -375,6 +536,32 @@ class VoltagePlot(GraphPanelItem):
         self.graph.y_ticks_major = 1
 
 
+class OverlayPlot(VoltagePlot):
+    """
+    All the traces in a single graph.
+
+    The traces, and their history, are drawn by one plot each, packing
+    the points of all the traces in one mesh, so that the cost of
+    drawing them does not grow with the number of channels.
+    """
+
+    def create_plots(self):
+        history_plot = MultiLinePlot(colors=self.color)
+        self.history_plots.append(history_plot)
+        self.graph.add_plot(history_plot)
+        plot = MultiLinePlot(colors=self.color)
+        self.plots.append(plot)
+        self.graph.add_plot(plot)
+
+    def refresh_plots(self, n_appended=None):
+        self.plots[0].set_data(
+            self.x_points, self.y_points.view().copy(), n_appended=n_appended
+        )
+
+    def draw_history(self, x, y):
+        self.history_plots[0].set_data(x, y)
+
+
 class PlotSettings(BoxLayout):
     seconds_spinner = ObjectProperty(None)
     autorange_cb = ObjectProperty(None)
@@ -0,0 +1,233 @@
+"""
+Multi-resolution history of the samples shown in the graphs.
+
+The last samples are kept at full resolution, while older ones are only
+kept as the minimum, maximum and mean of bins of increasing duration.
+Each tier is a ring buffer of fixed size, so that the memory used does
+not grow with the length of the session, and the history can be queried
+for any time range at a resolution suitable to draw it.
+"""
+import math
+
+import numpy as np
+
+from mip.widgets.buffers import RingBuffer
+
+# Duration in seconds and number of bins of each aggregate tier:
+# 1 hour at 1 s, 12 hours at 10 s and 48 hours at 60 s
+DEFAULT_TIERS = ((1, 3600), (10, 4320), (60, 2880))
+
+
+class AggregateTier:
+    """
+    Minimum, maximum and mean of the samples of several traces, in bins
+    of fixed duration.
+
+    Bins are filled with samples, or with the bins of a finer tier, and
+    once closed they are stored in ring buffers and passed on to the
+    next, coarser, tier.
+    """
+
+    def __init__(self, bin_seconds, n_bins, n_traces, next_tier=None):
+        self.bin_seconds = bin_seconds
+        self.n_bins = n_bins
+        self.n_traces = n_traces
+        self.next_tier = next_tier
+        self.times = RingBuffer(1, n_bins, fill_value=np.nan)
+        self.minimum = RingBuffer(n_traces, n_bins, fill_value=np.nan)
+        self.maximum = RingBuffer(n_traces, n_bins, fill_value=np.nan)
+        self.mean = RingBuffer(n_traces, n_bins, fill_value=np.nan)
+        self.n_closed_bins = 0
+        # Bin being filled
+        self.bin_index = None
+        self.bin_min = np.full(n_traces, np.inf)
+        self.bin_max = np.full(n_traces, -np.inf)
+        self.bin_sum = np.zeros(n_traces)
+        self.bin_count = 0
+
+    def add(self, t, minimum, maximum, total, count):
+        """
+        Add samples to the tier.
+
+        Args:
+            - t: time of the samples, in seconds
+            - minimum, maximum: extremes of the samples of each trace
+            - total: sum of the samples of each trace
+            - count: number of samples
+        """
+        bin_index = math.floor(t / self.bin_seconds)
+        if bin_index != self.bin_index:
+            if self.bin_index is not None:
+                self.close_bin()
+            self.bin_index = bin_index
+        np.minimum(self.bin_min, minimum, out=self.bin_min)
+        np.maximum(self.bin_max, maximum, out=self.bin_max)
+        self.bin_sum += total
+        self.bin_count += count
+
+    def close_bin(self):
+        bin_time = self.bin_index * self.bin_seconds
+        self.times.append([bin_time])
+        self.minimum.append(self.bin_min)
+        self.maximum.append(self.bin_max)
+        self.mean.append(self.bin_sum / self.bin_count)
+        self.n_closed_bins += 1
+        if self.next_tier is not None:
+            self.next_tier.add(
+                bin_time, self.bin_min, self.bin_max, self.bin_sum, self.bin_count
+            )
+        self.bin_min = np.full(self.n_traces, np.inf)
+        self.bin_max = np.full(self.n_traces, -np.inf)
+        self.bin_sum = np.zeros(self.n_traces)
+        self.bin_count = 0
+
+    def is_complete(self):
+        """
+        Return True if no bin was dropped from the tier yet.
+        """
+        return self.n_closed_bins <= self.n_bins
+
+    def start_time(self):
+        """
+        Return the start time of the oldest bin in the tier.
+        """
+        if self.n_closed_bins == 0:
+            if self.bin_index is None:
+                return math.inf
+            return self.bin_index * self.bin_seconds
+        n_stored = min(self.n_closed_bins, self.n_bins)
+        return float(self.times.view(0)[self.n_bins - n_stored])
+
+    def query(self, t_start, t_end, finer_tiers=()):
+        """
+        Return the bins overlapping a time range, including the ones
+        being filled.
+
+        Args:
+            - t_start, t_end: time range, in seconds
+            - finer_tiers: tiers feeding this one, whose bins being filled
+              hold samples not yet added to this tier
+
+        Returns:
+            - start times of the bins, with shape (n,)
+            - minimum, maximum and mean of the bins, with shape (n_traces, n)
+        """
+        n_stored = min(self.n_closed_bins, self.n_bins)
+        first = self.n_bins - n_stored
+        times = self.times.view(0)[first:]
+        start = np.searchsorted(times, t_start - self.bin_seconds, side="right")
+        end = np.searchsorted(times, t_end, side="right")
+        times = times[start:end]
+        minimum = self.minimum.view()[:, first + start : first + end]
+        maximum = self.maximum.view()[:, first + start : first + end]
+        mean = self.mean.view()[:, first + start : first + end]
+        # Merge the bins being filled into the bins of this tier
+        open_bins = {}
+        for tier in (self,) + tuple(finer_tiers):
+            if tier.bin_count == 0:
+                continue
+            index = math.floor(tier.bin_index * tier.bin_seconds / self.bin_seconds)
+            if index not in open_bins:
+                open_bins[index] = [np.inf, -np.inf, 0, 0]
+            open_bin = open_bins[index]
+            open_bin[0] = np.minimum(open_bin[0], tier.bin_min)
+            open_bin[1] = np.maximum(open_bin[1], tier.bin_max)
+            open_bin[2] = open_bin[2] + tier.bin_sum
+            open_bin[3] += tier.bin_count
+        for index in sorted(open_bins):
+            bin_time = index * self.bin_seconds
+            if t_start - self.bin_seconds < bin_time <= t_end:
+                bin_min, bin_max, bin_sum, bin_count = open_bins[index]
+                times = np.append(times, bin_time)
+                minimum = np.column_stack((minimum, bin_min))
+                maximum = np.column_stack((maximum, bin_max))
+                mean = np.column_stack((mean, bin_sum / bin_count))
+        return times, minimum, maximum, mean
+
+
+class SampleHistory:
+    """
+    Tiered in-memory history of the samples of several traces.
+
+    The recent tier holds the last samples at full resolution, in a
+    ring buffer that can be plotted directly. The aggregate tiers hold
+    the minimum, maximum and mean of bins of increasing duration, each
+    one filled with the closed bins of the previous one, so that only
+    the finest tier is updated on every sample.
+
+    Times are in seconds from the first sample, each sample being
+    1 / sample_rate seconds after the previous one.
+
+    Usage:
+
+    >>> history = SampleHistory(n_traces=1, recent_size=1800, sample_rate=10)
+    >>> history.append([value])
+    >>> # Last hour of data, with at most 1000 points
+    >>> times, minimum, maximum, mean = history.query(
+    ...     history.time - 3600, history.time, max_points=1000
+    ... )
+    """
+
+    def __init__(self, n_traces, recent_size, sample_rate, tiers=DEFAULT_TIERS):
+        self.n_traces = n_traces
+        self.tiers = []
+        next_tier = None
+        for bin_seconds, n_bins in reversed(tiers):
+            next_tier = AggregateTier(bin_seconds, n_bins, n_traces, next_tier)
+            self.tiers.insert(0, next_tier)
+        # Time of the next sample
+        self.time = 0.0
+        self.n_samples = 0
+        self.reset_recent(recent_size, sample_rate)
+
+    def reset_recent(self, recent_size, sample_rate):
+        """
+        Reset the recent tier, e.g. when the sample rate changes. The
+        aggregate tiers are kept.
+        """
+        self.recent = RingBuffer(self.n_traces, recent_size)
+        self.sample_rate = sample_rate
+        self.n_recent = 0
+        # Computed from the number of samples instead of being accumulated,
+        # so that rounding errors do not move samples to the wrong bins
+        self.recent_start_time = self.time
+
+    def append(self, values):
+        """
+        Append one sample to each trace.
+
+        Args:
+            - values: sequence with one value for each trace
+        """
+        values = np.asarray(values, dtype=float)
+        self.recent.append(values)
+        self.tiers[0].add(self.time, values, values, values, 1)
+        self.n_recent += 1
+        self.n_samples += 1
+        self.time = self.recent_start_time + self.n_recent / self.sample_rate
+
+    def query(self, t_start, t_end, max_points):
+        """
+        Return the samples in a time range, at the finest resolution
+        that holds t_start with at most max_points points.
+
+        Returns:
+            - times, with shape (n,)
+            - minimum, maximum and mean of the samples, with shape
+              (n_traces, n); at full resolution the three are the samples
+        """
+        n_recent = min(self.n_recent, self.recent.size)
+        if n_recent > 0 and (t_end - t_start) * self.sample_rate <= max_points:
+            times = self.time - np.arange(n_recent, 0, -1) / self.sample_rate
+            if t_start >= times[0] or self.n_recent == self.n_samples:
+                start = np.searchsorted(times, t_start)
+                end = np.searchsorted(times, t_end, side="right")
+                y = self.recent.view()[:, self.recent.size - n_recent :]
+                y = y[:, start:end]
+                return times[start:end], y, y, y
+        for i, tier in enumerate(self.tiers):
+            if (t_end - t_start) / tier.bin_seconds <= max_points and (
+                tier.is_complete() or tier.start_time() <= t_start
+            ):
+                return tier.query(t_start, t_end, self.tiers[:i])
+        return self.tiers[-1].query(t_start, t_end, self.tiers[:-1])
@@ -0,0 +1,108 @@
+"""
+Tests of the sessions of the data exporter.
+
+Run from the GUI folder with:
+
+>>> python -m pytest tests
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+import numpy as np
+import pytest
+
+from mip.communication.packets import DECODED_PACKET_DTYPE
+from mip.export import csv_exporter
+from mip.export.csv_exporter import CSVExporter
+
+
+class SessionClock(datetime):
+    """Clock moving one minute forward at each call, to name each session."""
+
+    start = datetime(2024, 1, 1, 12, 0, 0)
+    calls = 0
+
+    @classmethod
+    def now(cls, tz=None):
+        cls.calls += 1
+        return cls.start + timedelta(minutes=cls.calls)
+
+
+def packets(first_counter, n_packets):
+    block = np.zeros(n_packets, dtype=DECODED_PACKET_DTYPE)
+    block["packet_counter"] = first_counter + np.arange(n_packets)
+    block["resistance"] = 1.0
+    return block
+
+
+@pytest.fixture
+def exporter(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(csv_exporter, "datetime", SessionClock)
+    exporter = CSVExporter()
+    exporter.data_path = tmp_path
+    exporter.save_data = True
+    return exporter
+
+
+def read_csv_rows(file):
+    lines = file.read_text().splitlines()
+    return [line.split(",") for line in lines if not line.startswith("%")][1:]
+
+
+def test_late_batch_does_not_reach_next_session(exporter):
+    exporter.set_output_format(None, "csv")
+    exporter.measurement_stage = "Cleaning"
+    exporter.init_file()
+    first_file = exporter.file_name
+    exporter.add_packets(packets(0, 5))
+    exporter.close_file()
+
+    # A batch still in flight when the stream stopped, old enough to be
+    # written right away
+    exporter.last_flush_time = time.monotonic() - 2 * csv_exporter.FLUSH_INTERVAL
+    exporter.add_packets(packets(5, 3))
+    assert exporter.file is None
+
+    exporter.measurement_stage = "Measure"
+    exporter.init_file()
+    second_file = exporter.file_name
+    exporter.add_packets(packets(10, 4))
+    exporter.close_file()
+
+    assert second_file != first_file
+    first_rows = read_csv_rows(first_file)
+    second_rows = read_csv_rows(second_file)
+    assert [row[0] for row in first_rows] == ["0", "1", "2", "3", "4"]
+    assert [row[0] for row in second_rows] == ["10", "11", "12", "13"]
+    assert {row[-2] for row in second_rows} == {"Measure"}
+
+
+def test_parquet_session_never_truncates_a_file(exporter, monkeypatch):
+    pq = pytest.importorskip("pyarrow.parquet")
+    exporter.set_output_format(None, "parquet")
+    exporter.init_file()
+    first_file = exporter.file_name
+    exporter.add_packets(packets(0, 5))
+    exporter.close_file()
+
+    exporter.last_flush_time = (
+        time.monotonic() - 2 * csv_exporter.PARQUET_FLUSH_INTERVAL
+    )
+    exporter.add_packets(packets(5, 3))
+
+    # A new session named as the previous one, e.g. started in the same second
+    monkeypatch.setattr(SessionClock, "calls", SessionClock.calls - 1)
+    exporter.init_file()
+    exporter.add_packets(packets(10, 4))
+    exporter.close_file()
+
+    second_file = exporter.file_name
+    assert second_file != first_file
+    assert pq.read_table(first_file)["Packet_ID"].to_pylist() == [0, 1, 2, 3, 4]
+    assert pq.read_table(second_file)["Packet_ID"].to_pylist() == [10, 11, 12, 13]
@@ -0,0 +1,59 @@
+"""
+Tests of the dispatch of the decoded packets to the consumer workers.
+
+Run from the GUI folder with:
+
+>>> python -m pytest tests
+"""
+
+import os
+import threading
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+from mip.communication.dispatch import (
+    OVERFLOW_DROP_NEWEST,
+    OVERFLOW_DROP_OLDEST,
+    BatchQueue,
+    ConsumerWorker,
+)
+
+
+def test_worker_is_busy_until_the_last_batch_is_consumed():
+    worker = ConsumerWorker("TestWorker")
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_callback(packets):
+        started.set()
+        release.wait(5)
+
+    worker.batch_callbacks.append(slow_callback)
+    worker.push([1, 2, 3])
+    assert not worker.is_idle()
+    worker.start()
+    try:
+        assert started.wait(5)
+        # The batch has left the queue, but it is still being consumed
+        assert len(worker.queue) == 0
+        assert not worker.is_idle()
+        release.set()
+        for _ in range(500):
+            if worker.is_idle():
+                break
+            threading.Event().wait(0.01)
+        assert worker.is_idle()
+    finally:
+        worker.stop()
+
+
+def test_dropped_batches_are_not_waited_for():
+    for policy in (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST):
+        queue = BatchQueue(max_size=2, overflow_policy=policy)
+        for item in range(5):
+            queue.put(item)
+        assert queue.unfinished_tasks == 2
+        while queue.get(timeout=0) is not None:
+            queue.task_done()
+        assert queue.is_done()